@@ -0,0 +1,6 @@
+"""
+Performance benchmarks of PlantStation hot paths (see harness.py). Run offline with mock pins:
+
+    PYTHONPATH=src python -m benchmarks [--quick] [--save-baseline] [name ...]
+"""
+from . import bench_sched, bench_config, bench_pins, bench_plant
@@ -0,0 +1,50 @@
+import argparse
+import sys
+from pathlib import Path
+
+from . import harness
+
+BASELINE = Path(__file__).parent / 'baseline.json'
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='PlantStation benchmarks')
+    parser.add_argument('names', nargs='*', help='Benchmarks to run (name or group prefix, e.g. sched), default all')
+    parser.add_argument('--quick', default=False, action='store_true', help='Run the smaller problem sizes only')
+    parser.add_argument('--repeat', type=int, default=harness.DEFAULT_REPEAT, help='Repetitions, the best is kept')
+    parser.add_argument('--output', default=None, metavar='PATH', help='Save results as JSON')
+    parser.add_argument('--baseline', default=str(BASELINE), metavar='PATH', help='Baseline to compare with')
+    parser.add_argument('--tolerance', type=float, default=harness.DEFAULT_TOLERANCE,
+                        help='Allowed relative slowdown against the baseline')
+    parser.add_argument('--save-baseline', default=False, action='store_true',
+                        help='Store results as the new baseline instead of comparing')
+    parser.add_argument('--list', default=False, action='store_true', help='List benchmarks and quit')
+    args = parser.parse_args()
+
+    if args.list:
+        for bench in harness.BENCHMARKS.values():
+            print(f'{bench.name}: sizes {bench.sizes}, quick {bench.quick_sizes}')
+        return 0
+
+    def report(key, metrics):
+        print(f'{key:40} ' + '  '.join(f'{metric}={value:.3f}' for (metric, value) in sorted(metrics.items())),
+              flush=True)
+
+    results = harness.run(args.names, quick=args.quick, repeat=args.repeat, report=report)
+    if args.output:
+        harness.save(results, args.output)
+    if args.save_baseline:
+        harness.save(results, args.baseline)
+        print(f'Baseline saved to {args.baseline}')
+        return 0
+    if not Path(args.baseline).exists():
+        print(f'No baseline at {args.baseline}, nothing to compare', file=sys.stderr)
+        return 0
+    regressions = harness.compare(results, harness.load(args.baseline), args.tolerance)
+    for (key, metric, expected, value) in regressions:
+        print(f'REGRESSION {key} {metric}: {value:.3f} (baseline {expected:.3f})', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import tempfile
+from pathlib import Path
+
+from PlantStation.core import EnvironmentConfig
+from .harness import benchmark, per_op_us, Stopwatch
+
+PINS = [f'GPIO{pin}' for pin in range(4, 28)]
+
+
+def _fill(env_config: EnvironmentConfig, plants: int) -> None:
+    for i in range(plants):
+        env_config.cfg_parser[f'plant_{i}'] = {
+            'wateringDuration': str(5 + i % 30),
+            'wateringInterval': f'{1 + i % 7:02d}D {i % 24:02d}:00:00',
+            'lastTimeWatered': '',
+            'gpioPinNumber': PINS[i % len(PINS)],
+            'isActive': 'True',
+            'zone': f'zone_{i % 10}',
+        }
+
+
+@benchmark('config.write', sizes=(10, 1000, 10000), quick_sizes=(10, 1000))
+def write(plants: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        env_config = EnvironmentConfig('bench', path=Path(directory, 'bench.cfg'), dry_run=True)
+        _fill(env_config, plants)
+        with Stopwatch() as watch:
+            env_config.write()
+    return {'write_us': per_op_us(watch.seconds, plants)}
+
+
+@benchmark('config.parse_plants', sizes=(10, 1000, 10000), quick_sizes=(10, 1000))
+def parse_plants(plants: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory, 'bench.cfg')
+        env_config = EnvironmentConfig('bench', path=path, dry_run=True)
+        _fill(env_config, plants)
+        env_config.write()
+        env_config = EnvironmentConfig('bench', path=path, dry_run=True)
+        with Stopwatch() as read:
+            env_config.read()
+        with Stopwatch() as parse:
+            parsed = env_config.parse_plants()
+        assert len(parsed) == plants
+    return {'read_us': per_op_us(read.seconds, plants), 'parse_us': per_op_us(parse.seconds, plants)}
@@ -0,0 +1,31 @@
+import threading
+
+from PlantStation.core.ext import PinManager
+from .harness import benchmark, per_op_us, Stopwatch
+
+ACTIVE_LIMIT = 2
+CYCLES = 20000
+
+
+@benchmark('pins.acquire_release', sizes=(1, 4, 16), quick_sizes=(1, 4))
+def acquire_release(threads: int) -> dict:
+    """Pump lock acquire/release cycles of `threads` threads competing for ACTIVE_LIMIT pumps"""
+    manager = PinManager(active_limit=ACTIVE_LIMIT, dry_run=True)
+    start = threading.Barrier(threads + 1)
+    cycles = CYCLES // threads
+
+    def worker():
+        start.wait()
+        for _ in range(cycles):
+            manager.acquire_lock()
+            manager.release_lock()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    with Stopwatch() as watch:
+        start.wait()
+        for thread in workers:
+            thread.join()
+    manager.close()
+    return {'cycle_us': per_op_us(watch.seconds, cycles * threads)}
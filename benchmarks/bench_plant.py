@@ -0,0 +1,37 @@
+import datetime
+
+from PlantStation.core import EnvironmentConfig, Plant
+from .harness import benchmark, per_op_us, Stopwatch
+
+INTERVALS = [datetime.timedelta(hours=hours) for hours in (12, 24)]
+
+
+def _plant() -> Plant:
+    env_config = EnvironmentConfig('bench', dry_run=True)
+    return Plant(plantName='bench_plant', envConfig=env_config, gpioPinNumber='GPIO17',
+                 wateringDuration=datetime.timedelta(seconds=10), wateringInterval=INTERVALS[0])
+
+
+@benchmark('plant.get', sizes=(100000,))
+def getter(calls: int) -> dict:
+    plant = _plant()
+    try:
+        with Stopwatch() as watch:
+            for _ in range(calls):
+                plant.wateringInterval
+        return {'get_us': per_op_us(watch.seconds, calls)}
+    finally:
+        plant.close()
+
+
+@benchmark('plant.set', sizes=(2000,))
+def setter(calls: int) -> dict:
+    """Setter cost includes update of the plant's config section"""
+    plant = _plant()
+    try:
+        with Stopwatch() as watch:
+            for i in range(calls):
+                plant.wateringInterval = INTERVALS[i % 2]
+        return {'set_us': per_op_us(watch.seconds, calls)}
+    finally:
+        plant.close()
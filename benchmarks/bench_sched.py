@@ -0,0 +1,67 @@
+import datetime
+import itertools
+import threading
+import time
+
+from PlantStation.core.ext import MultithreadSched
+from .harness import benchmark, per_op_us, Stopwatch
+
+IDLE_SECONDS = 1.0
+
+
+def _noop():
+    pass
+
+
+@benchmark('sched.insert', sizes=(10000, 100000))
+def insert(events: int) -> dict:
+    scheduler = MultithreadSched()
+    now = datetime.datetime.now()
+    with Stopwatch() as watch:
+        for i in range(events):
+            scheduler.enterabs(now + datetime.timedelta(microseconds=i), _noop)
+    return {'insert_us': per_op_us(watch.seconds, events)}
+
+
+# every due event gets its own thread - 100k simultaneously due events exhaust threads of the process
+@benchmark('sched.dispatch', sizes=(1000, 10000))
+def dispatch(events: int) -> dict:
+    scheduler = MultithreadSched()
+    done = threading.Event()
+    counter = itertools.count(1)
+
+    def action():
+        if next(counter) == events:
+            done.set()
+
+    past = datetime.datetime.now() - datetime.timedelta(hours=1)
+    for i in range(events):
+        scheduler.enterabs(past + datetime.timedelta(microseconds=i), action)
+    runner = threading.Thread(target=scheduler.run)
+    with Stopwatch() as watch:
+        runner.start()
+        while not done.wait(1.0):
+            if not runner.is_alive():
+                raise RuntimeError('Scheduler stopped before dispatching all events')
+    scheduler.stop()
+    runner.join()
+    return {'dispatch_us': per_op_us(watch.seconds, events)}
+
+
+@benchmark('sched.idle', sizes=(10, 1000))
+def idle(events: int) -> dict:
+    """CPU used by a scheduler waiting for events planned far ahead"""
+    scheduler = MultithreadSched()
+    later = datetime.datetime.now() + datetime.timedelta(hours=1)
+    for i in range(events):
+        scheduler.enterabs(later + datetime.timedelta(seconds=i), _noop)
+    runner = threading.Thread(target=scheduler.run)
+    runner.start()
+    # let the scheduler settle
+    time.sleep(0.1)
+    cpu = time.process_time()
+    time.sleep(IDLE_SECONDS)
+    cpu = time.process_time() - cpu
+    scheduler.stop()
+    runner.join()
+    return {'idle_cpu_pct': 100 * cpu / IDLE_SECONDS}
@@ -0,0 +1,124 @@
+"""
+Benchmark registry, runner and baseline comparison.
+
+Every benchmark is a function of the problem size returning {metric: value}. All metrics are
+"lower is better" (time per operation in microseconds - suffix _us, CPU usage in percent - suffix
+_pct); every benchmark is repeated and the best value of every metric is kept.
+"""
+import json
+import platform
+import time
+
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.5
+# absolute slack added to the relative tolerance, by metric suffix - keeps near-zero metrics
+# (e.g. idle CPU) from failing on noise
+NOISE_FLOOR = {'_us': 0.05, '_pct': 1.0}
+
+BENCHMARKS = {}
+
+
+class Benchmark(object):
+    __slots__ = ('name', 'func', 'sizes', 'quick_sizes')
+
+    def __init__(self, name: str, func, sizes: (int,), quick_sizes: (int,)):
+        self.name = name
+        self.func = func
+        self.sizes = tuple(sizes)
+        self.quick_sizes = tuple(quick_sizes)
+
+    def key(self, size) -> str:
+        return f'{self.name}[{size}]'
+
+
+def benchmark(name: str, sizes: (int,), quick_sizes: (int,) = None):
+    """
+    Registers benchmark function (size -> {metric: value}). Quick run uses `quick_sizes`,
+    the smallest size by default
+    """
+
+    def decorator(func):
+        BENCHMARKS[name] = Benchmark(name, func, sizes, quick_sizes or sizes[:1])
+        return func
+
+    return decorator
+
+
+def per_op_us(seconds: float, operations: int) -> float:
+    return seconds * 1e6 / operations
+
+
+class Stopwatch(object):
+    """Context manager measuring wall time (perf_counter) of the block"""
+    __slots__ = ('_begin', 'seconds')
+
+    def __enter__(self):
+        self._begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._begin
+
+
+def run(names: [str] = None, quick: bool = False, repeat: int = DEFAULT_REPEAT, report=None) -> dict:
+    """
+    Runs benchmarks (all if names aren't given, name prefixes match too)
+
+    Returns:
+        dict: results document ({'machine': ..., 'results': {key: {metric: value}}})
+    """
+    selected = [bench for bench in BENCHMARKS.values()
+                if not names or any(bench.name == name or bench.name.startswith(name + '.') for name in names)]
+    results = {}
+    for bench in selected:
+        for size in bench.quick_sizes if quick else bench.sizes:
+            best = {}
+            for _ in range(repeat):
+                for (metric, value) in bench.func(size).items():
+                    best[metric] = min(value, best.get(metric, value))
+            results[bench.key(size)] = best
+            if report is not None:
+                report(bench.key(size), best)
+    return {
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def _noise_floor(metric: str) -> float:
+    for (suffix, floor) in NOISE_FLOOR.items():
+        if metric.endswith(suffix):
+            return floor
+    return 0.0
+
+
+def compare(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> [(str, str, float, float)]:
+    """
+    Finds regressions - metrics worse than baseline * (1 + tolerance) plus the metric's noise floor.
+    Benchmarks missing in either document are skipped
+
+    Returns:
+        [(key, metric, baseline value, value)]
+    """
+    regressions = []
+    for (key, metrics) in results['results'].items():
+        expected = baseline['results'].get(key, {})
+        for (metric, value) in metrics.items():
+            if metric not in expected:
+                continue
+            if value > expected[metric] * (1 + tolerance) + _noise_floor(metric):
+                regressions.append((key, metric, expected[metric], value))
+    return regressions
+
+
+def load(path) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def save(document: dict, path) -> None:
+    with open(path, 'w') as file:
+        json.dump(document, file, indent=2, sort_keys=True)
+        file.write('\n')
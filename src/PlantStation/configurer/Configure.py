@@ -136,7 +136,7 @@ class EnvironmentCreator(object):
             },
             {
                 'type': 'input',
-                'message': 'Enter interval between waterings (example: 10D 10:10:10):',
+                'message': 'Enter interval between waterings (example: 10D 10:10:10 or cron: 30 6 * * mon,wed,fri):',
                 'name': 'wateringInterval',
                 'validate': lambda t: does_throw(parse_time, [t])
             }
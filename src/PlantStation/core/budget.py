@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from .ext import clock
+from .ext.sliding_window import SlidingWindowCounter
+
+BUDGET_WINDOW = 24 * 3600
+# charges within this many seconds are saved to the state file together
+BUDGET_SAVE_INTERVAL = 5.0
+BUDGET_BUCKETS = 24
+# config option -> budget kind
+BUDGET_OPTIONS = {
+    'maxRunsPerDay': 'runs',
+    'maxSecondsPerDay': 'seconds',
+    'maxLitresPerDay': 'litres',
+}
+
+
+class WaterBudget(object):
+    """
+    Daily limits of waterings: number of runs, pumping seconds and litres in the last 24 hours
+
+    Every limit is tracked with a sliding window counter (constant memory, O(1) check).
+    Watering is charged with its planned duration and volume when it's allowed, so concurrent
+    waterings can't overdraw the budget. Rejections are counted per limit in `hits`.
+    """
+    limits: {str: float}
+    hits: {str: int}
+    _counters: {str: SlidingWindowCounter}
+
+    def __init__(self, runs: float = None, seconds: float = None, litres: float = None):
+        """
+        Args:
+            runs (float): max waterings per day
+            seconds (float): max pumping seconds per day
+            litres (float): max litres per day
+        """
+        self.limits = {kind: limit for (kind, limit) in
+                       (('runs', runs), ('seconds', seconds), ('litres', litres)) if limit is not None}
+        if any(limit <= 0 for limit in self.limits.values()):
+            raise ValueError('Budget limits have to be positive')
+        self._counters = {kind: SlidingWindowCounter(BUDGET_WINDOW, BUDGET_BUCKETS) for kind in self.limits}
+        self.hits = {kind: 0 for kind in self.limits}
+
+    def __bool__(self):
+        return bool(self.limits)
+
+    def __str__(self):
+        return ', '.join(f'{kind} {limit:g}' for (kind, limit) in self.limits.items())
+
+    @staticmethod
+    def _amounts(duration: float, volume: float or None) -> {str: float}:
+        return {'runs': 1.0, 'seconds': duration, 'litres': volume / 1000 if volume is not None else 0.0}
+
+    def exceeded(self, duration: float, volume: float or None, now: float = None) -> str or None:
+        """
+        Checks watering against the limits (without charging it)
+
+        Args:
+            duration (float): planned pumping seconds
+            volume (float): planned volume in ml, None if unknown (litres limit is then not checked)
+            now (float): seconds since epoch
+
+        Returns:
+            str: first exceeded limit (runs, seconds or litres), None if the watering fits
+        """
+        if now is None:
+            now = clock.time()
+        amounts = self._amounts(duration, volume)
+        for (kind, limit) in self.limits.items():
+            if self._counters[kind].total(now) + amounts[kind] > limit:
+                self.hits[kind] += 1
+                return kind
+        return None
+
+    def charge(self, duration: float, volume: float or None, now: float = None) -> None:
+        """Adds watering to the counters"""
+        if now is None:
+            now = clock.time()
+        amounts = self._amounts(duration, volume)
+        for (kind, counter) in self._counters.items():
+            counter.add(amounts[kind], now)
+
+    def used(self, now: float = None) -> {str: float}:
+        """Amounts used in the last 24 hours"""
+        if now is None:
+            now = clock.time()
+        return {kind: counter.total(now) for (kind, counter) in self._counters.items()}
+
+    def state(self) -> dict:
+        """Counters and hits of every limit, see :meth: restore"""
+        return {kind: {'counter': counter.state(), 'hits': self.hits[kind]} for (kind, counter) in self._counters.items()}
+
+    def restore(self, state: dict) -> None:
+        """Takes over counters and hits of limits present in `state` (saved budget or previous limits)"""
+        for (kind, counter) in self._counters.items():
+            if kind in state:
+                counter.restore(state[kind]['counter'])
+                self.hits[kind] = int(state[kind]['hits'])
+
+
+class BudgetGuard(object):
+    """
+    Checks plant's and environment's budgets together, so a watering is either charged to both
+    or to none of them
+
+    With a state file, counters are restored on start and saved by a background writer at most
+    BUDGET_SAVE_INTERVAL seconds after a charge (and on close()), so restarts - even a crash loop -
+    don't reset the daily budgets while allow() never waits for the disk
+    """
+    _path: Path = None
+    _saved: dict = None
+    _writer: threading.Thread = None
+    _dirty = False
+
+    def __init__(self, environment_budget: WaterBudget = None, plant_budgets: {str: WaterBudget} = None,
+                 path: Path = None):
+        """
+        Args:
+            environment_budget (WaterBudget): limits of the whole environment
+            plant_budgets ({str: WaterBudget}): limits of plants
+            path (Path): state file, None to keep the counters in memory only
+        """
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger('PlantStation').getChild('Budget')
+        self.environment_budget = WaterBudget()
+        self.plant_budgets = {}
+        if path is not None:
+            self._path = Path(path)
+            self._saved = self._load()
+            self._save_lock = threading.Lock()
+            self._wake = threading.Event()
+            self._closing = threading.Event()
+        self.configure(environment_budget or WaterBudget(), plant_budgets or {})
+
+    def __bool__(self):
+        return bool(self.environment_budget) or any(self.plant_budgets.values())
+
+    def _state(self) -> dict:
+        return {'environment': self.environment_budget.state(),
+                'plants': {name: budget.state() for (name, budget) in self.plant_budgets.items()}}
+
+    def _load(self) -> dict or None:
+        try:
+            with open(self._path) as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            self._logger.error('Couldn\'t read budget state %s: %s', self._path, err)
+            return None
+
+    def flush(self) -> None:
+        """Saves the counters to the state file if they changed since the last save"""
+        if self._path is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                state = self._state()
+                self._dirty = False
+            temporary = self._path.with_name(self._path.name + '.tmp')
+            try:
+                with open(temporary, 'w') as state_file:
+                    json.dump(state, state_file)
+                os.replace(temporary, self._path)
+            except OSError as err:
+                self._logger.error('Couldn\'t save budget state %s: %s', self._path, err)
+
+    def _write_loop(self) -> None:
+        while not self._closing.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            # further charges of the interval are saved by the same write
+            self._closing.wait(BUDGET_SAVE_INTERVAL)
+            self.flush()
+
+    def close(self) -> None:
+        """Stops the background writer, pending charges are saved"""
+        if self._path is None:
+            return
+        self._closing.set()
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join()
+        self.flush()
+
+    def configure(self, environment_budget: WaterBudget, plant_budgets: {str: WaterBudget}) -> None:
+        """
+        Replaces limits (e.g. after config change). Usage of limits which are kept is carried over,
+        on the first call it's taken from the state file
+        """
+        with self._lock:
+            previous = self._saved if self._saved is not None else self._state()
+            self._saved = None
+            environment_budget.restore(previous.get('environment', {}))
+            for (name, budget) in plant_budgets.items():
+                budget.restore(previous.get('plants', {}).get(name, {}))
+            self.environment_budget = environment_budget
+            self.plant_budgets = plant_budgets
+
+    def allow(self, plant_name: str, duration: float, volume: float or None, now: float = None) -> str or None:
+        """
+        Charges watering if it fits all budgets
+
+        Returns:
+            str: None if allowed, otherwise description of exceeded limit
+        """
+        if now is None:
+            now = clock.time()
+        budgets = [('plant', self.plant_budgets.get(plant_name)), ('environment', self.environment_budget)]
+        budgets = [(owner, budget) for (owner, budget) in budgets if budget]
+        with self._lock:
+            for (owner, budget) in budgets:
+                kind = budget.exceeded(duration, volume, now)
+                if kind is not None:
+                    return f'{owner} {kind}'
+            for (_, budget) in budgets:
+                budget.charge(duration, volume, now)
+            if self._path is not None:
+                self._dirty = True
+                if self._closing.is_set():
+                    return None
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name='PlantStation-Budget',
+                                                    daemon=True)
+                    self._writer.start()
+                self._wake.set()
+        return None
@@ -1,14 +1,76 @@
+import atexit
 import configparser
 import datetime
 import logging
+import queue
 import shutil
+from logging.handlers import QueueListener
 from pathlib import Path
-from threading import RLock
+from threading import RLock, Lock
 
 from . import parse_time
-from .ext import PinManager
+from .ext import PinManager, recording
+from .ext.blackout import BlackoutCalendar
+from .ext.logs import DroppingQueueHandler, RateLimitFilter, DEFAULT_LOG_RATE, DEFAULT_LOG_BURST, \
+    DEFAULT_LOG_QUEUE_SIZE
+from .ext.metrics import Histogram
+from .ext.tracing import traced
+from .ext.pin_backends import DEFAULT_BACKEND
+from .budget import WaterBudget, BUDGET_OPTIONS
+from .flow import FlowCalibration
+from .policies import DEFAULT_CATCH_UP_WINDOW, DEFAULT_CATCH_UP_RATE, DEFAULT_SATURATION_POLICY, DEFAULT_PRIORITY
+from .tuning import DEFAULT_DRY_LEVEL, DEFAULT_WET_LEVEL, DEFAULT_MAX_CHANGE
+from .sensors import DEFAULT_SENSOR_PERIOD, DEFAULT_SENSOR_HISTORY, DEFAULT_SENSOR_DECIMATION, \
+    DEFAULT_SENSOR_SMOOTHING, DEFAULT_MOISTURE_HYSTERESIS, DEFAULT_WATERING_SPACING
 
 DEFAULT_ACTIVE_LIMIT = 1
+DEFAULT_TUNING_TIME = datetime.time(3, 0)
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_log_handler: logging.Handler = None
+_log_listener: QueueListener = None
+_log_handler_lock = Lock()
+
+CONFIG_WRITE_DURATION = Histogram('plantstation_config_write_seconds', 'Time spent writing config files')
+
+
+def setup_logging(rate: float = DEFAULT_LOG_RATE, burst: int = DEFAULT_LOG_BURST) -> logging.Logger:
+    """
+        Attaches queue handler to the program's logger. The handler is created once per process,
+        loggers of all environments propagate to it. Records are written to console by a listener
+        thread, so logging never blocks watering threads; repeated messages are rate limited
+
+    Args:
+        rate (float): repeated messages passed per second (per message template)
+        burst (int): repeated messages passed at once
+    """
+    global _log_handler, _log_listener
+    logger = logging.getLogger('PlantStation')
+    with _log_handler_lock:
+        if _log_handler is None:
+            console = logging.StreamHandler()
+            console.setFormatter(logging.Formatter(LOG_FORMAT))
+            records = queue.Queue(DEFAULT_LOG_QUEUE_SIZE)
+            _log_listener = QueueListener(records, console, respect_handler_level=True)
+            _log_listener.start()
+            _log_handler = DroppingQueueHandler(records)
+            _log_handler.addFilter(RateLimitFilter(rate, burst))
+            logger.addHandler(_log_handler)
+            atexit.register(shutdown_logging)
+    return logger
+
+
+def shutdown_logging() -> None:
+    """
+        Writes out queued records and detaches the handler installed by setup_logging()
+    """
+    global _log_handler, _log_listener
+    with _log_handler_lock:
+        if _log_handler is None:
+            return
+        logging.getLogger('PlantStation').removeHandler(_log_handler)
+        _log_listener.stop()
+        _log_handler = _log_listener = None
 
 
 class Config(object):
@@ -20,6 +82,7 @@ class Config(object):
     _cfg_parser : configparser.RawConfigParser
     _cfg_lock : RLock
     _logger: logging.Logger
+    _generation = 0
 
     def __init__(self, logger: logging.Logger, path: Path, dry_run=False):
         """
@@ -49,6 +112,27 @@ class Config(object):
     def __setitem__(self, key, value):
         with self._cfg_lock:
             self._cfg_parser[key] = value
+            self._generation += 1
+
+    def set_option(self, section: str, option: str, value: str) -> None:
+        """
+            Sets option (creating the section if needed). Thread safe
+        """
+        with self._cfg_lock:
+            if not self._cfg_parser.has_section(section):
+                self._cfg_parser[section] = {}
+            self._cfg_parser[section][option] = value
+            self._generation += 1
+
+    @property
+    def generation(self) -> int:
+        """
+            Counter of config changes made through the config's setters or by reading the file.
+            Options of plant sections written by plants (see update_plant_section) don't change it,
+            neither do direct writes to cfg_parser
+        """
+        with self._cfg_lock:
+            return self._generation
 
     @property
     def cfg_parser(self):
@@ -69,7 +153,7 @@ class Config(object):
         """
         with self._cfg_lock:
             if not self._path:
-                self.logger.critical(f'Config path was not set')
+                self.logger.critical('Config path was not set')
                 raise ValueError(f'Config path is not set')
             else:
                 return self._path
@@ -95,26 +179,28 @@ class Config(object):
         """
         with self._cfg_lock:
             if not self._cfg_parser.read(self.path):
-                self.logger.critical(f'Config file {self.path} not found')
+                self.logger.critical('Config file %s not found', self.path)
                 raise FileNotFoundError(f'Error: environment config file not found. Quitting!')
             else:
-                self.logger.info(f'Config file {self._path} read succesfully!')
+                self._generation += 1
+                self.logger.info('Config file %s read succesfully!', self._path)
 
+    @traced('Config.write', 'config')
     def write(self) -> None:
         """
             Writes config to file. Thread safe
         """
-        with self._cfg_lock:
+        with self._cfg_lock, CONFIG_WRITE_DURATION.time():
             try:
                 cfg_file = open(self.path, 'w')
                 self._cfg_parser.write(cfg_file)
-                self.logger.info(f'Created config file in {self._path}')
+                self.logger.info('Created config file in %s', self._path)
             except FileNotFoundError or IsADirectoryError as exc:
-                self.logger.warning(f'Couldn\'t create file in given directory.')
+                self.logger.warning('Couldn\'t create file in given directory.')
                 raise exc
             except PermissionError as exc:
-                self.logger.error(
-                    f'Couldn\'t create file in given directory. No permissions to create file in {self._path}')
+                self.logger.error('Couldn\'t create file in given directory. No permissions to create file in %s',
+                                  self._path)
                 raise exc
 
 
@@ -127,8 +213,9 @@ class EnvironmentConfig(Config):
     _env_name: str
     debug: bool
     pin_manager: PinManager
+    shared_pins = False
 
-    def __init__(self, env_name: str, path=None, debug=False, dry_run: bool = False):
+    def __init__(self, env_name: str, path=None, debug=False, dry_run: bool = False, pin_manager: PinManager = None):
         """
         Default constructor. Uses program's logger
 
@@ -141,6 +228,9 @@ class EnvironmentConfig(Config):
             print extra debug information
         dry_run : bool = False
             should pins be mocked?
+        pin_manager : PinManager = None
+            manager shared with other environments, the environment's active limit is then
+            applied to its own limit group
         """
         # set env vars
         self.env_name = env_name
@@ -148,11 +238,7 @@ class EnvironmentConfig(Config):
         self.dry_run = dry_run
 
         # create global logger
-        logger = logging.getLogger('PlantStation').getChild(self.env_name)
-        Formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        channel = logging.StreamHandler()
-        channel.setFormatter(Formatter)
-        logger.addHandler(channel)
+        logger = setup_logging().getChild(self.env_name)
         logger.setLevel(logging.DEBUG if debug else logging.INFO)
 
         # initialize config
@@ -162,7 +248,15 @@ class EnvironmentConfig(Config):
                 'env_name': self.env_name
             }
         # initialize pins
-        self.pin_manager = PinManager(dry_run=dry_run)
+        if pin_manager is not None:
+            self.pin_manager = pin_manager
+            self.shared_pins = True
+        else:
+            self.pin_manager = PinManager(dry_run=dry_run)
+
+    def write(self) -> None:
+        super().write()
+        recording.record(recording.CONFIG_WRITE, self.env_name)
 
     @property
     def silent_hours(self):
@@ -174,26 +268,48 @@ class EnvironmentConfig(Config):
             else:
                 return None
         except KeyError as exc:
-            self.logger.error(f'Silent hours not given!')
+            self.logger.error('Silent hours not given!')
             raise exc
         except ValueError as exc:
-            self.logger.fatal(f'Silent hours in wrong format {exc}!')
+            self.logger.fatal('Silent hours in wrong format %s!', exc)
             raise exc
 
+    def blackout_windows(self, zone: str = '', plant_name: str = None) -> BlackoutCalendar:
+        """
+        Compiles blackout windows applying to the plant: environment's (blackout option and
+        silent hours), zone's (blackout.<zone> option in GLOBAL) and plant's (blackout option)
+
+        Parameters
+        ----------
+        zone : str
+            zone name
+        plant_name : str
+            plant section, None for environment and zone windows only
+        """
+        with self._cfg_lock:
+            windows = [self._global_option('blackout', str, '')]
+            if zone:
+                windows.append(self._global_option(f'blackout.{zone}', str, ''))
+            if plant_name is not None and self.cfg_parser.has_section(plant_name):
+                windows.append(self.cfg_parser[plant_name].get('blackout', ''))
+            calendar = BlackoutCalendar(', '.join(filter(None, windows)))
+            if self._global_option('workingHours', str, 'False') == 'True':
+                (end, begin) = self.silent_hours
+                calendar = calendar | BlackoutCalendar.from_working_hours(begin, end)
+            return calendar
+
     def disable_silent_hours(self):
         with self._cfg_lock:
-            self.logger.info(f'Disabled silent hours')
-            self.cfg_parser['GLOBAL']['workingHours'] = str(False)
+            self.logger.info('Disabled silent hours')
+            self.set_option('GLOBAL', 'workingHours', str(False))
 
     @silent_hours.setter
     def silent_hours(self, value: (datetime.time, datetime.time)):
         value = list(map(lambda t: t.strftime('%H:%M'), value))
         with self._cfg_lock:
-            if 'GLOBAL' not in self.cfg_parser:
-                self.cfg_parser['GLOBAL'] = {}
-            self.cfg_parser['GLOBAL']['workingHours'] = str(True)
-            self.cfg_parser['GLOBAL']['workingHoursBegin'] = value[1]
-            self.cfg_parser['GLOBAL']['workingHoursEnd'] = value[0]
+            self.set_option('GLOBAL', 'workingHours', str(True))
+            self.set_option('GLOBAL', 'workingHoursBegin', value[1])
+            self.set_option('GLOBAL', 'workingHoursEnd', value[0])
 
     @property
     def active_limit(self):
@@ -204,9 +320,226 @@ class EnvironmentConfig(Config):
 
     @active_limit.setter
     def active_limit(self, value: int):
-        self.pin_manager.active_limit = value
+        self._apply_active_limit(value)
         self.cfg_parser['GLOBAL']['ActiveLimit'] = str(value)
-        self.logger.debug(f'Active limit set to {value}')
+        self.logger.debug('Active limit set to %s', value)
+
+    def _apply_active_limit(self, value: int) -> None:
+        if self.shared_pins:
+            self.pin_manager.set_group_limit(self.env_name, value)
+        else:
+            self.pin_manager.active_limit = value
+
+    @property
+    def pin_backend(self) -> str:
+        """
+        Pin factory backend (pinFactory option), either registered name or 'module:Class'
+        """
+        try:
+            return self.cfg_parser['GLOBAL']['pinFactory']
+        except KeyError:
+            return DEFAULT_BACKEND
+
+    @pin_backend.setter
+    def pin_backend(self, value: str):
+        with self._cfg_lock:
+            self.cfg_parser['GLOBAL']['pinFactory'] = value
+        self.logger.debug('Pin factory set to %s', value)
+
+    @property
+    def pin_worker(self) -> bool:
+        """
+        Should pin IO be delegated to a worker process (pinWorker option)?
+        """
+        try:
+            return self.cfg_parser['GLOBAL']['pinWorker'] == 'True'
+        except KeyError:
+            return False
+
+    @property
+    def pin_worker_safety_timeout(self):
+        """
+        Max time (in seconds) pin may stay active in worker mode (pinWorkerSafetyTimeout option)
+        """
+        try:
+            return float(self.cfg_parser['GLOBAL']['pinWorkerSafetyTimeout'])
+        except KeyError:
+            return None
+
+    def _global_option(self, option: str, convert, default):
+        try:
+            return convert(self.cfg_parser['GLOBAL'][option])
+        except KeyError:
+            return default
+
+    @property
+    def sensor_settings(self) -> dict:
+        """
+        Moisture sampling settings: sensorPeriod (seconds), sensorHistory (stored samples per plant),
+        sensorDecimation (ticks averaged into one stored sample), sensorSmoothing (moving average weight)
+        """
+        return {
+            'period': self._global_option('sensorPeriod', float, DEFAULT_SENSOR_PERIOD),
+            'history': self._global_option('sensorHistory', int, DEFAULT_SENSOR_HISTORY),
+            'decimation': self._global_option('sensorDecimation', int, DEFAULT_SENSOR_DECIMATION),
+            'smoothing': self._global_option('sensorSmoothing', float, DEFAULT_SENSOR_SMOOTHING),
+        }
+
+    @property
+    def tuning_settings(self) -> dict:
+        """
+        Interval tuning settings: tuning (off, propose or apply), tuningTime (daily refit, HH:MM),
+        tuningDryLevel, tuningWetLevel (moisture levels), tuningMaxChange (max change factor per refit)
+        """
+        return {
+            'mode': self._global_option('tuning', str, 'off'),
+            'time': self._global_option('tuningTime', datetime.time.fromisoformat, DEFAULT_TUNING_TIME),
+            'dry_level': self._global_option('tuningDryLevel', float, DEFAULT_DRY_LEVEL),
+            'wet_level': self._global_option('tuningWetLevel', float, DEFAULT_WET_LEVEL),
+            'max_change': self._global_option('tuningMaxChange', float, DEFAULT_MAX_CHANGE),
+        }
+
+    @property
+    def catch_up_settings(self) -> dict:
+        """
+        Startup catch-up settings: catchUpWindow (seconds overdue waterings are spread over),
+        catchUpRate (max catch-up waterings started per minute, 0 for no limit)
+        """
+        return {
+            'window': datetime.timedelta(seconds=self._global_option('catchUpWindow', float, DEFAULT_CATCH_UP_WINDOW)),
+            'rate': self._global_option('catchUpRate', int, DEFAULT_CATCH_UP_RATE),
+        }
+
+    @property
+    def saturation_policy(self) -> str:
+        """
+        Load shedding once watering demand exceeds pump capacity (saturationPolicy option):
+        merge, shorten or defer
+        """
+        return self._global_option('saturationPolicy', str, DEFAULT_SATURATION_POLICY)
+
+    def parse_priorities(self) -> {str: int}:
+        """
+        Reads plants' priorities (priority option, higher is more important) used when load is shed
+
+        Returns
+        -------
+        dict plant name -> priority
+        """
+        priorities = {}
+        with self._cfg_lock:
+            for section in self.list_plants():
+                try:
+                    priorities[section] = int(self._cfg_parser[section].get('priority', DEFAULT_PRIORITY))
+                except ValueError as err:
+                    self.logger.error('%s: wrong priority %s', section, err)
+                    priorities[section] = DEFAULT_PRIORITY
+        return priorities
+
+    @staticmethod
+    def _budget_of(options) -> WaterBudget:
+        return WaterBudget(**{kind: float(options[option]) for (option, kind) in BUDGET_OPTIONS.items()
+                              if options.get(option, '') != ''})
+
+    @property
+    def environment_budget(self) -> WaterBudget:
+        """
+        Daily budget of the whole environment (maxRunsPerDay, maxSecondsPerDay, maxLitresPerDay in GLOBAL)
+        """
+        with self._cfg_lock:
+            if not self._cfg_parser.has_section('GLOBAL'):
+                return WaterBudget()
+            try:
+                return self._budget_of(self._cfg_parser['GLOBAL'])
+            except ValueError as err:
+                self.logger.error('Wrong environment budget %s', err)
+                raise err
+
+    @property
+    def budget_state_path(self) -> Path or None:
+        """
+        File keeping budget usage across restarts (<config name>.budget.json next to the config),
+        None if the config has no file
+        """
+        with self._cfg_lock:
+            return self._path.with_suffix('.budget.json') if self._path else None
+
+    @property
+    def journal_path(self) -> Path or None:
+        """
+        File keeping recent waterings for tuning (<config name>.journal.json next to the config),
+        None if the config has no file
+        """
+        with self._cfg_lock:
+            return self._path.with_suffix('.journal.json') if self._path else None
+
+    def parse_budgets(self) -> {str: WaterBudget}:
+        """
+        Reads plants' daily budgets (maxRunsPerDay, maxSecondsPerDay, maxLitresPerDay options)
+
+        Returns
+        -------
+        dict plant name -> budget (plants without limits are skipped)
+        """
+        budgets = {}
+        with self._cfg_lock:
+            for section in self.list_plants():
+                try:
+                    budget = self._budget_of(self._cfg_parser[section])
+                except ValueError as err:
+                    self.logger.error('%s: wrong budget %s', section, err)
+                    continue
+                if budget:
+                    budgets[section] = budget
+        return budgets
+
+    def parse_sensors(self) -> {str: (int, int)}:
+        """
+        Reads moisture sensors of plants (sensorChannel and optional sensorDevice options)
+
+        Returns
+        -------
+        dict plant name -> (SPI chip select, ADC channel)
+        """
+        sensors = {}
+        with self._cfg_lock:
+            for section in self.list_plants():
+                options = self._cfg_parser[section]
+                if options.get('sensorChannel', '') == '':
+                    continue
+                try:
+                    sensors[section] = (int(options.get('sensorDevice', '0')), int(options['sensorChannel']))
+                except ValueError as err:
+                    self.logger.error('%s: wrong sensor setup %s', section, err)
+        return sensors
+
+    def parse_moisture_thresholds(self) -> {str: (float, float, datetime.timedelta)}:
+        """
+        Reads moisture-threshold watering setup of plants (moistureThreshold and optional
+        moistureHysteresis, minWateringSpacing options)
+
+        Returns
+        -------
+        dict plant name -> (threshold, hysteresis, min spacing between waterings)
+        """
+        thresholds = {}
+        with self._cfg_lock:
+            for section in self.list_plants():
+                options = self._cfg_parser[section]
+                if options.get('moistureThreshold', '') == '':
+                    continue
+                try:
+                    spacing = parse_time(options['minWateringSpacing']) if options.get('minWateringSpacing', '') \
+                        else DEFAULT_WATERING_SPACING
+                    if not isinstance(spacing, datetime.timedelta):
+                        raise ValueError('minWateringSpacing must be a time span')
+                    thresholds[section] = (
+                        float(options['moistureThreshold']),
+                        float(options.get('moistureHysteresis', DEFAULT_MOISTURE_HYSTERESIS)),
+                        spacing)
+                except ValueError as err:
+                    self.logger.error('%s: wrong moisture threshold setup %s', section, err)
+        return thresholds
 
     def list_plants(self) -> [str]:
         """
@@ -221,7 +554,9 @@ class EnvironmentConfig(Config):
         section = dir(plant)
 
         with self._cfg_lock:
-            self.cfg_parser[plant.plantName] = {}
+            # keep options not handled by Plant (e.g. sensor setup)
+            if not self.cfg_parser.has_section(plant.plantName):
+                self.cfg_parser[plant.plantName] = {}
 
             for key in section:
                 self.cfg_parser[plant.plantName][key] = str(getattr(plant, key))
@@ -252,26 +587,36 @@ class EnvironmentConfig(Config):
                             seconds=float(self._cfg_parser[section]['wateringDuration'])),
                         'wateringInterval': parse_time(self._cfg_parser[section]['wateringInterval']),
                         'gpioPinNumber': str(self._cfg_parser[section]['gpioPinNumber']),
-                        'isActive': bool(self._cfg_parser[section]['isActive'])}
+                        'isActive': self._cfg_parser[section]['isActive'] == 'True',
+                        'zone': self._cfg_parser[section].get('zone', '')}
+                    self._parse_flow_options(self._cfg_parser[section], params)
                     if self._cfg_parser[section]['lastTimeWatered'] != '':
                         time_str = self._cfg_parser[section]['lastTimeWatered']
                         params['lastTimeWatered'] = datetime.datetime.strptime(time_str, '%Y-%m-%d %X')
                     else:
                         params['lastTimeWatered'] = datetime.datetime.min
                     plant_params.append(params)
-                    self.logger.info(
-                        f'Found new plant: {params["plantName"]}, pin: {params["gpioPinNumber"]}')
+                    self.logger.info('Found new plant: %s, pin: %s', params['plantName'], params['gpioPinNumber'])
                 except KeyError as err:
-                    self.logger.error(
-                        f'{self._cfg_parser}: Failed to read {section} section - '
-                        f'option not found {str(err)}')
+                    self.logger.error('%s: Failed to read %s section - option not found %s', self._cfg_parser,
+                                      section, err)
                 except Exception as err:
-                    self.logger.error(
-                        f'{self._path} Failed to read {section} section {err}')
+                    self.logger.error('%s Failed to read %s section %s', self._path, section, err)
         return plant_params
 
     @staticmethod
-    def create_from_file(path: Path, debug: bool = False, dry_run: bool = False):
+    def _parse_flow_options(options, params: dict) -> None:
+        """Reads optional volume watering options of a plant section into params"""
+        if options.get('wateringVolume', '') != '':
+            params['wateringVolume'] = float(options['wateringVolume'])
+        if options.get('flowCalibration', '') != '':
+            params['flowCalibration'] = FlowCalibration.parse(options['flowCalibration'])
+        if options.get('flowMeterPin', '') != '':
+            params['flowMeterPin'] = options['flowMeterPin']
+            params['pulsesPerLitre'] = float(options['pulsesPerLitre'])
+
+    @staticmethod
+    def create_from_file(path: Path, debug: bool = False, dry_run: bool = False, pin_manager: PinManager = None):
         # check path
         if not path.exists() or not path.is_file():
             raise FileNotFoundError()
@@ -279,8 +624,20 @@ class EnvironmentConfig(Config):
             raise FileExistsError('File has wrong suffix')
 
         env_name = path.name[:-4]
-        env = EnvironmentConfig(env_name, path, debug, dry_run)
+        env = EnvironmentConfig(env_name, path, debug, dry_run, pin_manager)
         env.read()
-        env.pin_manager.active_limit = env.active_limit #TODO in future
+        env._apply_active_limit(env.active_limit)
+        # shared manager is set up by the first environment, the others have to agree
+        if not dry_run:
+            manager = env.pin_manager
+            if manager.backend_owner is not None and manager.backend != env.pin_backend:
+                raise ValueError(f'{env_name}: pin factory {env.pin_backend} differs from {manager.backend} '
+                                 f'chosen by {manager.backend_owner}')
+            if manager.backend != env.pin_backend:
+                manager.backend = env.pin_backend
+            if env.shared_pins and manager.backend_owner is None:
+                manager.backend_owner = env_name
+        if env.pin_worker and not env.pin_manager.use_worker:
+            env.pin_manager.enable_worker(env.pin_worker_safety_timeout)
         return env
 
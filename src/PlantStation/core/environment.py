@@ -1,6 +1,18 @@
+import datetime
 import logging
+import threading
+
+from .budget import BudgetGuard
 from .plant import Plant
 from .config import EnvironmentConfig
+from .ext import clock
+from .ext.blackout import BlackoutCalendar
+from .ext.cron import CronRule
+from .ext.due_table import DueTable
+from .ext.watering_index import WateringIndex
+from .journal import WateringJournal
+from .policies import CatchUpPolicy, SaturationPolicy, DEFAULT_PRIORITY
+from .sensors import SensorBank, MCP3008Reader, MockMoistureReader, MoisturePolicy
 
 
 class Environment(object):
@@ -18,9 +30,46 @@ class Environment(object):
     plants : [Plant]
         list of plants
 
+    journal : WateringJournal
+        recent waterings of all plants
+
+    sensors : SensorBank
+        moisture samples of plants with sensors, None if there are no sensors
+
+    moisture_policy : MoisturePolicy
+        moisture-threshold rule of plants with sensors. Plants with threshold are watered
+        according to it instead of their watering interval
+
     Methods:
     --------
 
+    due_plants(now)
+        Returns all plants which should be watered at given time (one vectorised pass)
+
+    moisture_due_plants(now)
+        Returns all plants in moisture-threshold mode which should be watered now
+
+    next_due()
+        Returns earliest watering time of plants which are not being watered
+
+    next_waterings(k, zone)
+        Returns k upcoming waterings (optionally in given zone)
+
+    waterings_between(start, end, zone)
+        Returns waterings planned in given time range (optionally in given zone)
+
+    next_allowed(plant, time)
+        Returns the first instant at or after time outside of plant's blackout windows
+
+    assess_load()
+        Measures watering demand against pump capacity (see :class: SaturationPolicy)
+
+    defer(plant, now)
+        Moves plant's next watering by one period without watering it
+
+    new_monitor_generation()
+        Supersedes running monitoring - only the newest monitoring task keeps rescheduling itself
+
     read_config()
         Reads environment config file
 
@@ -34,11 +83,26 @@ class Environment(object):
     config: EnvironmentConfig
     _plants: [Plant]
     _logger: logging.Logger
+    _due_table: DueTable
+    _watering_index: WateringIndex
+    journal: WateringJournal = None
+    sensors: SensorBank = None
+    moisture_policy: MoisturePolicy = None
+    catch_up: CatchUpPolicy
+    saturation: SaturationPolicy
+    budgets: BudgetGuard = None
+    _due_lock: threading.Lock
+    _monitor_generation = 0
+    _config_generation = None
 
     @property
     def plants(self):
         return self._plants
 
+    def plant(self, name: str) -> Plant:
+        """Returns plant with given name"""
+        return self._plants_by_name[name]
+
     def __init__(self, config: EnvironmentConfig):
         """
         Args:
@@ -54,13 +118,299 @@ class Environment(object):
         self.config = config
         self.name = self.config.env_name
         self._plants = []
+        self._plants_by_name = {}
+        self._last_watered = {}
+        self.journal = WateringJournal(path=self.config.journal_path)
+        self._blackouts = {}
+        self._priorities = {}
+        self._demands = {}
+        self._demand_total = 0.0
+        self.catch_up = CatchUpPolicy(**self.config.catch_up_settings)
+        self.saturation = SaturationPolicy(self.config.saturation_policy, self.config.logger.getChild('Saturation'))
+        self.budgets = BudgetGuard(path=self.config.budget_state_path)
+        self._due_table = DueTable()
+        self._watering_index = WateringIndex()
+        self._due_lock = threading.Lock()
         self._logger = self.config.logger.getChild('Environment')
         self._logger.setLevel(logging.DEBUG if self.config.debug else logging.INFO)
+        self._refresh_config()
+
+        self._logger.info('Created %s environment', self.name)
+        plants = [Plant(envConfig=self.config, **params) for params in self.config.parse_plants()]
+        self._create_sensors([plant.plantName for plant in plants])
+        for plant in plants:
+            self.add_plant(plant)
+
+    def _create_sensors(self, names: [str]) -> None:
+        sensors = {name: channel for (name, channel) in self.config.parse_sensors().items() if name in names}
+        if not sensors:
+            return
+        settings = self.config.sensor_settings
+        if self.config.dry_run:
+            reader = MockMoistureReader(sensors.values())
+        else:
+            reader = MCP3008Reader(sensors.values(), pin_factory=self.config.pin_manager.pin_factory)
+        self.sensors = SensorBank(list(sensors), reader, history=settings['history'],
+                                  decimation=settings['decimation'], smoothing=settings['smoothing'],
+                                  logger=self._logger.getChild('Sensors'))
+        self.moisture_policy = MoisturePolicy(len(sensors))
+        for (name, setup) in self.config.parse_moisture_thresholds().items():
+            if name in sensors:
+                self.moisture_policy.configure(self.sensors.row(name), *setup)
+        self._logger.info('Created %s moisture sensors', len(sensors))
+
+    def _moisture_mode(self, plant: Plant) -> bool:
+        return self.sensors is not None and plant.plantName in self.sensors and \
+            self.moisture_policy.enabled(self.sensors.row(plant.plantName))
+
+    def add_plant(self, plant: Plant) -> None:
+        """Starts to track plant"""
+        self._plants.append(plant)
+        self._plants_by_name[plant.plantName] = plant
+        self._last_watered[plant] = plant.lastTimeWatered
+        if self._moisture_mode(plant):
+            self.moisture_policy.set_last_watered(self.sensors.row(plant.plantName), plant.lastTimeWatered)
+        next_due, active, zone = self._schedule_of(plant)
+        demand = self.demand(plant)
+        with self._due_lock:
+            self._due_table.add(plant, next_due, active)
+            self._watering_index.update(plant, next_due if active else None, zone)
+            self._set_demand(plant, demand)
+        plant.add_listener(self._on_plant_changed)
+        plant.add_guard(self._within_budget)
+
+    def remove_plant(self, plant: Plant) -> None:
+        """Stops to track plant"""
+        plant.remove_listener(self._on_plant_changed)
+        plant.remove_guard(self._within_budget)
+        with self._due_lock:
+            self._due_table.remove(plant)
+            self._watering_index.remove(plant)
+            self._demand_total = max(0.0, self._demand_total - self._demands.pop(plant, 0.0))
+        self._plants.remove(plant)
+        self._plants_by_name.pop(plant.plantName, None)
+        self._last_watered.pop(plant, None)
+        self._blackouts.pop(plant.plantName, None)
+
+    def _refresh_config(self) -> None:
+        # drops values compiled from config options once the config was changed
+        generation = self.config.generation
+        if generation == self._config_generation:
+            return
+        initial = self._config_generation is None
+        self._config_generation = generation
+        self.invalidate_blackouts()
+        self._priorities = self.config.parse_priorities()
+        try:
+            self.budgets.configure(self.config.environment_budget, self.config.parse_budgets())
+        except ValueError:
+            # wrong environment budget is logged by the config, previous limits stay in force
+            if initial:
+                raise
+
+    def _schedule_of(self, plant: Plant):
+        # plants in moisture-threshold mode are not scheduled by interval
+        active = plant.isActive and not self._moisture_mode(plant)
+        return plant.calc_next_watering(), active, plant.zone
+
+    def _within_budget(self, plant: Plant, duration: float, volume: float or None) -> bool:
+        # watering rejected by budget is skipped for one period, so it isn't retried on every check
+        self._refresh_config()
+        if not self.budgets:
+            return True
+        exceeded = self.budgets.allow(plant.plantName, duration, volume)
+        if exceeded is None:
+            return True
+        self._logger.warning('%s: %s budget exhausted, skipping watering', plant.plantName, exceeded)
+        self.defer(plant)
+        return False
+
+    def _on_plant_changed(self, plant: Plant) -> None:
+        last_watered = plant.lastTimeWatered
+        if self._last_watered.get(plant, last_watered) != last_watered:
+            self._last_watered[plant] = last_watered
+            flow_meter = plant.flowMeter
+            self.journal.record(plant.plantName, last_watered, plant.lastWateringDuration,
+                                flow_meter.volume if flow_meter is not None else plant.wateringVolume)
+        if self._moisture_mode(plant):
+            row = self.sensors.row(plant.plantName)
+            if self.moisture_policy.set_last_watered(row, plant.lastTimeWatered):
+                self.sensors.watered(plant.plantName)
+        next_due, active, zone = self._schedule_of(plant)
+        demand = self.demand(plant)
+        with self._due_lock:
+            if plant in self._due_table:
+                self._due_table.update(plant, next_due, active)
+                self._watering_index.update(plant, next_due if active else None, zone)
+                self._set_demand(plant, demand)
+
+    def due_plants(self, now: datetime.datetime = None) -> [Plant]:
+        """Returns all active plants which should be watered at `now`
+
+        Plants marked as pending (already being watered) are skipped
+        """
+        if now is None:
+            now = clock.now()
+        with self._due_lock:
+            return self._due_table.due(now)
+
+    def moisture_due_plants(self, now: datetime.datetime = None) -> [Plant]:
+        """Returns active, not pending plants in moisture-threshold mode which should be watered now
+
+        All plants are evaluated in one pass over latest smoothed readings
+        """
+        if self.sensors is None or self.sensors.latest is None:
+            return []
+        if now is None:
+            now = clock.now()
+        due = []
+        for row in self.moisture_policy.evaluate(self.sensors.latest, now):
+            plant = self._plants_by_name.get(self.sensors.plants[row])
+            with self._due_lock:
+                ready = plant is not None and plant in self._due_table and not self._due_table.is_pending(plant)
+            if ready and plant.isActive:
+                due.append(plant)
+            else:
+                self.moisture_policy.rearm(row)
+        return due
+
+    def next_due(self) -> datetime.datetime or None:
+        """Earliest next watering of active, not pending plants"""
+        with self._due_lock:
+            return self._due_table.next_due()
+
+    def claim(self, plant: Plant) -> bool:
+        """Marks plant as pending unless it already is, returns whether it was claimed"""
+        with self._due_lock:
+            if self._due_table.is_pending(plant):
+                return False
+            self._due_table.set_pending(plant, True)
+            return True
+
+    def set_pending(self, plant: Plant, pending: bool) -> None:
+        """Marks plant as being watered (it's excluded from due queries) or releases it"""
+        with self._due_lock:
+            self._due_table.set_pending(plant, pending)
+
+    def _set_demand(self, plant: Plant, demand: float) -> None:
+        # keeps running total of demands, called with due lock held
+        self._demand_total = max(0.0, self._demand_total + demand - self._demands.get(plant, 0.0))
+        self._demands[plant] = demand
+
+    def demand(self, plant: Plant) -> float:
+        """Pumping seconds per day the plant is scheduled for (0 for inactive plants and moisture mode)"""
+        if not plant.isActive or self._moisture_mode(plant):
+            return 0.0
+        interval = plant.wateringInterval
+        if isinstance(interval, CronRule):
+            per_day = interval.fires_per_day
+        else:
+            per_day = datetime.timedelta(days=1) / interval
+        return plant.planned_duration() * per_day
+
+    @property
+    def capacity(self) -> float:
+        """Pumping seconds per day available - pump limit times time outside of environment's blackouts"""
+        self._refresh_config()
+        calendar = self._blackouts.get(None)
+        if calendar is None:
+            calendar = self._blackouts[None] = self.config.blackout_windows()
+        return self.config.active_limit * 24 * 3600 * (1 - calendar.weekly_fraction)
+
+    def _demands_with_priorities(self) -> [(Plant, float, int)]:
+        priorities = self._priorities
+        with self._due_lock:
+            demands = list(self._demands.items())
+        return [(plant, demand, priorities.get(plant.plantName, DEFAULT_PRIORITY)) for (plant, demand) in demands]
+
+    def assess_load(self) -> float:
+        """Updates saturation policy with current demand, capacity and backlog, returns saturation level
+
+        Plants' demands are kept up to date by plant change notifications and priorities are read
+        from the config only when it was changed, so the assessment is O(1) unless plants are deferred
+        """
+        capacity = self.capacity
+        with self._due_lock:
+            backlog = self._due_table.pending_count
+            total = self._demand_total
+        self.saturation.assess(total, capacity, backlog, self._demands_with_priorities)
+        return self.saturation.level
+
+    def defer(self, plant: Plant, now: datetime.datetime = None) -> None:
+        """Skips plant's watering - moves its next watering by one interval (to next fire of calendar rule)"""
+        if now is None:
+            now = clock.now()
+        interval = plant.wateringInterval
+        until = interval.next_fire(now) if isinstance(interval, CronRule) else now + interval
+        _, active, zone = self._schedule_of(plant)
+        self._logger.info('Deferring %s till %s', plant.plantName, until)
+        with self._due_lock:
+            self._due_table.update(plant, until, active)
+            self._watering_index.update(plant, until if active else None, zone)
+
+    def blackout_calendar(self, plant: Plant) -> BlackoutCalendar:
+        """Compiled blackout windows of the plant (environment's, zone's and plant's)
+
+        Windows are compiled again once the config was changed (see :attr: EnvironmentConfig.generation)
+        or the plant moved to another zone
+        """
+        self._refresh_config()
+        zone = plant.zone
+        (cached_zone, calendar) = self._blackouts.get(plant.plantName, (None, None))
+        if calendar is None or cached_zone != zone:
+            calendar = self.config.blackout_windows(zone, plant.plantName)
+            self._blackouts[plant.plantName] = (zone, calendar)
+        return calendar
+
+    def invalidate_blackouts(self) -> None:
+        """Drops compiled blackout windows, called once blackout options were changed"""
+        self._blackouts = {}
+
+    def next_allowed(self, plant: Plant, time: datetime.datetime = None) -> datetime.datetime:
+        """Returns the first instant at or after `time` (default now) the plant may be watered"""
+        if time is None:
+            time = clock.now()
+        return self.blackout_calendar(plant).next_allowed(time)
+
+    @property
+    def zones(self) -> [str]:
+        """Zones of active plants"""
+        with self._due_lock:
+            return self._watering_index.zones
+
+    def next_waterings(self, k: int = 1, zone: str = None) -> [(datetime.datetime, Plant)]:
+        """Returns k upcoming (time, plant) waterings of active plants, earliest first
+
+        Args:
+            k (int): number of waterings
+            zone (str): limit to the zone, all plants if None
+        """
+        with self._due_lock:
+            return self._watering_index.next_k(k, zone)
+
+    def waterings_between(self, start: datetime.datetime, end: datetime.datetime,
+                          zone: str = None) -> [(datetime.datetime, Plant)]:
+        """Returns (time, plant) waterings of active plants planned in [start, end), earliest first"""
+        with self._due_lock:
+            return self._watering_index.between(start, end, zone)
+
+    @property
+    def monitor_generation(self) -> int:
+        with self._due_lock:
+            return self._monitor_generation
 
-        self._logger.info(f'Created {self.name} environment')
-        for params in self.config.parse_plants():
-            self._plants.append(Plant(envConfig=self.config, **params))
+    def new_monitor_generation(self) -> int:
+        """Starts new generation of monitoring, previous monitoring tasks become stale"""
+        with self._due_lock:
+            self._monitor_generation += 1
+            return self._monitor_generation
 
     def __del__(self):
         for plant in self._plants:
-            del plant
+            plant.close()
+        if self.sensors is not None:
+            self.sensors.close()
+        if self.budgets is not None:
+            self.budgets.close()
+        if self.journal is not None:
+            self.journal.save()
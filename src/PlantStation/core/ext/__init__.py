@@ -1,3 +1,4 @@
 from .sched import MultithreadSched
 from .timedelta_ext import Interval, Duration
 from .pins import PinManager
+from .pin_trace import PinTraceRecorder
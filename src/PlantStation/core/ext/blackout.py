@@ -0,0 +1,172 @@
+import bisect
+import datetime
+import re
+
+WEEK = 7 * 24 * 3600
+DAY = 24 * 3600
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+_time = r'(\d{1,2}):(\d{2})'
+daily_regex = re.compile(rf'^{_time}-{_time}$')
+weekly_regex = re.compile(rf'^([a-z]{{3}}) {_time}-([a-z]{{3}}) {_time}$')
+weekdays_regex = re.compile(rf'^([a-z]{{3}})(?:-([a-z]{{3}}))? {_time}-{_time}$')
+dates_regex = re.compile(r'^(\d{4}-\d{2}-\d{2}(?: \d{1,2}:\d{2})?)\.\.(\d{4}-\d{2}-\d{2}(?: \d{1,2}:\d{2})?)$')
+
+
+def _merge(intervals: [(object, object)]) -> [(object, object)]:
+    merged = []
+    for (start, end) in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _seconds(hours: str, minutes: str) -> int:
+    hours, minutes = int(hours), int(minutes)
+    if hours > 24 or minutes > 59 or (hours == 24 and minutes):
+        raise ValueError('Wrong time of blackout window')
+    return hours * 3600 + minutes * 60
+
+
+def _weekday(name: str) -> int:
+    try:
+        return WEEKDAYS.index(name)
+    except ValueError:
+        raise ValueError(f'Unknown weekday: {name}')
+
+
+def _datetime(date_str: str, end: bool) -> datetime.datetime:
+    if ' ' in date_str:
+        return datetime.datetime.strptime(date_str, '%Y-%m-%d %H:%M')
+    day = datetime.datetime.strptime(date_str, '%Y-%m-%d')
+    # whole days - the end date is inclusive
+    return day + datetime.timedelta(days=1) if end else day
+
+
+class BlackoutCalendar(object):
+    """
+    Set of blackout windows, in which plants can't be watered
+
+    Windows are written as comma separated list of:
+        - daily window: '22:00-07:00'
+        - weekly window: 'sat 00:00-sun 12:00'
+        - daily window on given weekdays: 'mon-fri 12:00-13:00', 'sun 00:00-24:00'
+        - date range: '2020-12-24..2020-12-26' (whole days) or '2020-12-24 18:00..2020-12-26 06:00'
+
+    Periodic windows are compiled into merged, sorted intervals of the week, date ranges into
+    merged, sorted absolute intervals, so the next allowed instant is found in O(log n)
+    """
+    _week: [(int, int)]
+    _dates: [(datetime.datetime, datetime.datetime)]
+
+    def __init__(self, windows: str = '', week: [(int, int)] = (), dates: [(datetime.datetime, datetime.datetime)] = ()):
+        """
+        Args:
+            windows (str): blackout windows in config format
+            week ([(int, int)]): already parsed (start, end) seconds of the week
+            dates ([(datetime, datetime)]): already parsed date ranges
+        """
+        self._source = windows.strip()
+        week = list(week)
+        dates = list(dates)
+        for window in filter(None, (part.strip().lower() for part in windows.split(','))):
+            self._parse_window(window, week, dates)
+        self._week = _merge(week)
+        self._dates = _merge(dates)
+        if self._week and self._week[0] == (0, WEEK):
+            raise ValueError('Blackout windows cover the whole week')
+        self._week_starts = [start for (start, _) in self._week]
+        self._date_starts = [start for (start, _) in self._dates]
+
+    @staticmethod
+    def _add_weekly(week: [(int, int)], start: int, length: int) -> None:
+        # split windows wrapping over the end of the week
+        start %= WEEK
+        end = start + length
+        if end > WEEK:
+            week.append((start, WEEK))
+            week.append((0, end - WEEK))
+        else:
+            week.append((start, end))
+
+    def _parse_window(self, window: str, week: [(int, int)], dates: []) -> None:
+        parts = daily_regex.match(window)
+        if parts:
+            start, end = _seconds(*parts.group(1, 2)), _seconds(*parts.group(3, 4))
+            if start == end:
+                raise ValueError(f'Empty blackout window: {window}')
+            for day in range(7):
+                self._add_weekly(week, day * DAY + start, (end - start) % DAY)
+            return
+        parts = weekly_regex.match(window)
+        if parts:
+            start = _weekday(parts.group(1)) * DAY + _seconds(*parts.group(2, 3))
+            end = _weekday(parts.group(4)) * DAY + _seconds(*parts.group(5, 6))
+            if start == end:
+                raise ValueError(f'Empty blackout window: {window}')
+            self._add_weekly(week, start, (end - start) % WEEK or WEEK)
+            return
+        parts = weekdays_regex.match(window)
+        if parts:
+            first = _weekday(parts.group(1))
+            last = _weekday(parts.group(2)) if parts.group(2) else first
+            start, end = _seconds(*parts.group(3, 4)), _seconds(*parts.group(5, 6))
+            if start == end:
+                raise ValueError(f'Empty blackout window: {window}')
+            for day in range(first, first + (last - first) % 7 + 1):
+                self._add_weekly(week, day * DAY + start, (end - start) % DAY or DAY)
+            return
+        parts = dates_regex.match(window)
+        if parts:
+            start, end = _datetime(parts.group(1), False), _datetime(parts.group(2), True)
+            if end <= start:
+                raise ValueError(f'Empty blackout window: {window}')
+            dates.append((start, end))
+            return
+        raise ValueError(f'Wrong blackout window: {window}')
+
+    @classmethod
+    def from_working_hours(cls, begin: datetime.time, end: datetime.time):
+        """Creates calendar blacking out everything outside daily working hours"""
+        return cls(f'{end.strftime("%H:%M")}-{begin.strftime("%H:%M")}')
+
+    def __str__(self):
+        return self._source
+
+    def __bool__(self):
+        return bool(self._week or self._dates)
+
+    def __or__(self, other):
+        """Union of blackout windows"""
+        calendar = BlackoutCalendar(week=self._week + other._week, dates=self._dates + other._dates)
+        calendar._source = ', '.join(filter(None, [self._source, other._source]))
+        return calendar
+
+    @property
+    def weekly_fraction(self) -> float:
+        """Fraction of the week covered by periodic windows (date ranges are not counted)"""
+        return sum(end - start for (start, end) in self._week) / WEEK
+
+    def is_blackout(self, time: datetime.datetime) -> bool:
+        return self.next_allowed(time) != time
+
+    def next_allowed(self, time: datetime.datetime) -> datetime.datetime:
+        """Returns the first instant at or after `time` outside of all blackout windows"""
+        while True:
+            moved = False
+            if self._week:
+                since_monday = time.weekday() * DAY + time.hour * 3600 + time.minute * 60 + time.second
+                position = bisect.bisect_right(self._week_starts, since_monday) - 1
+                if position >= 0 and since_monday < self._week[position][1]:
+                    time = time.replace(microsecond=0) + \
+                        datetime.timedelta(seconds=self._week[position][1] - since_monday)
+                    moved = True
+            if self._dates:
+                position = bisect.bisect_right(self._date_starts, time) - 1
+                if position >= 0 and time < self._dates[position][1]:
+                    time = self._dates[position][1]
+                    moved = True
+            if not moved:
+                return time
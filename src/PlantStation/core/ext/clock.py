@@ -0,0 +1,98 @@
+"""
+Process wide clock.
+
+Scheduling code reads time through this module instead of datetime/time directly, so the
+simulator can run the real environment logic on virtual time. The real clock is used unless
+another one is installed with :func: use.
+"""
+import datetime
+import threading
+import time as _time
+
+
+class Clock(object):
+    """
+    Wall clock
+    """
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now()
+
+    def time(self) -> float:
+        return _time.time()
+
+    def monotonic(self) -> float:
+        return _time.monotonic()
+
+    def monotonic_ns(self) -> int:
+        return _time.monotonic_ns()
+
+    def sleep(self, seconds: float) -> None:
+        _time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """
+    Clock moved only by :meth: advance_to / sleep - time doesn't pass on its own
+    """
+
+    def __init__(self, start: datetime.datetime):
+        self.start = start
+        self._now = start
+        self._lock = threading.Lock()
+
+    def now(self) -> datetime.datetime:
+        return self._now
+
+    def time(self) -> float:
+        return self._now.timestamp()
+
+    def monotonic(self) -> float:
+        return (self._now - self.start).total_seconds()
+
+    def monotonic_ns(self) -> int:
+        delta = self._now - self.start
+        return (delta.days * 86400 + delta.seconds) * 10 ** 9 + delta.microseconds * 1000
+
+    def sleep(self, seconds: float) -> None:
+        self.advance_to(self._now + datetime.timedelta(seconds=seconds))
+
+    def advance_to(self, moment: datetime.datetime) -> None:
+        """Moves the clock forward to moment, never backwards"""
+        with self._lock:
+            if moment > self._now:
+                self._now = moment
+
+
+_clock = Clock()
+
+
+def use(clock: Clock) -> Clock:
+    """Installs clock, returns the previous one"""
+    global _clock
+    (previous, _clock) = (_clock, clock)
+    return previous
+
+
+def current() -> Clock:
+    return _clock
+
+
+def now() -> datetime.datetime:
+    return _clock.now()
+
+
+def time() -> float:
+    return _clock.time()
+
+
+def monotonic() -> float:
+    return _clock.monotonic()
+
+
+def monotonic_ns() -> int:
+    return _clock.monotonic_ns()
+
+
+def sleep(seconds: float) -> None:
+    _clock.sleep(seconds)
@@ -0,0 +1,164 @@
+import bisect
+import calendar
+import datetime
+
+CRON_PREFIX = 'cron:'
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+DAYS_OF_WEEK = ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
+ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@weekly': '0 0 * * sun',
+    '@monthly': '0 0 1 * *',
+}
+
+# (first, last, names) of minute, hour, day of month, month and day of week fields
+_FIELDS = [(0, 59, None), (0, 23, None), (1, 31, None), (1, 12, MONTHS), (0, 7, DAYS_OF_WEEK)]
+# impossible rules (e.g. 30th of February) are detected after this many jumps
+_MAX_JUMPS = 1000
+
+
+def _value(token: str, first: int, names: [str] or None) -> int:
+    if names and token in names:
+        return names.index(token) + first
+    if not token.isdigit():
+        raise ValueError(f'Wrong cron value: {token}')
+    return int(token)
+
+
+def _parse_field(field: str, first: int, last: int, names: [str] or None) -> [int]:
+    values = set()
+    for part in field.split(','):
+        (span, _, step) = part.partition('/')
+        step = int(step) if step else 1
+        if step < 1:
+            raise ValueError(f'Wrong cron step: {part}')
+        if span == '*':
+            (low, high) = (first, last)
+        elif '-' in span:
+            (low, high) = (_value(token, first, names) for token in span.split('-', 1))
+        else:
+            low = high = _value(span, first, names)
+            if step > 1:
+                high = last
+        if not first <= low <= high <= last:
+            raise ValueError(f'Cron value out of range: {part}')
+        values.update(range(low, high + 1, step))
+    return sorted(values)
+
+
+class CronRule(object):
+    """
+    Calendar watering rule in cron format: 'cron: minute hour day-of-month month day-of-week'
+
+    Fields accept '*', lists ('1,15'), ranges ('mon-fri'), steps ('*/4', '6-18/6') and
+    month/weekday names. As in cron, when both day fields are restricted a day matches
+    either of them. '@hourly', '@daily', '@weekly' and '@monthly' are accepted as well.
+
+    Every field is compiled into a sorted list, so the next fire time is found by bisecting
+    month, day, hour and minute instead of stepping minute by minute.
+    """
+    _minutes: [int]
+    _hours: [int]
+    _days: [int]
+    _months: [int]
+    _weekdays: {int}
+
+    def __init__(self, expression: str):
+        """
+        Args:
+            expression (str): rule with or without 'cron:' prefix
+        """
+        expression = expression.strip()
+        if expression.lower().startswith(CRON_PREFIX):
+            expression = expression[len(CRON_PREFIX):].strip()
+        self._expression = expression
+        fields = ALIASES.get(expression, expression).lower().split()
+        if len(fields) != 5:
+            raise ValueError(f'Cron rule needs 5 fields: {expression}')
+        (self._minutes, self._hours, self._days, self._months, weekdays) = \
+            (_parse_field(field, *limits) for (field, limits) in zip(fields, _FIELDS))
+        # cron counts weekdays from sunday (0 or 7), python from monday
+        self._weekdays = {(day - 1) % 7 for day in weekdays}
+        self._either_day = not fields[2].startswith('*') and not fields[4].startswith('*')
+        self._fires_per_day = None
+        self.next_fire(datetime.datetime(2000, 1, 1))
+
+    def __str__(self):
+        return f'{CRON_PREFIX} {self._expression}'
+
+    def __repr__(self):
+        return f'CronRule({self._expression!r})'
+
+    def __eq__(self, other):
+        return isinstance(other, CronRule) and str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def _matches_day(self, date: datetime.date) -> bool:
+        by_month = date.day in self._days
+        by_week = date.weekday() in self._weekdays
+        matches = by_month or by_week if self._either_day else by_month and by_week
+        return date.month in self._months and matches
+
+    @property
+    def fires_per_day(self) -> float:
+        """Average number of fires per day over a (non-leap) year"""
+        if self._fires_per_day is None:
+            first = datetime.date(2001, 1, 1)
+            days = sum(self._matches_day(first + datetime.timedelta(days=day)) for day in range(365))
+            self._fires_per_day = len(self._minutes) * len(self._hours) * days / 365
+        return self._fires_per_day
+
+    def _next_weekday(self, day: int, weekday: int) -> int:
+        return day + min((allowed - weekday) % 7 for allowed in self._weekdays)
+
+    def _next_day(self, date: datetime.date) -> int or None:
+        """First matching day of date's month at or after date, None if there is none"""
+        month_length = calendar.monthrange(date.year, date.month)[1]
+        day = date.day
+        while day <= month_length:
+            position = bisect.bisect_left(self._days, day)
+            by_month = self._days[position] if position < len(self._days) else None
+            by_week = self._next_weekday(day, (date.weekday() + day - date.day) % 7)
+            if self._either_day:
+                day = min(by_week, by_month or by_week)
+                return day if day <= month_length else None
+            if by_month is None:
+                return None
+            if by_month == by_week:
+                return by_month if by_month <= month_length else None
+            day = max(by_month, by_week)
+        return None
+
+    def next_fire(self, after: datetime.datetime) -> datetime.datetime:
+        """Returns the first fire time strictly after `after`"""
+        time = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        for _ in range(_MAX_JUMPS):
+            if time.month not in self._months:
+                position = bisect.bisect_left(self._months, time.month)
+                if position < len(self._months):
+                    time = datetime.datetime(time.year, self._months[position], 1)
+                else:
+                    time = datetime.datetime(time.year + 1, self._months[0], 1)
+                continue
+            day = self._next_day(time.date())
+            if day is None:
+                time = datetime.datetime(time.year, time.month, 1) + datetime.timedelta(days=32)
+                time = time.replace(day=1)
+                continue
+            if day != time.day:
+                time = datetime.datetime(time.year, time.month, day)
+            position = bisect.bisect_left(self._hours, time.hour)
+            if position == len(self._hours):
+                time = datetime.datetime(time.year, time.month, time.day) + datetime.timedelta(days=1)
+                continue
+            if self._hours[position] != time.hour:
+                time = time.replace(hour=self._hours[position], minute=0)
+            position = bisect.bisect_left(self._minutes, time.minute)
+            if position == len(self._minutes):
+                time = time.replace(minute=0) + datetime.timedelta(hours=1)
+                continue
+            return time.replace(minute=self._minutes[position])
+        raise ValueError(f'Cron rule never fires: {self._expression}')
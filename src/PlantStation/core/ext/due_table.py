@@ -0,0 +1,114 @@
+import datetime
+
+import numpy as np
+
+DEFAULT_TABLE_CAPACITY = 16
+
+
+def to_us(value) -> int:
+    """Converts datetime or timedelta to number of microseconds (since epoch)"""
+    if isinstance(value, datetime.timedelta):
+        return value // datetime.timedelta(microseconds=1)
+    return int(np.datetime64(value, 'us').astype(np.int64))
+
+
+def from_us(value: int) -> datetime.datetime:
+    """Converts number of microseconds since epoch to datetime"""
+    return np.datetime64(int(value), 'us').astype(datetime.datetime)
+
+
+class DueTable(object):
+    """
+    Next-due timestamps and flags of items kept in contiguous arrays,
+    so "who is due" is answered with one vectorised pass
+
+    Timestamps are stored as microseconds since epoch. Removal swaps the last row
+    into the freed one, so rows stay contiguous.
+    """
+    _items: []
+    _rows: {}
+    _next_due: np.ndarray
+    _active: np.ndarray
+    _pending: np.ndarray
+
+    def __init__(self, capacity: int = DEFAULT_TABLE_CAPACITY):
+        self._items = []
+        self._rows = {}
+        self._next_due = np.zeros(capacity, dtype=np.int64)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._pending = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._rows
+
+    def _grow(self):
+        capacity = 2 * len(self._next_due)
+        for name in ('_next_due', '_active', '_pending'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, item, next_due: datetime.datetime, active: bool) -> None:
+        """Adds new item"""
+        if item in self._rows:
+            raise KeyError(f'{item} is already in table')
+        if len(self._items) == len(self._next_due):
+            self._grow()
+        row = len(self._items)
+        self._items.append(item)
+        self._rows[item] = row
+        self._pending[row] = False
+        self._set(row, next_due, active)
+
+    def update(self, item, next_due: datetime.datetime, active: bool) -> None:
+        """Updates item's next due time and active flag"""
+        self._set(self._rows[item], next_due, active)
+
+    def _set(self, row, next_due, active):
+        self._next_due[row] = to_us(next_due)
+        self._active[row] = active
+
+    def remove(self, item) -> None:
+        """Removes item"""
+        row = self._rows.pop(item)
+        last = len(self._items) - 1
+        last_item = self._items.pop()
+        if row != last:
+            self._items[row] = last_item
+            self._rows[last_item] = row
+            for array in (self._next_due, self._active, self._pending):
+                array[row] = array[last]
+
+    def set_pending(self, item, pending: bool) -> None:
+        """Pending items are skipped until they are released"""
+        self._pending[self._rows[item]] = pending
+
+    def is_pending(self, item) -> bool:
+        return bool(self._pending[self._rows[item]])
+
+    @property
+    def pending_count(self) -> int:
+        """Number of items marked as pending"""
+        return int(self._pending[:len(self._items)].sum())
+
+    def _ready(self):
+        size = len(self._items)
+        return self._active[:size] & ~self._pending[:size]
+
+    def due(self, now: datetime.datetime) -> []:
+        """Returns all active, not pending items due at `now`"""
+        size = len(self._items)
+        rows = np.flatnonzero(self._ready() & (self._next_due[:size] <= to_us(now)))
+        return [self._items[row] for row in rows]
+
+    def next_due(self) -> datetime.datetime or None:
+        """Earliest due time of active, not pending items"""
+        size = len(self._items)
+        ready = self._ready()
+        if not ready.any():
+            return None
+        return from_us(self._next_due[:size][ready].min())
@@ -0,0 +1,88 @@
+"""
+Non-blocking logging helpers.
+
+Records are put on a bounded queue by :class: DroppingQueueHandler and written by a listener thread,
+so console or journal I/O never runs on watering threads. Records are queued unformatted - the
+message is built by the listener, only if the record is written at all. :class: RateLimitFilter
+drops repeated messages (same logger, level and message template) over a token bucket budget.
+"""
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler
+
+from .metrics import Counter
+
+DEFAULT_LOG_RATE = 1.0
+DEFAULT_LOG_BURST = 10
+DEFAULT_LOG_QUEUE_SIZE = 10000
+# limit of tracked message templates, buckets are reset when it's exceeded
+MAX_TRACKED_MESSAGES = 1024
+
+DROPPED_RECORDS = Counter('plantstation_log_records_dropped_total', 'Log records dropped by reason (rate, queue)',
+                          ('reason',))
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per message template: `burst` records pass at once, then `rate` records per second.
+    The next record passed after suppression reports how many similar ones were dropped. Records of
+    ERROR level and above always pass
+    """
+
+    def __init__(self, rate: float = DEFAULT_LOG_RATE, burst: int = DEFAULT_LOG_BURST, clock=time.monotonic):
+        super().__init__()
+        if rate <= 0 or burst < 1:
+            raise ValueError('Rate has to be positive and burst at least 1')
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        # (logger, level, template) -> [tokens, last update, suppressed]
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_TRACKED_MESSAGES:
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            else:
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                suppressed = None
+            else:
+                bucket[0] -= 1.0
+                suppressed = bucket[2]
+                bucket[2] = 0
+        if suppressed is None:
+            DROPPED_RECORDS.labels('rate').inc()
+            return False
+        if suppressed:
+            record.msg = f'{record.msg} [{suppressed} similar messages suppressed]'
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler which never blocks - records are dropped when the queue is full, and never
+    formats - the listener's handlers do it
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # listener runs in the same process, record can be passed as it is
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED_RECORDS.labels('queue').inc()
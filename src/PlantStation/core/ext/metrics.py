@@ -0,0 +1,368 @@
+"""
+Metrics registry with Prometheus text exposition.
+
+Counters and histograms accumulate into per-thread shards - the hot path only touches a list owned
+by the current thread, no lock is taken. Shards are summed when metrics are collected; shards of
+finished threads are folded into a base value then and whenever a new thread registers its
+shard, so memory stays bounded even though the scheduler runs every task in a new thread.
+Gauges are either set directly or computed by a function at collection time.
+"""
+import bisect
+import math
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from .unix_socket import remove_stale_socket
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class _Shards(object):
+    """
+    Per-thread accumulation cells of fixed size
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._cells = []
+        self._base = [0.0] * size
+        self._lock = threading.Lock()
+
+    def cell(self) -> [float]:
+        """Cell of the current thread (created on first use)"""
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0.0] * self._size
+            with self._lock:
+                self._fold_finished()
+                self._cells.append((threading.current_thread(), cell))
+            return cell
+
+    def _fold_finished(self) -> None:
+        alive = []
+        for (thread, cell) in self._cells:
+            if thread.is_alive():
+                alive.append((thread, cell))
+            else:
+                self._base = [base + value for (base, value) in zip(self._base, cell)]
+        self._cells = alive
+
+    def totals(self) -> [float]:
+        """Sums of all cells, cells of finished threads are folded into the base"""
+        with self._lock:
+            self._fold_finished()
+            totals = list(self._base)
+            for (_, cell) in self._cells:
+                totals = [total + value for (total, value) in zip(totals, cell)]
+            return totals
+
+
+class _Metric(object):
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: (str,) = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._children_lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Child metric of given label values"""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f'{self.name} expects labels {self.label_names}')
+            with self._children_lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        if self.label_names:
+            raise ValueError(f'{self.name} has labels {self.label_names}')
+        return self.labels()
+
+    def remove(self, *values) -> None:
+        """Drops child of given label values"""
+        with self._children_lock:
+            self._children.pop(tuple(str(value) for value in values), None)
+
+    def _new_child(self):
+        raise NotImplementedError()
+
+    def _label_str(self, values: (str,), extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(value)}"' for (name, value) in zip(self.label_names, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def expose(self) -> [str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._children_lock:
+            children = list(self._children.items())
+        for (values, child) in children:
+            lines.extend(self._expose_child(values, child))
+        return lines
+
+    def _expose_child(self, values, child) -> [str]:
+        return [f'{self.name}{self._label_str(values)} {_format(child.get())}']
+
+
+class _CounterChild(object):
+    __slots__ = ('_shards', '_function')
+
+    def __init__(self):
+        self._shards = _Shards(1)
+        self._function = None
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._shards.cell()[0] += amount
+
+    def set_function(self, function) -> None:
+        """Value is counted elsewhere, function() is read at collection time"""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._shards.totals()[0]
+
+
+class Counter(_Metric):
+    """Monotonic counter"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def set_function(self, function) -> None:
+        self._default().set_function(function)
+
+    def get(self) -> float:
+        return self._default().get()
+
+
+class _GaugeChild(object):
+    __slots__ = ('_value', '_function')
+
+    def __init__(self):
+        self._value = 0.0
+        self._function = None
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def set_function(self, function) -> None:
+        """Value is computed by function() at collection time"""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+
+class Gauge(_Metric):
+    """Value which can go up and down"""
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def set_function(self, function) -> None:
+        self._default().set_function(function)
+
+    def get(self) -> float:
+        return self._default().get()
+
+
+class _HistogramChild(object):
+    __slots__ = ('_bounds', '_shards')
+
+    def __init__(self, bounds: (float,)):
+        self._bounds = bounds
+        # bucket counts, +Inf count, sum
+        self._shards = _Shards(len(bounds) + 2)
+
+    def observe(self, value: float) -> None:
+        cell = self._shards.cell()
+        cell[bisect.bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+    def time(self):
+        """Context manager observing duration of the block"""
+        return _Timer(self)
+
+    def get(self) -> ([float], float, float):
+        """Cumulative bucket counts, count and sum"""
+        totals = self._shards.totals()
+        cumulative = []
+        running = 0.0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, totals[-1]
+
+
+class _Timer(object):
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: (str,) = (), buckets: (float,) = DEFAULT_BUCKETS,
+                 registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _expose_child(self, values, child) -> [str]:
+        (cumulative, count, total) = child.get()
+        lines = []
+        for (bound, value) in zip(self.buckets + (math.inf,), cumulative):
+            le = 'le="' + _format(bound) + '"'
+            lines.append(f'{self.name}_bucket{self._label_str(values, le)} {_format(value)}')
+        lines.append(f'{self.name}_sum{self._label_str(values)} {_format(total)}')
+        lines.append(f'{self.name}_count{self._label_str(values)} {_format(count)}')
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if value != value:
+        return 'NaN'
+    return repr(float(value))
+
+
+class Registry(object):
+    """
+    Set of metrics exposed together
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> _Metric:
+        return self._metrics[name]
+
+    def expose(self) -> str:
+        """Metrics in Prometheus text format"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.expose().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return str(self.client_address[0]) if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class MetricsServer(object):
+    """
+    Serves registry over HTTP (GET /metrics) on TCP ('host:port', ':port') or Unix socket ('unix:/path')
+    """
+
+    def __init__(self, address: str, registry: Registry = REGISTRY):
+        self.address = address
+        self.registry = registry
+        self._server = None
+        self._thread = None
+
+    def start(self) -> None:
+        if self.address.startswith('unix:'):
+            path = Path(self.address[len('unix:'):])
+            remove_stale_socket(path)
+            self._server = _UnixHTTPServer(str(path), _MetricsHandler)
+        else:
+            (host, _, port) = self.address.rpartition(':')
+            self._server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), _MetricsHandler)
+            self._server.daemon_threads = True
+        self._server.registry = self.registry
+        self._thread = threading.Thread(target=self._server.serve_forever, name='PlantStation-Metrics', daemon=True)
+        self._thread.start()
+
+    @property
+    def server_address(self):
+        return self._server.server_address if self._server is not None else None
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        if self.address.startswith('unix:'):
+            Path(self.address[len('unix:'):]).unlink(missing_ok=True)
+        self._server = None
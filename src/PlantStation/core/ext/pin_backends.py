@@ -0,0 +1,118 @@
+import importlib
+import statistics
+import time
+
+from gpiozero import BadPinFactory
+
+DEFAULT_BACKEND = 'native'
+MOCK_BACKEND = 'mock'
+DEFAULT_BENCHMARK_PIN = 'GPIO17'
+DEFAULT_BENCHMARK_TOGGLES = 1000
+
+# backend name -> 'module:FactoryClass', modules are imported only when used
+_backends = {
+    'native': 'gpiozero.pins.native:NativeFactory',
+    'pigpio': 'gpiozero.pins.pigpio:PiGPIOFactory',
+    'rpigpio': 'gpiozero.pins.rpigpio:RPiGPIOFactory',
+    'mock': 'gpiozero.pins.mock:MockFactory',
+}
+
+
+def register_backend(name: str, factory) -> None:
+    """Registers new pin factory backend
+
+    Args:
+        name (str): backend name used in config (pinFactory option)
+        factory: either pin factory class/callable or 'module:Class' path
+    """
+    _backends[name] = factory
+
+
+def available_backends() -> [str]:
+    """Returns names of all registered backends"""
+    return list(_backends)
+
+
+def _load(path: str):
+    module_name, _, attr = path.partition(':')
+    if not attr:
+        module_name, _, attr = path.rpartition('.')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def create_factory(name: str):
+    """Creates pin factory of given backend
+
+    Backend is either registered name or user supplied 'module:Class' / 'module.Class' path.
+    Module of the backend is imported lazily.
+
+    Args:
+        name (str): backend name
+
+    Raises:
+        BadPinFactory: backend is unknown or couldn't be loaded
+
+    Returns:
+        gpiozero.Factory
+    """
+    factory = _backends.get(name)
+    if factory is None:
+        if ':' not in name and '.' not in name:
+            raise BadPinFactory(f'Unknown pin factory backend: {name}')
+        factory = name
+    if isinstance(factory, str):
+        try:
+            factory = _load(factory)
+        except (ImportError, AttributeError) as exc:
+            raise BadPinFactory(f'Couldn\'t load pin factory backend {name}: {exc}')
+    return factory()
+
+
+def benchmark_backend(name: str, pin: str = DEFAULT_BENCHMARK_PIN, toggles: int = DEFAULT_BENCHMARK_TOGGLES) -> dict:
+    """Measures latency of pin toggles with given backend
+
+    Args:
+        name (str): backend name
+        pin (str): pin to toggle. Be aware - the pin is driven!
+        toggles (int): number of measured toggles
+
+    Returns:
+        dict with backend name, number of toggles and mean, median and 99th percentile latency in microseconds
+    """
+    factory = create_factory(name)
+    try:
+        output = factory.pin(pin)
+        output.function = 'output'
+        samples = []
+        state = False
+        for _ in range(toggles):
+            state = not state
+            begin = time.perf_counter_ns()
+            output.state = state
+            samples.append(time.perf_counter_ns() - begin)
+        output.state = False
+        samples.sort()
+        return {
+            'backend': name,
+            'toggles': toggles,
+            'mean_us': statistics.mean(samples) / 1e3,
+            'median_us': statistics.median(samples) / 1e3,
+            'p99_us': samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1e3,
+        }
+    finally:
+        factory.close()
+
+
+def benchmark_backends(names: [str] = None, pin: str = DEFAULT_BENCHMARK_PIN,
+                       toggles: int = DEFAULT_BENCHMARK_TOGGLES) -> [dict]:
+    """Benchmarks given (by default all registered) backends, fastest first
+
+    Backends which couldn't be loaded on this board are reported with an error
+    """
+    results = []
+    for name in names or available_backends():
+        try:
+            results.append(benchmark_backend(name, pin, toggles))
+        except Exception as exc:
+            results.append({'backend': name, 'error': str(exc)})
+    return sorted(results, key=lambda result: result.get('median_us', float('inf')))
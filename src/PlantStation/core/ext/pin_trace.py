@@ -0,0 +1,216 @@
+import csv
+import json
+from array import array
+from threading import Lock
+
+from . import clock
+
+DEFAULT_TRACE_CAPACITY = 65536
+
+
+class PinTraceRecorder(object):
+    """
+    Records pin transitions with monotonic timestamps into a ring buffer
+
+    Transitions are stored in three parallel arrays (timestamp in ns, pin id, state),
+    pin names are interned. When the buffer is full, the oldest transitions are
+    overwritten.
+    """
+    _capacity: int
+    _timestamps: array
+    _pins: array
+    _states: array
+    _pin_names: [str]
+    _pin_ids: {}
+    _head: int
+    _size: int
+    _lock: Lock
+
+    def __init__(self, capacity: int = DEFAULT_TRACE_CAPACITY):
+        """
+        Parameters
+        ----------
+        capacity : int
+            max number of stored transitions
+        """
+        if capacity <= 0:
+            raise ValueError('Trace capacity must be positive')
+        self._capacity = capacity
+        self._timestamps = array('q', bytes(8 * capacity))
+        self._pins = array('H', bytes(2 * capacity))
+        self._states = array('b', bytes(capacity))
+        self._pin_names = []
+        self._pin_ids = {}
+        self._head = 0
+        self._size = 0
+        self._lock = Lock()
+        self._origin = clock.monotonic_ns()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self):
+        with self._lock:
+            return self._size
+
+    def record(self, pin: str, state: bool, timestamp: int = None) -> None:
+        """
+        Stores pin transition
+
+        Parameters
+        ----------
+        pin : str
+            pin name
+        state : bool
+            new pin state
+        timestamp : int
+            monotonic time in ns, defaults to now
+        """
+        if timestamp is None:
+            timestamp = clock.monotonic_ns()
+        with self._lock:
+            pin_id = self._pin_ids.get(pin)
+            if pin_id is None:
+                pin_id = self._pin_ids[pin] = len(self._pin_names)
+                self._pin_names.append(pin)
+            self._timestamps[self._head] = timestamp
+            self._pins[self._head] = pin_id
+            self._states[self._head] = 1 if state else 0
+            self._head = (self._head + 1) % self._capacity
+            if self._size < self._capacity:
+                self._size += 1
+
+    def clear(self) -> None:
+        """
+        Removes all stored transitions
+        """
+        with self._lock:
+            self._head = 0
+            self._size = 0
+
+    def transitions(self) -> [(int, str, bool)]:
+        """
+        Returns stored transitions, oldest first
+
+        Returns
+        -------
+        list of (timestamp ns, pin name, state)
+        """
+        with self._lock:
+            start = (self._head - self._size) % self._capacity
+            indexes = [(start + i) % self._capacity for i in range(self._size)]
+            return [(self._timestamps[i], self._pin_names[self._pins[i]], bool(self._states[i])) for i in indexes]
+
+    def _intervals(self, until: int = None) -> [(str, int, int)]:
+        """
+        Pairs on/off transitions into (pin, begin, end) intervals. Pins still
+        active are closed at `until`. Leading off transitions (overwritten on) are skipped
+        """
+        if until is None:
+            until = clock.monotonic_ns()
+        intervals = []
+        started = {}
+        for (timestamp, pin, state) in self.transitions():
+            if state:
+                started.setdefault(pin, timestamp)
+            elif pin in started:
+                intervals.append((pin, started.pop(pin), timestamp))
+        for (pin, begin) in started.items():
+            intervals.append((pin, begin, max(begin, until)))
+        return intervals
+
+    def on_time_totals(self, until: int = None) -> {str: float}:
+        """
+        Total time each pin was active
+
+        Parameters
+        ----------
+        until : int
+            monotonic time (ns) closing intervals of still active pins, defaults to now
+
+        Returns
+        -------
+        dict pin name -> seconds
+        """
+        totals = {}
+        for (pin, begin, end) in self._intervals(until):
+            totals[pin] = totals.get(pin, 0.0) + (end - begin) / 1e9
+        return totals
+
+    def peak_concurrency(self) -> int:
+        """
+        Max number of pins active at the same time
+        """
+        active = set()
+        peak = 0
+        for (_, pin, state) in self.transitions():
+            if state:
+                active.add(pin)
+            else:
+                active.discard(pin)
+            peak = max(peak, len(active))
+        return peak
+
+    def to_csv(self, file) -> None:
+        """
+        Writes transitions as CSV (timestamp_ns, pin, state)
+
+        Parameters
+        ----------
+        file : path or text file object
+        """
+        if hasattr(file, 'write'):
+            self._write_csv(file)
+        else:
+            with open(file, 'w', newline='') as csv_file:
+                self._write_csv(csv_file)
+
+    def _write_csv(self, csv_file) -> None:
+        writer = csv.writer(csv_file)
+        writer.writerow(['timestamp_ns', 'pin', 'state'])
+        for (timestamp, pin, state) in self.transitions():
+            writer.writerow([timestamp, pin, int(state)])
+
+    def to_chrome_trace(self, until: int = None) -> dict:
+        """
+        Converts transitions into Chrome trace event format (chrome://tracing, Perfetto)
+
+        Every active period is a complete event on a separate track per pin (named
+        by a thread_name metadata event), concurrency is exported as a counter
+
+        Returns
+        -------
+        dict ready to be dumped as JSON
+        """
+        with self._lock:
+            pin_ids = dict(self._pin_ids)
+        # trace viewers expect integer thread ids, pin names are passed as thread names
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': pin_id + 1, 'args': {'name': pin}}
+                  for (pin, pin_id) in pin_ids.items()]
+        for (pin, begin, end) in self._intervals(until):
+            events.append({'name': pin, 'cat': 'pin', 'ph': 'X', 'pid': 1, 'tid': pin_ids[pin] + 1,
+                           'ts': (begin - self._origin) / 1e3, 'dur': (end - begin) / 1e3})
+        active = set()
+        for (timestamp, pin, state) in self.transitions():
+            if state:
+                active.add(pin)
+            else:
+                active.discard(pin)
+            events.append({'name': 'active pins', 'ph': 'C', 'pid': 1,
+                           'ts': (timestamp - self._origin) / 1e3, 'args': {'active': len(active)}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump_chrome_trace(self, file) -> None:
+        """
+        Writes Chrome trace JSON
+
+        Parameters
+        ----------
+        file : path or text file object
+        """
+        if hasattr(file, 'write'):
+            json.dump(self.to_chrome_trace(), file)
+        else:
+            with open(file, 'w') as trace_file:
+                json.dump(self.to_chrome_trace(), trace_file)
@@ -0,0 +1,474 @@
+"""
+Out-of-process pin IO.
+
+All pin operations are sent to a dedicated child process, which owns the pin factory
+and the safety shutoff timers. Commands flow through a single-producer single-consumer
+ring buffer placed in shared memory. Ring counters are read and written under a
+process-shared lock (plain stores into shared memory give no ordering guarantee and
+8-byte stores aren't atomic on 32-bit ARM); a semaphore is used as a doorbell waking
+the worker up. The worker turns every pin off when it's stopped or when the parent
+process disappears. Flow meter pulses are counted by the worker too, into per-pin
+counters in the same shared memory block.
+
+Requires Python 3.8+ (multiprocessing.shared_memory)
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import struct
+import time
+from multiprocessing import shared_memory
+from threading import Lock
+
+from gpiozero import GPIOZeroError, GPIODeviceClosed
+
+from .pin_backends import create_factory
+
+DEFAULT_RING_SLOTS = 256
+DEFAULT_SAFETY_TIMEOUT = 600
+MAX_PINS = 64
+PARENT_CHECK_INTERVAL = 0.5
+ACK_TIMEOUT = 5.0
+FLOW_POLL_INTERVAL = 0.01
+
+# ring layout: head (written by parent) and tail (written by worker) in separate cache lines,
+# then slots, then one status byte per pin, then one pulse counter per pin
+_COUNTER = struct.Struct('<Q')
+_PULSES = struct.Struct('<I')
+_HEAD_OFFSET = 0
+_TAIL_OFFSET = 64
+_SLOTS_OFFSET = 128
+_SLOT = struct.Struct('<BxHd16s')
+
+OP_OPEN = 1
+OP_ON = 2
+OP_OFF = 3
+OP_CLOSE = 4
+OP_STOP = 5
+OP_OPEN_INPUT = 6
+
+STATE_OFF = 0
+STATE_ON = 1
+STATE_PENDING = 2
+STATE_ERROR = 3
+STATE_CLOSED = 4
+
+
+class CommandRing(object):
+    """
+    Single-producer single-consumer ring of fixed size commands in shared memory
+
+    Head and tail counters are accessed only under `lock`, which both processes share;
+    the lock also orders slot writes before the counter publishing them
+    """
+    _shm: shared_memory.SharedMemory
+    _slots: int
+
+    def __init__(self, slots: int = DEFAULT_RING_SLOTS, name: str = None, lock=None):
+        """
+        Parameters
+        ----------
+        slots : int
+            ring capacity
+        name : str
+            name of existing shared memory block (worker side), None creates new one
+        lock : multiprocessing.Lock
+            lock shared with the other side of the ring, None creates new one
+        """
+        self._slots = slots
+        self._lock = lock if lock is not None else multiprocessing.Lock()
+        self._status_offset = _SLOTS_OFFSET + slots * _SLOT.size
+        self._pulses_offset = self._status_offset + MAX_PINS
+        size = self._pulses_offset + MAX_PINS * _PULSES.size
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._shm.buf[:size] = bytes(size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._buf = self._shm.buf
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def slots(self) -> int:
+        return self._slots
+
+    @property
+    def lock(self):
+        return self._lock
+
+    def _counter(self, offset: int) -> int:
+        return _COUNTER.unpack_from(self._buf, offset)[0]
+
+    def push(self, op: int, pin_id: int = 0, arg: float = 0.0, pin: str = '') -> bool:
+        """
+        Writes command, returns False if ring is full
+        """
+        with self._lock:
+            head = self._counter(_HEAD_OFFSET)
+            if head - self._counter(_TAIL_OFFSET) >= self._slots:
+                return False
+            _SLOT.pack_into(self._buf, _SLOTS_OFFSET + (head % self._slots) * _SLOT.size,
+                            op, pin_id, arg, pin.encode())
+            _COUNTER.pack_into(self._buf, _HEAD_OFFSET, head + 1)
+        return True
+
+    def pop(self):
+        """
+        Reads command
+
+        Returns
+        -------
+        (op, pin_id, arg, pin) or None if ring is empty
+        """
+        with self._lock:
+            tail = self._counter(_TAIL_OFFSET)
+            if tail == self._counter(_HEAD_OFFSET):
+                return None
+            op, pin_id, arg, pin = _SLOT.unpack_from(self._buf, _SLOTS_OFFSET + (tail % self._slots) * _SLOT.size)
+            _COUNTER.pack_into(self._buf, _TAIL_OFFSET, tail + 1)
+        return op, pin_id, arg, pin.rstrip(b'\0').decode()
+
+    def get_state(self, pin_id: int) -> int:
+        return self._buf[self._status_offset + pin_id]
+
+    def set_state(self, pin_id: int, state: int) -> None:
+        self._buf[self._status_offset + pin_id] = state
+
+    def get_pulses(self, pin_id: int) -> int:
+        """Pulses counted on the pin (wraps around at 2^32)"""
+        with self._lock:
+            return _PULSES.unpack_from(self._buf, self._pulses_offset + pin_id * _PULSES.size)[0]
+
+    def add_pulse(self, pin_id: int) -> None:
+        offset = self._pulses_offset + pin_id * _PULSES.size
+        with self._lock:
+            _PULSES.pack_into(self._buf, offset, (_PULSES.unpack_from(self._buf, offset)[0] + 1) & 0xFFFFFFFF)
+
+    def close(self, unlink: bool = False) -> None:
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+def _worker_main(ring_name: str, slots: int, ring_lock, backend: str, doorbell, parent_pid: int) -> None:
+    """
+    Worker process loop - executes commands and safety shutoffs
+    """
+    logger = logging.getLogger('PlantStation').getChild('PinWorker')
+    running = [True]
+
+    def _stop(*args):
+        running[0] = False
+        doorbell.release()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    ring = CommandRing(slots, name=ring_name, lock=ring_lock)
+    factory = create_factory(backend)
+    outputs = {}
+    inputs = {}
+    deadlines = {}
+    try:
+        while running[0]:
+            timeout = PARENT_CHECK_INTERVAL
+            if deadlines:
+                timeout = max(0.0, min(timeout, min(deadlines.values()) - time.monotonic()))
+            doorbell.acquire(timeout=timeout)
+
+            command = ring.pop()
+            while command is not None:
+                op, pin_id, arg, pin = command
+                if op == OP_STOP:
+                    running[0] = False
+                elif op == OP_OPEN:
+                    try:
+                        output = factory.pin(pin)
+                        output.function = 'output'
+                        output.state = False
+                        outputs[pin_id] = output
+                        ring.set_state(pin_id, STATE_OFF)
+                    except Exception as exc:
+                        logger.error('Couldn\'t set up pin %s: %s', pin, exc)
+                        ring.set_state(pin_id, STATE_ERROR)
+                elif op == OP_OPEN_INPUT:
+                    try:
+                        input_pin = factory.pin(pin)
+                        input_pin.function = 'input'
+                        input_pin.pull = 'up'
+                        input_pin.edges = 'rising'
+                        input_pin.when_changed = lambda ticks, state, pin_id=pin_id: ring.add_pulse(pin_id)
+                        inputs[pin_id] = input_pin
+                        ring.set_state(pin_id, STATE_OFF)
+                    except Exception as exc:
+                        logger.error('Couldn\'t set up pin %s: %s', pin, exc)
+                        ring.set_state(pin_id, STATE_ERROR)
+                elif op == OP_CLOSE and pin_id in inputs:
+                    inputs.pop(pin_id).close()
+                    ring.set_state(pin_id, STATE_CLOSED)
+                elif pin_id in outputs:
+                    if op == OP_ON:
+                        outputs[pin_id].state = True
+                        ring.set_state(pin_id, STATE_ON)
+                        if arg > 0:
+                            deadlines[pin_id] = time.monotonic() + arg
+                    elif op in (OP_OFF, OP_CLOSE):
+                        outputs[pin_id].state = False
+                        deadlines.pop(pin_id, None)
+                        ring.set_state(pin_id, STATE_OFF)
+                        if op == OP_CLOSE:
+                            outputs.pop(pin_id).close()
+                            ring.set_state(pin_id, STATE_CLOSED)
+                command = ring.pop()
+
+            now = time.monotonic()
+            for pin_id in [pin_id for (pin_id, deadline) in deadlines.items() if deadline <= now]:
+                logger.warning('Safety shutoff of pin %s', outputs[pin_id].number)
+                outputs[pin_id].state = False
+                ring.set_state(pin_id, STATE_OFF)
+                del deadlines[pin_id]
+
+            if os.getppid() != parent_pid:
+                logger.error('Parent process is gone. Turning off all pins')
+                break
+    finally:
+        for output in outputs.values():
+            output.state = False
+        factory.close()
+        ring.close()
+
+
+class PinWorker(object):
+    """
+    Parent side of the pin worker process
+    """
+    _ring: CommandRing
+    _process: multiprocessing.Process
+    _push_lock: Lock
+    _pin_ids: {}
+
+    def __init__(self, backend: str, slots: int = DEFAULT_RING_SLOTS):
+        """
+        Starts worker process
+
+        Parameters
+        ----------
+        backend : str
+            pin factory backend used by the worker
+        slots : int
+            command ring capacity
+        """
+        context = multiprocessing.get_context('spawn')
+        self._ring = CommandRing(slots, lock=context.Lock())
+        self._doorbell = context.Semaphore(0)
+        self._push_lock = Lock()
+        self._pin_ids = {}
+        self._process = context.Process(target=_worker_main, name='PlantStation-PinWorker',
+                                        args=(self._ring.name, slots, self._ring.lock, backend, self._doorbell,
+                                              os.getpid()))
+        self._process.start()
+
+    @property
+    def alive(self) -> bool:
+        return self._process.is_alive()
+
+    def _send(self, op: int, pin_id: int = 0, arg: float = 0.0, pin: str = '') -> None:
+        with self._push_lock:
+            if not self._process.is_alive():
+                raise GPIOZeroError('Pin worker is not running')
+            while not self._ring.push(op, pin_id, arg, pin):
+                time.sleep(0.0001)
+        self._doorbell.release()
+
+    def _wait_for_state(self, pin_id: int, pending: int) -> int:
+        deadline = time.monotonic() + ACK_TIMEOUT
+        while self._ring.get_state(pin_id) == pending:
+            if time.monotonic() > deadline or not self._process.is_alive():
+                raise GPIOZeroError('Pin worker is not responding')
+            time.sleep(0.0005)
+        return self._ring.get_state(pin_id)
+
+    def open(self, pin: str, as_input: bool = False) -> int:
+        """
+        Sets up output (or pulse counting input) pin in the worker
+
+        Returns
+        -------
+        pin id used in next commands
+        """
+        with self._push_lock:
+            if len(self._pin_ids) >= MAX_PINS:
+                raise GPIOZeroError('Too many pins')
+            pin_id = self._pin_ids.setdefault(pin, len(self._pin_ids))
+            self._ring.set_state(pin_id, STATE_PENDING)
+        self._send(OP_OPEN_INPUT if as_input else OP_OPEN, pin_id, pin=pin)
+        if self._wait_for_state(pin_id, STATE_PENDING) == STATE_ERROR:
+            raise GPIOZeroError(f'Couldn\'t set up pin {pin}')
+        return pin_id
+
+    def on(self, pin_id: int, safety_timeout: float = 0) -> None:
+        self._send(OP_ON, pin_id, safety_timeout)
+
+    def off(self, pin_id: int) -> None:
+        self._send(OP_OFF, pin_id)
+
+    def close_pin(self, pin_id: int) -> None:
+        self._send(OP_CLOSE, pin_id)
+
+    def state(self, pin_id: int) -> int:
+        """
+        Pin state reported by the worker
+        """
+        return self._ring.get_state(pin_id)
+
+    def pulses(self, pin_id: int) -> int:
+        """
+        Pulses counted by the worker on the input pin
+        """
+        return self._ring.get_pulses(pin_id)
+
+    def stop(self, timeout: float = ACK_TIMEOUT) -> None:
+        """
+        Stops worker - all pins are turned off
+        """
+        if self._process.is_alive():
+            self._send(OP_STOP)
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+        self._ring.close(unlink=True)
+
+
+class LimitedRemoteOutputDevice(object):
+    """
+    Output device driven by the pin worker. Sticks to the limit of parallel working pumps
+    granted by :class: PinManager, the worker switches the pin off after safety timeout
+    """
+    _holds_lock = False
+    _switched_on = False
+    _closed = False
+
+    def __init__(self, manager, worker: PinWorker, pin: str, safety_timeout: float = DEFAULT_SAFETY_TIMEOUT,
+                 group=None):
+        self._manager = manager
+        self._group = group
+        self._worker = worker
+        self._pin = pin
+        self._pin_id = worker.open(pin)
+        self.safety_timeout = safety_timeout
+
+    @property
+    def pin(self) -> str:
+        return self._pin
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def value(self) -> int:
+        return int(self._worker.state(self._pin_id) == STATE_ON)
+
+    @property
+    def is_active(self) -> bool:
+        return bool(self.value)
+
+    def _check_open(self):
+        if self._closed:
+            raise GPIODeviceClosed(f'{self._pin} is closed')
+
+    def on(self):
+        self._check_open()
+        if not self._holds_lock:
+            self._manager.acquire_lock(self._group)
+            self._holds_lock = True
+        self._worker.on(self._pin_id, self.safety_timeout)
+        if not self._switched_on:
+            self._switched_on = True
+            self._manager.record_transition(self, True)
+
+    def off(self):
+        self._check_open()
+        try:
+            self._worker.off(self._pin_id)
+            if self._switched_on:
+                self._switched_on = False
+                self._manager.record_transition(self, False)
+        finally:
+            # a dead worker mustn't keep the pump slot taken forever
+            if self._holds_lock:
+                self._holds_lock = False
+                self._manager.release_lock(self._group)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._worker.close_pin(self._pin_id)
+
+
+class RemoteFlowMeter(object):
+    """
+    Flow meter whose pulses are counted by the pin worker. Same interface as :class: FlowMeter,
+    :meth: wait polls the shared counter
+    """
+    _closed = False
+
+    def __init__(self, worker: PinWorker, pin: str, pulses_per_litre: float):
+        if pulses_per_litre <= 0:
+            raise ValueError('Pulses per litre must be positive')
+        self._worker = worker
+        self._pin = pin
+        self._pulses_per_litre = pulses_per_litre
+        self._pin_id = worker.open(pin, as_input=True)
+        self._base = worker.pulses(self._pin_id)
+        self._target = float('inf')
+
+    @property
+    def pin(self) -> str:
+        return self._pin
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def pulses(self) -> int:
+        """Pulses counted since the last reset"""
+        return (self._worker.pulses(self._pin_id) - self._base) & 0xFFFFFFFF
+
+    @property
+    def volume(self) -> float:
+        """Volume (ml) measured since the last reset"""
+        return self.pulses * 1000 / self._pulses_per_litre
+
+    def reset(self, target_volume: float = None) -> None:
+        """
+        Resets counter
+
+        Args:
+            target_volume (float): volume (ml) after which :meth: wait returns
+        """
+        self._base = self._worker.pulses(self._pin_id)
+        self._target = float('inf') if target_volume is None else target_volume * self._pulses_per_litre / 1000
+
+    def wait(self, timeout: float = None) -> bool:
+        """Waits until target volume is delivered, returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pulses < self._target:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            if not self._worker.alive:
+                raise GPIOZeroError('Pin worker is not running')
+            time.sleep(FLOW_POLL_INTERVAL)
+        return True
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._worker.close_pin(self._pin_id)
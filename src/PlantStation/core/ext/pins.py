@@ -1,60 +1,187 @@
+import time
 from threading import Lock, Condition
 
-from gpiozero import DigitalOutputDevice
-from gpiozero.pins import mock, native, local
+from gpiozero import DigitalOutputDevice, GPIOPinInUse, Factory, pi_info
+
+from . import recording
+from .metrics import Gauge, Histogram
+from .pin_backends import DEFAULT_BACKEND, MOCK_BACKEND, create_factory
+from .pin_trace import PinTraceRecorder
+from .tracing import span
 
 DEFAULT_ACTIVE_LIMIT = 1
 
+PUMP_LOCK_WAIT = Histogram('plantstation_pump_lock_wait_seconds', 'Time spent waiting for a free pump slot')
+WORKING_PUMPS = Gauge('plantstation_working_pumps', 'Number of working pumps')
+
+# board data of the 40-pin header shared by all current Raspberry Pi models
+_HEADER_BOARD = pi_info('a02082')
+
 
 class LimitedDigitalOutputDevice(DigitalOutputDevice):
     """
     DigitalOutputDevice extended with limitation of maximum number
     of active pins at once. Requires :class: PinManager which grants
-    permission
+    permission (within device's limit group, if given)
     """
     _manager = None
+    _group = None
+    _holds_lock = False
 
-    def __init__(self, manager, **kwargs):
+    def __init__(self, manager, group=None, **kwargs):
         super().__init__(**kwargs)
         self._manager = manager
+        self._group = group
 
     def on(self):
-        self._manager.acquire_lock()
+        if not self._holds_lock:
+            self._manager.acquire_lock(self._group)
+            self._holds_lock = True
+        was_active = self.is_active
         super().on()
+        if not was_active:
+            self._manager.record_transition(self, True)
 
     def off(self):
-        super().off()
-        self._manager.release_lock()
+        try:
+            was_active = self.is_active
+            super().off()
+            if was_active:
+                self._manager.record_transition(self, False)
+        finally:
+            # slot is freed even if the pin couldn't be switched
+            if self._holds_lock:
+                self._holds_lock = False
+                self._manager.release_lock(self._group)
+
+
+class _PinRecord(object):
+    """
+    Registry entry - device driving the pin, its kind (pump, flow meter), owner and number of handles
+    """
+    __slots__ = ('device', 'kind', 'owner', 'refs')
+
+    def __init__(self, device, kind: str, owner):
+        self.device = device
+        self.kind = kind
+        self.owner = owner
+        self.refs = 1
 
 
 class PinManager(object):
     """
     Manages pin IO and responds for parallel working pump limit
+
+    Every pin used by the manager is kept in a registry (pin -> device, owner),
+    so conflicts are detected in O(1) and handles of the same owner are reused
+
+    Pumps may belong to limit groups (e.g. environments sharing the manager), then a pump
+    starts only when both the global limit and its group's limit allow it
     """
-    _factory: local.LocalPiFactory
+    _backend: str
+    _pin_factory: Factory = None
 
     _active_limit : int
     _working_pumps = 0
     _pump_lock: Lock
     _wait_for_pump: Condition
-    _devices = []
+    _group_limits: {}
+    _group_working: {}
+    _registry: {}
+    _registry_lock: Lock
+    _trace: PinTraceRecorder = None
+    _use_worker = False
+    _worker = None
+    _allowed_pins: set = None
+    safety_timeout: float = None
+    # environment which chose the backend of a shared manager
+    backend_owner: str = None
 
-    def __init__(self, active_limit: int = DEFAULT_ACTIVE_LIMIT, dry_run: bool = False):
+    def __init__(self, active_limit: int = DEFAULT_ACTIVE_LIMIT, dry_run: bool = False,
+                 trace: PinTraceRecorder = None, backend: str = DEFAULT_BACKEND):
         self._active_limit = active_limit
+        self._trace = trace
 
-        # create pin factory
-        self._pin_factory = native.NativeFactory() if not dry_run else mock.MockFactory()
+        # pin factory is created on first use
+        self._backend = MOCK_BACKEND if dry_run else backend
+        self._factory_lock = Lock()
 
         # create lock & condition
         self._pump_lock = Lock()
         self._wait_for_pump = Condition(self._pump_lock)
+        self._group_limits = {}
+        self._group_working = {}
+
+        # create pin registry
+        self._registry = {}
+        self._registry_lock = Lock()
+
+    @property
+    def pin_factory(self) -> Factory:
+        """
+        Returns pin factory, creates it on first use
+        """
+        with self._factory_lock:
+            if self._pin_factory is None:
+                self._pin_factory = create_factory(self._backend)
+            return self._pin_factory
+
+    @property
+    def backend(self) -> str:
+        """
+        Name of pin factory backend
+        """
+        return self._backend
+
+    @backend.setter
+    def backend(self, value: str):
+        with self._factory_lock:
+            if self._pin_factory is not None:
+                raise RuntimeError('Pin factory is already in use')
+            self._backend = value
+
+    @property
+    def use_worker(self) -> bool:
+        """
+        Is pin IO delegated to the worker process?
+        """
+        return self._use_worker
+
+    def enable_worker(self, safety_timeout: float = None) -> None:
+        """
+        Delegates all pin IO to a dedicated worker process (see :mod: pin_worker). Must be
+        called before any pump is created
+
+        Parameters
+        ----------
+        safety_timeout : float
+            seconds after which the worker turns active pin off on its own
+        """
+        from .pin_worker import DEFAULT_SAFETY_TIMEOUT
+        with self._registry_lock:
+            if self._registry:
+                raise RuntimeError('Pins are already in use')
+            self._use_worker = True
+            self.safety_timeout = safety_timeout if safety_timeout is not None else DEFAULT_SAFETY_TIMEOUT
 
     @property
-    def pin_factory(self):
+    def trace(self) -> PinTraceRecorder:
         """
-        Returns pin factory
+        Pin transition recorder, None if tracing is disabled
         """
-        return self._pin_factory
+        return self._trace
+
+    @trace.setter
+    def trace(self, value: PinTraceRecorder):
+        self._trace = value
+
+    def record_transition(self, device, state: bool) -> None:
+        """
+        Passes pin transition to the recorder (if tracing is enabled)
+        """
+        trace = self._trace
+        if trace is not None:
+            trace.record(str(device.pin), state)
 
     @property
     def active_limit(self):
@@ -68,6 +195,29 @@ class PinManager(object):
     def active_limit(self, value):
         with self._pump_lock:
             self._active_limit = value
+            self._wait_for_pump.notify_all()
+
+    def set_group_limit(self, group, limit: int) -> None:
+        """
+        Sets limit of parallel working pumps within the group
+        """
+        with self._pump_lock:
+            self._group_limits[group] = limit
+            self._wait_for_pump.notify_all()
+
+    def group_limit(self, group) -> int or None:
+        """
+        Limit of the group, None if the group is limited by global limit only
+        """
+        with self._pump_lock:
+            return self._group_limits.get(group)
+
+    def working_in(self, group) -> int:
+        """
+        Number of working pumps of the group
+        """
+        with self._pump_lock:
+            return self._group_working.get(group, 0)
 
     @property
     def working_pumps(self) -> int:
@@ -77,35 +227,214 @@ class PinManager(object):
         with self._pump_lock:
             return self._working_pumps
 
-    def acquire_lock(self):
+    @property
+    def devices(self) -> dict:
+        """
+        Snapshot of registered devices (pin -> device)
+        """
+        with self._registry_lock:
+            return {pin: record.device for (pin, record) in self._registry.items()}
+
+    def _group_full(self, group) -> bool:
+        limit = self._group_limits.get(group)
+        return limit is not None and self._group_working.get(group, 0) >= limit
+
+    def has_free_pump(self, group=None) -> bool:
         """
-        Acquires pump lock
+        Checks if a pump of the group could be turned on now without waiting
         """
         with self._pump_lock:
-            while self._working_pumps >= self._active_limit:
+            return self._working_pumps < self._active_limit and not self._group_full(group)
+
+    def acquire_lock(self, group=None):
+        """
+        Acquires pump lock (within the group's limit)
+        """
+        started = time.perf_counter()
+        with span('pump lock wait', 'pins'), self._pump_lock:
+            while self._working_pumps >= self._active_limit or self._group_full(group):
                 self._wait_for_pump.wait()
-            else:
-                self._working_pumps += 1
+            self._working_pumps += 1
+            if group is not None:
+                self._group_working[group] = self._group_working.get(group, 0) + 1
+            WORKING_PUMPS.set(self._working_pumps)
+        waited = time.perf_counter() - started
+        PUMP_LOCK_WAIT.observe(waited)
+        recording.record(recording.LOCK_ACQUIRE, group, value=recording.microseconds(waited))
 
-    def release_lock(self):
+    def release_lock(self, group=None):
         """
         Releases pump lock
         """
         with self._pump_lock:
             self._working_pumps -= 1
-            self._wait_for_pump.notify()
+            if group is not None:
+                self._group_working[group] -= 1
+            WORKING_PUMPS.set(self._working_pumps)
+            # waiters of other groups may be the ones able to proceed
+            self._wait_for_pump.notify_all()
+        recording.record(recording.LOCK_RELEASE, group)
 
-    def create_pump(self, pin_number: str) -> LimitedDigitalOutputDevice:
+    def _pin_key(self, pin_number: str):
+        """
+        Normalizes pin name, so BOARDXX and GPIOYY describing the same pin collide
+
+        Pins driven by the worker process are normalized by the static header table, the pin
+        factory lives in the worker
+        """
+        try:
+            board = _HEADER_BOARD if self._use_worker else self.pin_factory.pi_info
+            return board.to_gpio(pin_number)
+        except Exception:
+            return pin_number
+
+    def normalize_pin(self, pin_number: str):
+        """
+        Key the manager registers the pin under (GPIO number if the board knows the pin)
+        """
+        return self._pin_key(pin_number)
+
+    @property
+    def allowed_pins(self) -> set or None:
+        """
+        Pins the manager may drive (normalized), None if not restricted
+        """
+        return self._allowed_pins
+
+    @allowed_pins.setter
+    def allowed_pins(self, pins: [str] or None):
+        self._allowed_pins = None if pins is None else {self._pin_key(pin) for pin in pins}
+
+    def owner_of(self, pin_number: str):
+        """
+        Returns owner of the pin or None if the pin is free
+        """
+        with self._registry_lock:
+            record = self._registry.get(self._pin_key(pin_number))
+            return record.owner if record else None
+
+    def create_pump(self, pin_number: str, owner=None, group=None) -> LimitedDigitalOutputDevice:
         """
         Creates Digital output device, which stick to the limit of parallel working pumps
+
+        If the owner already holds the pin, its device is reused and the handle count is increased.
         Parameters
         ----------
         pin_number: pin number
+        owner: hashable identifier of the pin's user (e.g. plant name)
+        group: limit group of the pump (see :meth: set_group_limit)
+
+        Raises
+        ------
+        GPIOPinInUse: pin is registered by another owner or isn't among allowed pins
 
         Returns
         -------
         LimitedDigitalOutputDevice
         """
-        device = LimitedDigitalOutputDevice(self, pin=pin_number, pin_factory=self.pin_factory)
-        self._devices.append(device)
-        return device
+        return self._register(pin_number, owner, 'pump', lambda: self._new_device(pin_number, group))
+
+    def create_flow_meter(self, pin_number: str, pulses_per_litre: float, owner=None):
+        """
+        Creates pulse counting flow meter on the input pin. The pin is registered like pumps' pins,
+        in worker mode pulses are counted by the worker process
+
+        Parameters
+        ----------
+        pin_number: pin number
+        pulses_per_litre: meter's K-factor
+        owner: hashable identifier of the pin's user
+
+        Raises
+        ------
+        GPIOPinInUse: pin is registered by another owner (or as a pump) or isn't among allowed pins
+
+        Returns
+        -------
+        FlowMeter
+        """
+        return self._register(pin_number, owner, 'flow meter',
+                              lambda: self._new_flow_meter(pin_number, pulses_per_litre))
+
+    def _register(self, pin_number: str, owner, kind: str, create):
+        key = self._pin_key(pin_number)
+        if self._allowed_pins is not None and key not in self._allowed_pins:
+            raise GPIOPinInUse(f'Pin {pin_number} is not assigned to this process')
+        with self._registry_lock:
+            record = self._registry.get(key)
+            if record is not None:
+                if owner is None or record.owner != owner or record.kind != kind:
+                    raise GPIOPinInUse(f'Pin {pin_number} is already used by {record.owner}')
+                if record.device.closed:
+                    record.device = create()
+                record.refs += 1
+                return record.device
+            device = create()
+            self._registry[key] = _PinRecord(device, kind, owner)
+            return device
+
+    def release_pump(self, pin_number: str) -> None:
+        """
+        Drops one handle to the pin (see :meth: release_pin)
+        """
+        self.release_pin(pin_number)
+
+    def release_pin(self, pin_number: str) -> None:
+        """
+        Drops one handle to the pin. When the last handle is dropped, the device is closed
+        and removed from registry
+
+        Parameters
+        ----------
+        pin_number: pin number
+        """
+        key = self._pin_key(pin_number)
+        with self._registry_lock:
+            record = self._registry.get(key)
+            if record is None:
+                return
+            record.refs -= 1
+            if record.refs > 0:
+                return
+            del self._registry[key]
+        self._dispose(record.device)
+
+    def close(self) -> None:
+        """
+        Closes all registered devices
+        """
+        with self._registry_lock:
+            records = list(self._registry.values())
+            self._registry.clear()
+        for record in records:
+            self._dispose(record.device)
+        if self._worker is not None:
+            self._worker.stop()
+            self._worker = None
+
+    def _get_worker(self):
+        from .pin_worker import PinWorker
+        if self._worker is None:
+            self._worker = PinWorker(self._backend)
+        return self._worker
+
+    def _new_device(self, pin_number: str, group=None) -> LimitedDigitalOutputDevice:
+        if self._use_worker:
+            from .pin_worker import LimitedRemoteOutputDevice
+            return LimitedRemoteOutputDevice(self, self._get_worker(), pin_number, self.safety_timeout, group)
+        return LimitedDigitalOutputDevice(self, group, pin=pin_number, pin_factory=self.pin_factory)
+
+    def _new_flow_meter(self, pin_number: str, pulses_per_litre: float):
+        if self._use_worker:
+            from .pin_worker import RemoteFlowMeter
+            return RemoteFlowMeter(self._get_worker(), pin_number, pulses_per_litre)
+        from ..flow import FlowMeter
+        return FlowMeter(pin_number, pulses_per_litre, pin_factory=self.pin_factory)
+
+    @staticmethod
+    def _dispose(device) -> None:
+        if not device.closed:
+            # flow meters have nothing to switch off
+            if hasattr(device, 'off'):
+                device.off()
+            device.close()
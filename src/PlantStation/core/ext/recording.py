@@ -0,0 +1,215 @@
+"""
+Opt-in record of scheduling inputs and decisions, replayed by :mod: PlantStation.simulation.replay.
+
+The log is binary: MAGIC, then fixed size records (kind, environment, subject, time, value - see RECORD).
+Strings (environment names, task labels, plants, config snapshots, control commands) are interned -
+the first use writes a STRING record (id, length, utf-8 bytes) and later records refer to its id.
+Time is wall time (:func: clock.time) in microseconds, so replayed logs are directly comparable.
+While recording is disabled :func: record returns right away. Recording never raises into the
+scheduler - if the log can't be written (or runs out of string ids), the error is logged once and
+recording stops, the log keeps the records written so far.
+
+Kinds and their fields (environment, subject, value):
+
+    START           -               -               -
+    SNAPSHOT        environment     config text     -
+    TASK            environment     task label      delay (us)
+    DISPATCH        environment     task label      -
+    LOCK_ACQUIRE    limit group     -               wait (us)
+    LOCK_RELEASE    limit group     -               -
+    POSTPONE        environment     plant           delay (us)
+    CONFIG_WRITE    environment     -               -
+    COMMAND         -               request line    -
+    END             -               -               -
+"""
+import logging
+import struct
+from threading import Lock
+
+from . import clock
+
+MAGIC = b'PSREC\x01'
+# kind, environment id, subject id, time (us), value
+RECORD = struct.Struct('<BHHqq')
+# kind, string id, length
+STRING = struct.Struct('<BHI')
+FLUSH_SIZE = 64 * 1024
+
+(STRING_KIND, START, SNAPSHOT, TASK, DISPATCH, LOCK_ACQUIRE, LOCK_RELEASE, POSTPONE, CONFIG_WRITE,
+ COMMAND, END) = range(11)
+KIND_NAMES = ('STRING', 'START', 'SNAPSHOT', 'TASK', 'DISPATCH', 'LOCK_ACQUIRE', 'LOCK_RELEASE', 'POSTPONE',
+              'CONFIG_WRITE', 'COMMAND', 'END')
+
+_recorder = None
+logger = logging.getLogger('PlantStation').getChild('Recording')
+
+
+class Record(object):
+    """
+    Decoded log record, strings are resolved (empty string for none)
+    """
+    __slots__ = ('kind', 'environment', 'subject', 'time', 'value')
+
+    def __init__(self, kind: int, environment: str, subject: str, time: int, value: int):
+        self.kind = kind
+        self.environment = environment
+        self.subject = subject
+        self.time = time
+        self.value = value
+
+    @property
+    def kind_name(self) -> str:
+        return KIND_NAMES[self.kind]
+
+    def __eq__(self, other):
+        return isinstance(other, Record) and all(getattr(self, slot) == getattr(other, slot)
+                                                 for slot in self.__slots__)
+
+    def __repr__(self):
+        return f'Record({self.kind_name}, {self.environment!r}, {self.subject[:40]!r}, {self.time}, {self.value})'
+
+
+class Recorder(object):
+    """
+    Writes records into a buffer flushed to the log file, thread safe
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._buffer = bytearray(MAGIC)
+        # string id 0 is reserved for "none"
+        self._strings = {None: 0, '': 0}
+        self._lock = Lock()
+
+    def _intern(self, text: str) -> int:
+        string_id = self._strings.get(text)
+        if string_id is None:
+            string_id = len(self._strings) - 1
+            if string_id > 0xFFFF:
+                raise OverflowError('Too many distinct strings in one record log')
+            self._strings[text] = string_id
+            data = text.encode()
+            self._buffer += STRING.pack(STRING_KIND, string_id, len(data))
+            self._buffer += data
+        return string_id
+
+    def record(self, kind: int, environment: str = None, subject: str = None, value: int = 0,
+               time: int = None) -> None:
+        if time is None:
+            time = round(clock.time() * 1e6)
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                self._buffer += RECORD.pack(kind, self._intern(environment), self._intern(subject), time, value)
+                if len(self._buffer) >= FLUSH_SIZE:
+                    self._flush()
+            except (OverflowError, struct.error) as err:
+                self._stop(f'Recording stopped, record can\'t be encoded: {err}')
+            except OSError as err:
+                # part of the buffer may be written already
+                self._buffer.clear()
+                self._stop(f'Recording stopped, couldn\'t write {self.path}: {err}')
+
+    def _stop(self, message: str) -> None:
+        """Closes the log after a failure, keeps what can still be written"""
+        logger.error(message)
+        (file, self._file) = (self._file, None)
+        try:
+            file.write(self._buffer)
+            file.close()
+        except OSError:
+            pass
+        self._buffer.clear()
+
+    def _flush(self) -> None:
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._buffer.clear()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._flush()
+                except OSError as err:
+                    self._buffer.clear()
+                    self._stop(f'Recording stopped, couldn\'t write {self.path}: {err}')
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+
+
+def enable(path) -> Recorder:
+    """Starts recording into path (log is overwritten)"""
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = Recorder(path)
+    _recorder.record(START)
+    return _recorder
+
+
+def disable() -> None:
+    """Stops recording, the log is flushed and closed"""
+    global _recorder
+    (recorder, _recorder) = (_recorder, None)
+    if recorder is not None:
+        recorder.record(END)
+        recorder.close()
+
+
+def recorder() -> Recorder or None:
+    return _recorder
+
+
+def record(kind: int, environment: str = None, subject: str = None, value: int = 0) -> None:
+    """Records an event if recording is enabled"""
+    recorder = _recorder
+    if recorder is not None:
+        recorder.record(kind, environment, subject, value)
+
+
+def microseconds(delta) -> int:
+    """timedelta or seconds as integer microseconds"""
+    seconds = delta.total_seconds() if hasattr(delta, 'total_seconds') else delta
+    return round(seconds * 1e6)
+
+
+def read_log(path):
+    """
+    Reads record log
+
+    Yields:
+        Record: records in order of recording (STRING records are consumed)
+
+    Raises:
+        ValueError: not a record log or truncated record
+    """
+    strings = {0: ''}
+    with open(path, 'rb') as log:
+        data = log.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f'{path} is not a PlantStation record log')
+    offset = len(MAGIC)
+    size = len(data)
+    while offset < size:
+        if data[offset] == STRING_KIND:
+            if offset + STRING.size > size:
+                raise ValueError(f'Truncated record at offset {offset}')
+            (_, string_id, length) = STRING.unpack_from(data, offset)
+            offset += STRING.size
+            strings[string_id] = data[offset:offset + length].decode()
+            offset += length
+            continue
+        if offset + RECORD.size > size:
+            raise ValueError(f'Truncated record at offset {offset}')
+        (kind, environment, subject, time, value) = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        yield Record(kind, strings[environment], strings[subject], time, value)
@@ -4,6 +4,16 @@ import threading
 from threading import Condition, RLock
 from typing import Callable
 
+from . import clock
+from .metrics import Counter, Gauge, Histogram
+from .tracing import span
+
+SCHEDULED_EVENTS = Counter('plantstation_scheduler_events_total', 'Events dispatched by the scheduler')
+SCHEDULER_LATENESS = Histogram('plantstation_scheduler_lateness_seconds',
+                               'Delay between planned and actual dispatch of an event')
+SCHEDULER_QUEUE = Gauge('plantstation_scheduler_queue_size', 'Events waiting in the scheduler queue')
+SCHEDULER_THREADS = Gauge('plantstation_scheduler_threads', 'Running event threads')
+
 
 class Event(object):
     _time: datetime.datetime
@@ -83,9 +93,11 @@ class MultithreadSched(object):
         def __packed_job(*args, **kwargs):
             with self._lock:
                 self.threads.append(threading.current_thread())
+                SCHEDULER_THREADS.set(len(self._threads))
             func(*args, **kwargs)
             with self._lock:
                 self.threads.remove(threading.current_thread())
+                SCHEDULER_THREADS.set(len(self._threads))
 
         return __packed_job
 
@@ -107,6 +119,7 @@ class MultithreadSched(object):
         new_event = Event(time, action, args, kwargs)
         with self._lock:
             self._queue.put(new_event)
+            SCHEDULER_QUEUE.set(self._queue.qsize())
             self._new_job.notify()
 
     def enter(self, delay: datetime.timedelta, action: Callable, args=[], kwargs={}):
@@ -123,7 +136,7 @@ class MultithreadSched(object):
         kwargs: {}
             dict of named arguments to pass
         """
-        time = datetime.datetime.now() + delay
+        time = clock.now() + delay
         return self.enterabs(time, action, args, kwargs)
 
     def stop(self) -> None:
@@ -146,11 +159,17 @@ class MultithreadSched(object):
             while self.running:
                 if self._queue.empty():
                     self._new_job.wait()
+                    continue
                 event = self._queue.get()  # TODO peek
-                if datetime.datetime.now() < event.time:
+                now = clock.now()
+                if now < event.time:
                     self._queue.put(event)
-                    diff = datetime.datetime.now() - event.time
+                    diff = event.time - now
                     self._new_job.wait(timeout=diff.total_seconds())
                 else:
-                    thread = threading.Thread(target=event.run)
-                    thread.start()
+                    SCHEDULED_EVENTS.inc()
+                    SCHEDULER_LATENESS.observe((now - event.time).total_seconds())
+                    SCHEDULER_QUEUE.set(self._queue.qsize())
+                    with span('dispatch', 'scheduler'):
+                        thread = threading.Thread(target=event.run)
+                        thread.start()
@@ -0,0 +1,66 @@
+from . import clock
+
+
+class SlidingWindowCounter(object):
+    """
+    Sum of values added within the last `window` seconds
+
+    The window is split into fixed number of buckets, so memory is constant and both adding
+    and reading are O(1) amortised. Values leave the window bucket by bucket, so the result
+    is exact up to one bucket length.
+    """
+    _counts: [float]
+    _total: float
+    _head: int
+
+    def __init__(self, window: float, buckets: int = 24):
+        """
+        Args:
+            window (float): window length in seconds
+            buckets (int): number of buckets the window is split into
+        """
+        if window <= 0 or buckets < 1:
+            raise ValueError('Window and number of buckets have to be positive')
+        self._bucket_length = window / buckets
+        self._counts = [0.0] * buckets
+        self._total = 0.0
+        self._head = 0
+
+    def _advance(self, now: float) -> None:
+        bucket = int(now // self._bucket_length)
+        if bucket <= self._head:
+            return
+        size = len(self._counts)
+        if bucket - self._head >= size:
+            self._counts = [0.0] * size
+            self._total = 0.0
+        else:
+            for expired in range(self._head + 1, bucket + 1):
+                self._counts[expired % size] = 0.0
+            # recounted (once per bucket) instead of subtracting, so rounding errors don't pile up
+            self._total = sum(self._counts)
+        self._head = bucket
+
+    def add(self, value: float = 1.0, now: float = None) -> None:
+        """Adds value at `now` (seconds since epoch, defaults to current time)"""
+        self._advance(clock.time() if now is None else now)
+        self._counts[self._head % len(self._counts)] += value
+        self._total += value
+
+    def total(self, now: float = None) -> float:
+        """Sum of values within the window ending at `now`"""
+        self._advance(clock.time() if now is None else now)
+        return self._total
+
+    def state(self) -> dict:
+        """Buckets of the counter, see :meth: restore"""
+        return {'head': self._head, 'counts': list(self._counts)}
+
+    def restore(self, state: dict) -> None:
+        """Restores buckets saved by :meth: state (e.g. before restart), ignored if the number of buckets differs"""
+        counts = [float(count) for count in state['counts']]
+        if len(counts) != len(self._counts):
+            return
+        self._counts = counts
+        self._head = int(state['head'])
+        self._total = sum(counts)
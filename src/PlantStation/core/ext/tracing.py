@@ -0,0 +1,198 @@
+"""
+Opt-in span tracing with Chrome trace export (chrome://tracing, Perfetto).
+
+Spans are stored in per-thread ring buffers, recording takes no lock. Buffers of finished threads
+are folded into a shared ring buffer when new threads register, so memory stays bounded even
+though the scheduler runs every task in a new thread. While tracing is disabled :func: span
+returns a shared no-op context manager.
+
+    with span('water', 'plant', {'plant': name}):
+        ...
+"""
+import json
+import signal
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+DEFAULT_TRACE_CAPACITY = 65536
+
+_tracer = None
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    __slots__ = ('_buffer', '_name', '_category', '_args', '_begin')
+
+    def __init__(self, buffer: deque, name: str, category: str, args: dict):
+        self._buffer = buffer
+        self._name = name
+        self._category = category
+        self._args = args
+
+    def __enter__(self):
+        self._begin = time.monotonic_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self._buffer.append((self._name, self._category, self._begin, time.monotonic_ns(), self._args))
+        return False
+
+
+class Tracer(object):
+    """
+    Collects spans of all threads
+    """
+
+    def __init__(self, capacity: int = DEFAULT_TRACE_CAPACITY):
+        """
+        Args:
+            capacity (int): max number of spans kept per thread and of finished threads together
+        """
+        if capacity <= 0:
+            raise ValueError('Trace capacity must be positive')
+        self.capacity = capacity
+        self._origin = time.monotonic_ns()
+        self._local = threading.local()
+        # (thread, buffer) of registered threads
+        self._buffers = []
+        # spans of finished threads: (tid, thread name, span)
+        self._finished = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def buffer(self) -> deque:
+        """Span buffer of the current thread"""
+        try:
+            return self._local.buffer
+        except AttributeError:
+            buffer = self._local.buffer = deque(maxlen=self.capacity)
+            with self._lock:
+                self._fold_finished()
+                self._buffers.append((threading.current_thread(), buffer))
+            return buffer
+
+    def _fold_finished(self) -> None:
+        alive = []
+        for (thread, buffer) in self._buffers:
+            if thread.is_alive():
+                alive.append((thread, buffer))
+            else:
+                self._finished.extend((thread.ident, thread.name, record) for record in buffer)
+        self._buffers = alive
+
+    def span(self, name: str, category: str = 'PlantStation', args: dict = None) -> _Span:
+        return _Span(self.buffer(), name, category, args)
+
+    def spans(self) -> [(int, str, tuple)]:
+        """
+        Recorded spans: (thread id, thread name, (name, category, begin ns, end ns, args))
+        """
+        with self._lock:
+            self._fold_finished()
+            spans = list(self._finished)
+            for (thread, buffer) in self._buffers:
+                # copy is atomic, the owner thread may append meanwhile
+                spans.extend((thread.ident, thread.name, record) for record in buffer.copy())
+        return spans
+
+    def to_chrome_trace(self) -> dict:
+        """
+        Converts spans into Chrome trace event format, one track per thread
+
+        Returns:
+            dict: ready to be dumped as JSON
+        """
+        events = []
+        names = {}
+        for (tid, thread_name, (name, category, begin, end, args)) in self.spans():
+            names[tid] = thread_name
+            event = {'name': name, 'cat': category, 'ph': 'X', 'pid': 1, 'tid': tid,
+                     'ts': (begin - self._origin) / 1e3, 'dur': (end - begin) / 1e3}
+            if args:
+                event['args'] = args
+            events.append(event)
+        for (tid, thread_name) in names.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': thread_name}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump_chrome_trace(self, file) -> None:
+        """
+        Writes Chrome trace JSON
+
+        Args:
+            file: path or text file object
+        """
+        if hasattr(file, 'write'):
+            json.dump(self.to_chrome_trace(), file)
+        else:
+            with open(file, 'w') as trace_file:
+                json.dump(self.to_chrome_trace(), trace_file)
+
+
+def enable(capacity: int = DEFAULT_TRACE_CAPACITY) -> Tracer:
+    """Starts tracing (process wide), returns the tracer"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(capacity)
+    return _tracer
+
+
+def disable() -> None:
+    """Stops tracing, recorded spans are dropped"""
+    global _tracer
+    _tracer = None
+
+
+def tracer() -> Tracer or None:
+    """Active tracer, None if tracing is disabled"""
+    return _tracer
+
+
+def span(name: str, category: str = 'PlantStation', args: dict = None):
+    """Context manager recording a span, no-op while tracing is disabled"""
+    active = _tracer
+    if active is None:
+        return _NULL_SPAN
+    return active.span(name, category, args)
+
+
+def traced(name: str, category: str = 'PlantStation'):
+    """Decorator recording every call of the function as a span"""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            active = _tracer
+            if active is None:
+                return func(*args, **kwargs)
+            with active.span(name, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def dump_on_signal(path, signum: int = signal.SIGUSR1) -> None:
+    """
+    Dumps the trace to path whenever the process receives the signal. Has to be called from the main thread
+    """
+
+    def handler(received, frame):
+        if _tracer is not None:
+            threading.Thread(target=_tracer.dump_chrome_trace, args=(path,), name='PlantStation-Trace').start()
+
+    signal.signal(signum, handler)
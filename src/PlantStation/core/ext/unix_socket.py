@@ -0,0 +1,32 @@
+"""
+Unix domain socket helpers shared by the local servers (control socket, metrics)
+"""
+import socket
+from pathlib import Path
+
+
+def remove_stale_socket(path: Path) -> None:
+    """
+    Removes socket file left behind by a process which is gone
+
+    Args:
+        path (Path): socket path, nothing is done if it doesn't exist
+
+    Raises:
+        OSError: path isn't a socket or a process is still listening on it
+    """
+    if not path.exists():
+        return
+    if not path.is_socket():
+        raise OSError(f'Socket path {path} exists and is not a socket')
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        # nobody listens, the socket is stale
+        pass
+    else:
+        raise OSError(f'Socket {path} is in use by another process')
+    finally:
+        probe.close()
+    path.unlink(missing_ok=True)
@@ -0,0 +1,107 @@
+import bisect
+import datetime
+import itertools
+
+
+class _SortedRun(object):
+    """
+    Items kept sorted by (time, sequence number) keys. Keys are unique, so items are never compared
+
+    Position is found by bisection (O(log n)), but list insert/delete shift the tail, so updates
+    are O(n) memmoves - cheap for the few thousand plants of a station
+    """
+    __slots__ = ('keys', 'items')
+
+    def __init__(self):
+        self.keys = []
+        self.items = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def insert(self, key, item):
+        position = bisect.bisect_left(self.keys, key)
+        self.keys.insert(position, key)
+        self.items.insert(position, item)
+
+    def remove(self, key):
+        position = bisect.bisect_left(self.keys, key)
+        del self.keys[position]
+        del self.items[position]
+
+    def first(self, k: int):
+        return [(key[0], item) for (key, item) in zip(self.keys[:k], self.items[:k])]
+
+    def between(self, start, end):
+        begin = bisect.bisect_left(self.keys, (start,))
+        stop = bisect.bisect_left(self.keys, (end,))
+        return [(key[0], item) for (key, item) in zip(self.keys[begin:stop], self.items[begin:stop])]
+
+
+class WateringIndex(object):
+    """
+    Index of items ordered by their next watering time, globally and per zone
+
+    Lookups (next-k, range) are O(log n + k), updates are O(n) (see :class: _SortedRun).
+    Items without time (inactive) are not indexed. Not thread safe - owner is responsible for locking
+    """
+    _all: _SortedRun
+    _zones: {}
+    _entries: {}
+
+    def __init__(self):
+        self._all = _SortedRun()
+        self._zones = {}
+        self._entries = {}
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._all)
+
+    def __contains__(self, item):
+        return item in self._entries
+
+    @property
+    def zones(self) -> [str]:
+        """Zones with at least one indexed item"""
+        return [zone for (zone, run) in self._zones.items() if len(run)]
+
+    def update(self, item, next_watering: datetime.datetime or None, zone: str = '') -> None:
+        """
+        Inserts or moves item. Item with next_watering None is removed from the index
+        """
+        self.remove(item)
+        if next_watering is None:
+            return
+        key = (next_watering, next(self._sequence))
+        self._entries[item] = (key, zone)
+        self._all.insert(key, item)
+        self._zones.setdefault(zone, _SortedRun()).insert(key, item)
+
+    def remove(self, item) -> None:
+        """Removes item from index (if present)"""
+        entry = self._entries.pop(item, None)
+        if entry is None:
+            return
+        key, zone = entry
+        self._all.remove(key)
+        self._zones[zone].remove(key)
+
+    def _run(self, zone: str or None) -> _SortedRun:
+        if zone is None:
+            return self._all
+        return self._zones.get(zone) or _SortedRun()
+
+    def next_watering(self, zone: str = None) -> (datetime.datetime, object) or None:
+        """Earliest (time, item) pair or None if there is nothing indexed"""
+        first = self._run(zone).first(1)
+        return first[0] if first else None
+
+    def next_k(self, k: int, zone: str = None) -> [(datetime.datetime, object)]:
+        """k earliest (time, item) pairs"""
+        return self._run(zone).first(k)
+
+    def between(self, start: datetime.datetime, end: datetime.datetime,
+                zone: str = None) -> [(datetime.datetime, object)]:
+        """(time, item) pairs with start <= time < end"""
+        return self._run(zone).between(start, end)
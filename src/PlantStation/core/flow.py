@@ -0,0 +1,140 @@
+import itertools
+import threading
+
+import numpy as np
+from gpiozero import InputDevice
+
+
+class FlowCalibration(object):
+    """
+    Pump calibration table - volume delivered after given pumping time
+
+    Volumes between measured points are interpolated linearly, above the last point
+    the last measured flow rate is used
+    """
+    _seconds: np.ndarray
+    _volumes: np.ndarray
+
+    def __init__(self, points: [(float, float)]):
+        """
+        Args:
+            points ([(float, float)]): measured (seconds, millilitres) pairs
+        """
+        points = sorted(points)
+        if not points:
+            raise ValueError('Calibration needs at least one point')
+        seconds = np.array([0.0] + [float(point[0]) for point in points])
+        volumes = np.array([0.0] + [float(point[1]) for point in points])
+        if np.any(np.diff(seconds) <= 0) or np.any(np.diff(volumes) <= 0):
+            raise ValueError('Calibration points have to be positive and increasing')
+        self._seconds = seconds
+        self._volumes = volumes
+
+    def __str__(self):
+        return ', '.join(f'{s:g}:{v:g}' for (s, v) in zip(self._seconds[1:], self._volumes[1:]))
+
+    @classmethod
+    def parse(cls, calibration_str: str):
+        """Parses calibration table written as 'seconds:millilitres, ...' (e.g. '5:40, 10:95')"""
+        try:
+            points = [tuple(map(float, point.split(':'))) for point in calibration_str.split(',')]
+        except ValueError:
+            raise ValueError('String does not match proper pattern')
+        if any(len(point) != 2 for point in points):
+            raise ValueError('String does not match proper pattern')
+        return cls(points)
+
+    @property
+    def flow_rate(self) -> float:
+        """Flow rate (ml/s) between the last two points"""
+        return (self._volumes[-1] - self._volumes[-2]) / (self._seconds[-1] - self._seconds[-2])
+
+    def duration_for(self, volume: float) -> float:
+        """Pumping time (seconds) needed to deliver volume (ml)"""
+        if volume <= self._volumes[-1]:
+            return float(np.interp(volume, self._volumes, self._seconds))
+        return float(self._seconds[-1] + (volume - self._volumes[-1]) / self.flow_rate)
+
+    def volume_for(self, duration: float) -> float:
+        """Volume (ml) delivered in given pumping time (seconds)"""
+        if duration <= self._seconds[-1]:
+            return float(np.interp(duration, self._seconds, self._volumes))
+        return float(self._volumes[-1] + (duration - self._seconds[-1]) * self.flow_rate)
+
+
+class FlowMeter(object):
+    """
+    Pulse counting flow meter (e.g. hall sensor) connected to an input pin
+
+    Pulses are counted in the pin's edge callback directly (plain InputDevice, so there is
+    no device event machinery and no other callback on the pin), the callback only
+    increments a counter and compares it with the target, so several meters can be
+    counted at high pulse rates. Meters are normally created by
+    :meth: PinManager.create_flow_meter, which reserves the pin
+    """
+    _device: InputDevice
+    _pulses_per_litre: float
+
+    def __init__(self, pin: str, pulses_per_litre: float, pin_factory=None):
+        """
+        Args:
+            pin (str): input pin
+            pulses_per_litre (float): meter's K-factor
+            pin_factory: gpiozero pin factory
+        """
+        if pulses_per_litre <= 0:
+            raise ValueError('Pulses per litre must be positive')
+        self._pulses_per_litre = pulses_per_litre
+        self._device = InputDevice(pin, pull_up=True, pin_factory=pin_factory)
+        self._counter = itertools.count(1)
+        self._count = 0
+        self._target = float('inf')
+        self._reached = threading.Event()
+        self._device.pin.edges = 'rising'
+        self._device.pin.when_changed = self._pulse
+
+    def _pulse(self, ticks, state):
+        count = self._count = next(self._counter)
+        if count >= self._target:
+            self._reached.set()
+
+    @property
+    def pin(self):
+        return self._device.pin
+
+    @property
+    def closed(self) -> bool:
+        return self._device.closed
+
+    @property
+    def pulses(self) -> int:
+        """Pulses counted since the last reset"""
+        return self._count
+
+    @property
+    def volume(self) -> float:
+        """Volume (ml) measured since the last reset"""
+        return self._count * 1000 / self._pulses_per_litre
+
+    def reset(self, target_volume: float = None) -> None:
+        """
+        Resets counter
+
+        Args:
+            target_volume (float): volume (ml) after which :meth: wait returns
+        """
+        self._target = float('inf')
+        self._reached.clear()
+        self._counter = itertools.count(1)
+        self._count = 0
+        if target_volume is not None:
+            self._target = target_volume * self._pulses_per_litre / 1000
+            if self._target <= 0:
+                self._reached.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Waits until target volume is delivered, returns False on timeout"""
+        return self._reached.wait(timeout)
+
+    def close(self) -> None:
+        self._device.close()
@@ -1,20 +1,24 @@
 import re
 import datetime
 
+from ..ext.cron import CronRule, CRON_PREFIX
+
 gpio_regex = re.compile(r'((BOARD)|(GPIO))\d{1,2}$')
 
 datetime_regex = re.compile(r'((?P<days>\d{1,2})D) ((?P<hours>\d{2}):)((?P<minutes>\d{2}):)(?P<seconds>\d{2})$')
 
 
-def parse_time(time_str: str) -> datetime.timedelta or None:
+def parse_time(time_str: str) -> datetime.timedelta or CronRule:
     """Parses time to project's time format
 
     Args:
-        time_str (str): Datetime in string format: DD HH:MM:SS
+        time_str (str): Datetime in string format: DD HH:MM:SS or calendar rule: cron: M H DoM Mon DoW
 
     Returns:
-        datetime.timedelta: converted result
+        datetime.timedelta: converted result (CronRule for calendar rules)
     """
+    if time_str.strip().lower().startswith(CRON_PREFIX):
+        return CronRule(time_str)
     parts = datetime_regex.match(time_str)
     if not parts:
         raise ValueError('String does not match proper pattern')
@@ -0,0 +1,163 @@
+import datetime
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_JOURNAL_DEPTH = 32
+_NAT = np.datetime64('NaT', 's')
+
+
+class WateringJournal(object):
+    """
+    Recent waterings of every plant
+
+    Each plant owns a row of fixed-size ring buffers (time, duration, volume), rows of all
+    plants form 2D arrays, so the whole history can be processed at once
+
+    With a journal file, waterings are restored on start and written by save(), so tuning
+    doesn't start from scratch after a restart
+    """
+    _path: Path = None
+    _dirty = False
+    _rows: {}
+    _times: np.ndarray
+    _durations: np.ndarray
+    _volumes: np.ndarray
+    _heads: np.ndarray
+
+    def __init__(self, depth: int = DEFAULT_JOURNAL_DEPTH, capacity: int = 16, path: Path = None):
+        """
+        Parameters
+        ----------
+        depth : int
+            number of remembered waterings per plant
+        capacity : int
+            initial number of rows
+        path : Path
+            journal file, None to keep the waterings in memory only
+        """
+        self._depth = depth
+        self._rows = {}
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger('PlantStation').getChild('Journal')
+        self._times = np.full((capacity, depth), _NAT)
+        self._durations = np.full((capacity, depth), np.nan, dtype=np.float32)
+        self._volumes = np.full((capacity, depth), np.nan, dtype=np.float32)
+        self._heads = np.zeros(capacity, dtype=np.int64)
+        if path is not None:
+            self._path = Path(path)
+            self._save_lock = threading.Lock()
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self._path) as journal_file:
+                state = json.load(journal_file)
+            for (plant_name, waterings) in state.items():
+                for (time, duration, volume) in waterings:
+                    self.record(plant_name, datetime.datetime.fromisoformat(time), duration, volume)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError, AttributeError) as err:
+            self._logger.error('Couldn\'t read watering journal %s: %s', self._path, err)
+        self._dirty = False
+
+    def _state(self) -> dict:
+        with self._lock:
+            names = list(self._rows)
+        times, durations, volumes = self.history(names)
+        state = {}
+        for (row, name) in enumerate(names):
+            known = ~np.isnat(times[row])
+            state[name] = [[time.astype(datetime.datetime).isoformat(),
+                            None if np.isnan(duration) else float(duration),
+                            None if np.isnan(volume) else float(volume)]
+                           for (time, duration, volume) in zip(times[row][known], durations[row][known],
+                                                               volumes[row][known])]
+        return state
+
+    def save(self) -> None:
+        """Writes the journal to its file if it changed since the last save"""
+        if self._path is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+            temporary = self._path.with_name(self._path.name + '.tmp')
+            try:
+                with open(temporary, 'w') as journal_file:
+                    json.dump(self._state(), journal_file)
+                os.replace(temporary, self._path)
+            except OSError as err:
+                self._logger.error('Couldn\'t save watering journal %s: %s', self._path, err)
+
+    def _row(self, plant_name: str) -> int:
+        row = self._rows.get(plant_name)
+        if row is None:
+            row = self._rows[plant_name] = len(self._rows)
+            if row == len(self._heads):
+                self._grow()
+        return row
+
+    def _grow(self):
+        capacity = 2 * len(self._heads)
+        for (name, fill) in (('_times', _NAT), ('_durations', np.nan), ('_volumes', np.nan)):
+            old = getattr(self, name)
+            new = np.full((capacity, self._depth), fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        heads = np.zeros(capacity, dtype=np.int64)
+        heads[:len(self._heads)] = self._heads
+        self._heads = heads
+
+    def record(self, plant_name: str, time: datetime.datetime, duration: float, volume: float = None) -> None:
+        """
+        Stores watering
+
+        Parameters
+        ----------
+        plant_name : str
+        time : datetime.datetime
+            end of watering
+        duration : float
+            pumping time in seconds
+        volume : float
+            delivered volume in ml, if known
+        """
+        with self._lock:
+            row = self._row(plant_name)
+            column = self._heads[row] % self._depth
+            self._times[row, column] = np.datetime64(time, 's')
+            self._durations[row, column] = np.nan if duration is None else duration
+            self._volumes[row, column] = np.nan if volume is None else volume
+            self._heads[row] += 1
+            self._dirty = True
+
+    def history(self, plant_names: [str]) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Waterings of given plants, each row sorted by time (missing entries are NaT/NaN at the end)
+
+        Returns
+        -------
+        (times, durations, volumes) arrays of shape (len(plant_names), depth)
+        """
+        with self._lock:
+            rows = [self._rows.get(name, -1) for name in plant_names]
+            times = np.full((len(rows), self._depth), _NAT)
+            durations = np.full((len(rows), self._depth), np.nan, dtype=np.float32)
+            volumes = np.full((len(rows), self._depth), np.nan, dtype=np.float32)
+            known = np.array([row >= 0 for row in rows], dtype=bool)
+            if known.any():
+                indexes = np.array(rows)[known]
+                times[known] = self._times[indexes]
+                durations[known] = self._durations[indexes]
+                volumes[known] = self._volumes[indexes]
+        order = np.argsort(times, axis=1)
+        return (np.take_along_axis(times, order, 1), np.take_along_axis(durations, order, 1),
+                np.take_along_axis(volumes, order, 1))
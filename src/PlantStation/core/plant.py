@@ -1,7 +1,6 @@
 import datetime
 import logging
 import threading
-import time
 from datetime import timedelta, datetime
 from functools import wraps
 from typing import Callable
@@ -9,9 +8,17 @@ from typing import Callable
 from gpiozero import DigitalOutputDevice, GPIOZeroError
 
 from .config import EnvironmentConfig
-from .ext import Interval, Duration
+from .ext import Interval, Duration, clock
+from .ext.cron import CronRule
+from .ext.metrics import Counter, Histogram
+from .ext.tracing import span
+from .flow import FlowCalibration, FlowMeter
 from .helpers.format_validators import is_gpio
 
+WATERINGS = Counter('plantstation_waterings_total', 'Watering attempts by result (watered, rejected, inactive, error)',
+                    ('environment', 'result'))
+WATERING_DURATION = Histogram('plantstation_watering_duration_seconds', 'Pumping time of waterings',
+                              ('environment',), buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300, 600))
 
 class Plant(object):
     """Representation of a plant
@@ -37,20 +44,30 @@ class Plant(object):
     """
     _plantName: str
     _wateringDuration: Duration
-    _wateringInterval: Interval
+    _wateringInterval: Interval or CronRule
     _lastTimeWatered: datetime
 
     _envConfig: EnvironmentConfig
     _logger: logging.Logger
     _gpioPinNumber: str
-    _pumpSwitch: DigitalOutputDevice
+    _pumpSwitch: DigitalOutputDevice = None
     _relatedTask = None
     _isActive = False
+    _zone = ''
+    _wateringVolume: float = None
+    _flowCalibration: FlowCalibration = None
+    _flowMeter: FlowMeter = None
+    _flowMeterPin: str = None
+    _lastWateringDuration: float = None
+    _wateringStarted: float = None
+    _wateringTarget: float = None
 
     _infoLock: threading.RLock
 
     def __init__(self, plantName: str, envConfig: EnvironmentConfig, gpioPinNumber: str, wateringDuration: timedelta,
-                 wateringInterval: timedelta, lastTimeWatered: datetime = datetime.min, isActive=True):
+                 wateringInterval: timedelta or CronRule, lastTimeWatered: datetime = datetime.min, isActive=True,
+                 zone: str = '', wateringVolume: float = None, flowCalibration: FlowCalibration = None,
+                 flowMeterPin: str = None, pulsesPerLitre: float = None):
         """
         Args:
             plantName (str): Plant name
@@ -58,42 +75,98 @@ class Plant(object):
             gpioPinNumber (str): GPIO number, either BOARDXX or GPIOXX where
                 XX is a pin number
             wateringDuration (timedelta): How long should the plant be watered?
-            wateringInterval (timedelta): Time between watering
+            wateringInterval (timedelta or CronRule): Time between watering or calendar rule of waterings
             lastTimeWatered (datetime): When plant was watered last time?
+            zone (str): Name of the zone the plant belongs to (optional)
+            wateringVolume (float): Volume (ml) delivered by watering. Requires flow calibration
+                or flow meter, watering duration becomes the upper limit of pumping time
+            flowCalibration (FlowCalibration): Pump's calibration table
+            flowMeterPin (str): Input pin of flow meter - pump is stopped once the volume is delivered
+            pulsesPerLitre (float): Flow meter's K-factor
         """
         # Check if data is correct
         if None in [plantName, envConfig, gpioPinNumber, wateringDuration, wateringInterval]:
             raise KeyError()
         if plantName == '':
             raise ValueError()
-        if datetime.now() < lastTimeWatered:
+        if clock.now() < lastTimeWatered:
             raise ValueError('Last time watered is in future')
         if wateringDuration <= timedelta():
             raise ValueError("Watering duration is negative or equal to 0")
-        if wateringInterval <= timedelta():
+        if not isinstance(wateringInterval, CronRule) and wateringInterval <= timedelta():
             raise ValueError("Watering interval is negative or equal to 0")
         if not is_gpio(gpioPinNumber):
             raise ValueError('Wrong GPIO value')
+        if wateringVolume is not None:
+            if wateringVolume <= 0:
+                raise ValueError('Watering volume is negative or equal to 0')
+            if flowCalibration is None and flowMeterPin is None:
+                raise ValueError('Watering volume requires flow calibration or flow meter')
+        if flowMeterPin is not None and (pulsesPerLitre is None or not is_gpio(flowMeterPin)):
+            raise ValueError('Flow meter requires input pin and pulses per litre')
 
         # set all attributes
         self._infoLock = threading.RLock()
+        self._listeners = []
+        self._guards = []
         self._envConfig = envConfig
 
         self._plantName = plantName
         self._lastTimeWatered: datetime.datetime = lastTimeWatered
         self._wateringDuration = Duration.convert_to_duration(wateringDuration)
-        self._wateringInterval = Interval.convert_to_interval(wateringInterval)
+        self._wateringInterval = self._to_interval(wateringInterval)
 
         self._gpioPinNumber = gpioPinNumber
+        self._zone = zone or ''
+        self._wateringVolume = wateringVolume
+        self._flowCalibration = flowCalibration
         self._logger = self._envConfig.logger.getChild(self._plantName)
+
+        # reserve pin - the handle is kept until plant is closed
+        self._pinOwner = (self._plantName, id(self))
+        try:
+            self._pumpSwitch = self._envConfig.pin_manager.create_pump(self._gpioPinNumber, owner=self._pinOwner,
+                                                                       group=self._envConfig.env_name)
+        except GPIOZeroError as exc:
+            self._envConfig.logger.error('Couldn\'t set up gpio pin: %s', self._gpioPinNumber)
+            raise exc
+        if flowMeterPin is not None:
+            try:
+                self._flowMeter = self._envConfig.pin_manager.create_flow_meter(flowMeterPin, pulsesPerLitre,
+                                                                                owner=self._pinOwner)
+                self._flowMeterPin = flowMeterPin
+            except GPIOZeroError as exc:
+                self._envConfig.logger.error('Couldn\'t set up flow meter pin: %s', flowMeterPin)
+                self.close()
+                raise exc
         self.isActive = isActive
 
-        self._envConfig.logger.debug(
-            f'Creating successful. Last time watered: {self._lastTimeWatered}. Interval: {self._wateringInterval}. '
-            f'Pin: {self._gpioPinNumber}')
+        self._envConfig.logger.debug('Creating successful. Last time watered: %s. Interval: %s. Pin: %s',
+                                     self._lastTimeWatered, self._wateringInterval, self._gpioPinNumber)
 
     def __del__(self):
-        self._pumpSwitch.close()
+        if self._pumpSwitch is not None:
+            self.close()
+
+    def close(self) -> None:
+        """
+            Releases plant's pin handle. Plant can't be watered afterwards
+        """
+        with self._infoLock:
+            if self._pumpSwitch is None:
+                return
+            self._isActive = False
+            (switch, self._pumpSwitch) = (self._pumpSwitch, None)
+        # watering in progress is cut short, finish_watering() still records it
+        if not switch.closed:
+            try:
+                if switch.value:
+                    switch.off()
+            except GPIOZeroError:
+                self._logger.error('%s: GPIO error', self._plantName)
+        self._envConfig.pin_manager.release_pump(self._gpioPinNumber)
+        if self._flowMeterPin is not None:
+            self._envConfig.pin_manager.release_pin(self._flowMeterPin)
 
     def __dir__(self):
         packed = [
@@ -102,16 +175,53 @@ class Plant(object):
             'wateringInterval',
             'lastTimeWatered',
             'gpioPinNumber',
-            'isActive'
+            'isActive',
+            'zone'
         ]
         return packed
 
+    def add_listener(self, callback: Callable) -> None:
+        """
+            Registers callback(plant) called after watering schedule related attributes change
+        """
+        with self._infoLock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable) -> None:
+        with self._infoLock:
+            self._listeners.remove(callback)
+
+    def add_guard(self, callback: Callable) -> None:
+        """
+            Registers callback(plant, duration, volume) asked before pump is turned on,
+            watering is skipped if any of guards returns False
+        """
+        with self._infoLock:
+            self._guards.append(callback)
+
+    def remove_guard(self, callback: Callable) -> None:
+        with self._infoLock:
+            self._guards.remove(callback)
+
+    def _allowed(self, duration: float, volume: float or None) -> bool:
+        with self._infoLock:
+            guards = list(self._guards)
+        return all(guard(self, duration, volume) for guard in guards)
+
+    def _notify(self) -> None:
+        # called without info lock, so listeners may take their own locks
+        with self._infoLock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            callback(self)
+
     def _update_config(propertySetter: Callable):
         @wraps(propertySetter)
         def _property_modifier(self, *args, **kwargs):
             with self._infoLock:
                 propertySetter(self, *args, **kwargs)
                 self._envConfig.update_plant_section(self)
+            self._notify()
 
         return _property_modifier
 
@@ -143,9 +253,15 @@ class Plant(object):
         with self._infoLock:
             self._wateringDuration = Duration.convert_to_duration(value)
 
+    @staticmethod
+    def _to_interval(value: timedelta or CronRule) -> Interval or CronRule:
+        if isinstance(value, CronRule):
+            return value
+        return Interval.convert_to_interval(value)
+
     @property
-    def wateringInterval(self) -> timedelta:
-        """Interval between waterings
+    def wateringInterval(self) -> timedelta or CronRule:
+        """Interval between waterings or calendar rule of waterings
 
         """
         with self._infoLock:
@@ -153,9 +269,9 @@ class Plant(object):
 
     @wateringInterval.setter
     @_update_config
-    def wateringInterval(self, value: timedelta):
+    def wateringInterval(self, value: timedelta or CronRule):
         with self._infoLock:
-            self.wateringInterval = Interval.convert_to_interval(value)
+            self._wateringInterval = self._to_interval(value)
 
     @property
     def lastTimeWatered(self) -> datetime:
@@ -170,6 +286,53 @@ class Plant(object):
         with self._infoLock:
             return self._gpioPinNumber
 
+    @property
+    def wateringVolume(self) -> float or None:
+        """
+        Volume (ml) delivered by watering, None if plant is watered by duration
+        """
+        with self._infoLock:
+            return self._wateringVolume
+
+    @property
+    def lastWateringDuration(self) -> float or None:
+        """
+        Pumping time (seconds) of the last watering, None if plant wasn't watered since start
+        """
+        with self._infoLock:
+            return self._lastWateringDuration
+
+    @property
+    def flowMeter(self) -> FlowMeter or None:
+        return self._flowMeter
+
+    def planned_duration(self) -> float:
+        """
+        Pumping time (seconds) of the next watering. In closed loop mode it's the upper limit
+        """
+        with self._infoLock:
+            if self._wateringVolume is not None and self._flowMeter is None:
+                return self._flowCalibration.duration_for(self._wateringVolume)
+            if self._wateringVolume is not None and self._flowCalibration is not None:
+                # closed loop - allow twice the calibrated time, but at least watering duration
+                return max(2 * self._flowCalibration.duration_for(self._wateringVolume),
+                           self._wateringDuration.total_seconds())
+            return self._wateringDuration.total_seconds()
+
+    @property
+    def zone(self) -> str:
+        """
+        Zone the plant belongs to, empty if none
+        """
+        with self._infoLock:
+            return self._zone
+
+    @zone.setter
+    @_update_config
+    def zone(self, value: str) -> None:
+        with self._infoLock:
+            self._zone = value or ''
+
     @property
     def isActive(self):
         with self._infoLock:
@@ -182,17 +345,15 @@ class Plant(object):
             if self._isActive == value:
                 return
             elif value:
-                # define pump
-                try:
-                    self._pumpSwitch = self._envConfig.pin_manager.create_pump(self._gpioPinNumber)
-                    self._envConfig.logger.info(f'Pump activated')
-                    self._isActive = value
-                except GPIOZeroError as exc:
-                    self._envConfig.logger.error(f'Couldn\'t set up gpio pin: {self._gpioPinNumber}')
-                    raise exc
+                # reuse pump handle
+                if self._pumpSwitch is None:
+                    raise ValueError('Plant is closed')
+                self._isActive = value
+                self._envConfig.logger.info('Pump activated')
             else:
-                self._pumpSwitch.close()
-                self._envConfig.logger.info(f'Pump deactivated')
+                self._isActive = value
+                self._pumpSwitch.off()
+                self._envConfig.logger.info('Pump deactivated')
 
     @property
     def relatedTask(self):
@@ -204,43 +365,122 @@ class Plant(object):
         with self._infoLock:
             self._relatedTask = value
 
-    def water(self) -> None:
+    def start_watering(self, scale: float = 1.0) -> float or None:
+        """
+            Turns the pump on (obtains pump lock, may block). Has to be followed by :meth: finish_watering,
+            the caller keeps the pump running for the returned time (see :meth: water)
+
+        Args:
+            scale (float): fraction of planned duration (and volume) to deliver, used when load is shed
+
+        Returns:
+            float: planned pumping time in seconds, None if plant is inactive or watering was rejected
+                by a guard (e.g. budget)
+        """
+        if not self.isActive:
+            self._logger.info('Water: Pump is not active')
+            WATERINGS.labels(self._envConfig.env_name, 'inactive').inc()
+            return None
+        duration = self.planned_duration() * scale
+        volume = self.wateringVolume
+        if volume is not None:
+            volume *= scale
+        expected_volume = volume
+        if expected_volume is None and self._flowCalibration is not None:
+            expected_volume = self._flowCalibration.volume_for(duration)
+        if not self._allowed(duration, expected_volume):
+            self._logger.info('%s: Watering rejected', self._plantName)
+            WATERINGS.labels(self._envConfig.env_name, 'rejected').inc()
+            return None
+        self._wateringTarget = volume
+        self._wateringStarted = clock.monotonic()
+        self._logger.info('%s: Started watering', self._plantName)
+        if self._flowMeter is not None:
+            self._flowMeter.reset(volume)
+        try:
+            self._pumpSwitch.on()
+        except GPIOZeroError:
+            self._logger.error('%s: GPIO error', self._plantName)
+            self._abort_watering()
+            raise
+        return duration
+
+    def _abort_watering(self) -> None:
+        # pump is switched off and its slot released, nothing is recorded as watered
+        try:
+            self._pumpSwitch.off()
+        except GPIOZeroError:
+            self._logger.error('%s: Couldn\'t switch the pump off', self._plantName)
+        WATERINGS.labels(self._envConfig.env_name, 'error').inc()
+
+    def finish_watering(self) -> float:
+        """
+            Turns the pump off and records the watering
+
+        Returns:
+            float: pumping time in seconds
+        """
+        switch = self._pumpSwitch
+        # plant closed meanwhile switched the pump off already
+        if switch is not None:
+            switch.off()
+        with self._infoLock:
+            self._lastTimeWatered = clock.now()
+            self._lastWateringDuration = clock.monotonic() - self._wateringStarted
+        self._logger.info('%s: Stopped watering', self._plantName)
+        WATERINGS.labels(self._envConfig.env_name, 'watered').inc()
+        WATERING_DURATION.labels(self._envConfig.env_name).observe(self._lastWateringDuration)
+        self._notify()
+        return self._lastWateringDuration
+
+    def water(self, scale: float = 1.0) -> bool:
         """
             Waters plant. Obtains pump lock (EnvironmentConfig specifies max number of simultanously working pumps).
             Blocks thread until plant is watered
+
+        Args:
+            scale (float): fraction of planned duration (and volume) to deliver, used when load is shed
+
+        Returns:
+            bool: False if plant is inactive or watering was rejected by a guard (e.g. budget)
         """
-        if self.isActive:
+        with span('water', 'plant', {'plant': self._plantName}):
+            duration = self.start_watering(scale)
+            if duration is None:
+                return False
+            volume = self._wateringTarget
             try:
-                self._logger.info(f'{self._plantName}: Started watering')
-                self._pumpSwitch.on()
-                time.sleep(self.wateringDuration.total_seconds())
-            except GPIOZeroError as exc:
-                self._logger.error(f'{self._plantName}: GPIO error')
-                raise exc
+                if self._flowMeter is not None and volume is not None:
+                    if not self._flowMeter.wait(duration):
+                        self._logger.warning('%s: Target volume not delivered in %.1f s (%.0f of %.0f ml)',
+                                             self._plantName, duration, self._flowMeter.volume, volume)
+                else:
+                    clock.sleep(duration)
+            except GPIOZeroError:
+                self._logger.error('%s: GPIO error', self._plantName)
+                raise
             finally:
-                self._pumpSwitch.off()
-                with self._infoLock:
-                    self._lastTimeWatered = datetime.now()
-                self._logger.info(f'{self._plantName}: Stopped watering')
-        else:
-            self._logger.info(f'Water: Pump is not active')
+                self.finish_watering()
+            return True
 
-    def should_water(self) -> bool:
+    def should_water(self, now: datetime = None) -> bool:
         """Checks if it is right to water plant now
 
+        Args:
+            now (datetime): time of the check, defaults to now
         """
-        self._logger.debug(
-            f'Time now: {datetime.now()}. Planned watering: {self._lastTimeWatered + self._wateringInterval}')
-        if datetime.now() >= self._lastTimeWatered + self._wateringInterval:
-            self._logger.info("%s: It's right to water me now!", self._plantName)
-            return True
-        else:
-            self._logger.info("%s: Give me some time, water me later", self._plantName)
-            return False
+        if now is None:
+            now = clock.now()
+        planned = self.calc_next_watering()
+        self._logger.debug('Time now: %s. Planned watering: %s', now, planned)
+        return now >= planned
 
     def calc_next_watering(self) -> datetime:
         """Calculate next watering date
 
         :return: watering datetime
         """
-        return self._lastTimeWatered + self._wateringInterval
+        with self._infoLock:
+            if isinstance(self._wateringInterval, CronRule):
+                return self._wateringInterval.next_fire(self._lastTimeWatered)
+            return self._lastTimeWatered + self._wateringInterval
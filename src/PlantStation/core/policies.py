@@ -0,0 +1,175 @@
+import datetime
+import logging
+import math
+import threading
+
+from .ext import clock
+
+DEFAULT_CATCH_UP_WINDOW = 300
+DEFAULT_CATCH_UP_RATE = 4
+
+_DAY = datetime.timedelta(days=1)
+
+
+class CatchUpPolicy(object):
+    """
+    Staggers waterings which were already overdue when the environment started
+
+    After an outage (or on first start, when plants were never watered) every plant is due at once.
+    Such catch-up waterings are ordered by urgency and spread over the catch-up window, with at most
+    `rate` of them starting per minute. Waterings which became due after the start are not delayed.
+    """
+    window: datetime.timedelta
+    rate: int
+    started: datetime.datetime
+    _next_start: datetime.datetime or None
+
+    def __init__(self, window: datetime.timedelta, rate: int, started: datetime.datetime = None):
+        """
+        Args:
+            window (timedelta): time the overdue plants are spread over, 0 to not spread
+            rate (int): max catch-up waterings started per minute, 0 for no limit
+            started (datetime): start of the environment, plants planned before are catching up
+        """
+        self.window = window
+        self.rate = rate
+        self.started = started or clock.now()
+        self._next_start = None
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return self.window > datetime.timedelta(0) or self.rate > 0
+
+    @staticmethod
+    def urgency(plant, now: datetime.datetime) -> float:
+        """Overdue time in plant's watering intervals (days for calendar rules), infinite if never watered"""
+        if plant.lastTimeWatered == datetime.datetime.min:
+            return math.inf
+        interval = plant.wateringInterval
+        if not isinstance(interval, datetime.timedelta):
+            interval = _DAY
+        return (now - plant.calc_next_watering()) / interval
+
+    def schedule(self, plants: [], now: datetime.datetime = None) -> [(object, datetime.timedelta)]:
+        """
+        Assigns start delays to due plants
+
+        Args:
+            plants ([Plant]): plants due at `now`
+            now (datetime): time of the check, defaults to now
+
+        Returns:
+            [(Plant, timedelta)]: plants with delays, the most urgent catch-up waterings first
+        """
+        if now is None:
+            now = clock.now()
+        if not self:
+            return [(plant, datetime.timedelta(0)) for plant in plants]
+        overdue = []
+        planned = []
+        for plant in plants:
+            if plant.calc_next_watering() < self.started:
+                overdue.append(plant)
+            else:
+                planned.append((plant, datetime.timedelta(0)))
+        if not overdue:
+            return planned
+        overdue.sort(key=lambda plant: self.urgency(plant, now), reverse=True)
+        spacing = self.window / len(overdue)
+        if self.rate > 0:
+            spacing = max(spacing, datetime.timedelta(minutes=1) / self.rate)
+        with self._lock:
+            start = max(now, self._next_start or now)
+            self._next_start = start + spacing * len(overdue)
+        return [(plant, start + spacing * position - now) for (position, plant) in enumerate(overdue)] + planned
+
+
+DEFAULT_SATURATION_POLICY = 'merge'
+SATURATION_POLICIES = ('merge', 'shorten', 'defer')
+DEFAULT_PRIORITY = 0
+
+
+class SaturationPolicy(object):
+    """
+    Compares watering demand with pumping capacity and sheds load once demand exceeds it
+
+    Demand is the pumping time (seconds per day) of all scheduled plants, capacity is the pump limit
+    times the time outside of blackout windows. Saturation level is their ratio. When it's above 1:
+        - merge: periods of all plants are stretched by the saturation level - a due plant which was
+          watered less than `level` periods ago skips the watering, so it merges into the next one.
+          Waterings keep their length, but happen less often
+        - shorten: all waterings are shortened proportionally, so the demand fits the capacity
+        - defer: plants with the lowest priority skip their waterings until the rest fits
+    """
+    mode: str
+    level: float
+    scale: float
+    backlog: int
+    _deferred: set
+
+    def __init__(self, mode: str = DEFAULT_SATURATION_POLICY, logger: logging.Logger = None):
+        if mode not in SATURATION_POLICIES:
+            raise ValueError(f'Unknown saturation policy: {mode}')
+        self.mode = mode
+        self.level = 0.0
+        self.scale = 1.0
+        self.backlog = 0
+        self._deferred = set()
+        self._logger = logger or logging.getLogger('PlantStation').getChild('Saturation')
+
+    @property
+    def saturated(self) -> bool:
+        return self.level > 1
+
+    def assess(self, total: float, capacity: float, backlog: int = 0, demands=None) -> None:
+        """
+        Updates saturation level and decides what to shed
+
+        Args:
+            total (float): demand of all plants (pumping seconds per day)
+            capacity (float): pumping seconds per day available
+            backlog (int): number of waterings queued at the moment
+            demands: callable returning plants with their demand and priority [(Plant, float, int)],
+                called only when the defer policy has to pick plants
+        """
+        level = total / capacity if capacity > 0 else (math.inf if total > 0 else 0.0)
+        if (level > 1) != self.saturated:
+            if level > 1:
+                self._logger.warning('Watering demand exceeds capacity %.0f%% (%s policy)', 100 * level, self.mode)
+            else:
+                self._logger.info('Watering demand fits capacity again (%.0f%%)', 100 * level)
+        self.level = level
+        self.backlog = backlog
+        self.scale = min(1.0, 1 / level) if self.mode == 'shorten' and level > 1 else 1.0
+        deferred = set()
+        if self.mode == 'defer' and level > 1 and demands is not None:
+            # shed the least important (and within the same priority the most demanding) plants first
+            for (plant, demand, _) in sorted(demands(), key=lambda item: (item[2], -item[1])):
+                if total <= capacity:
+                    break
+                deferred.add(plant)
+                total -= demand
+        self._deferred = deferred
+
+    def _merged(self, plant, now: datetime.datetime) -> bool:
+        # the watering merges into the next one unless the plant waited `level` periods already
+        if plant.lastTimeWatered == datetime.datetime.min:
+            return False
+        if math.isinf(self.level):
+            return True
+        interval = plant.wateringInterval
+        if not isinstance(interval, datetime.timedelta):
+            interval = _DAY / interval.fires_per_day if interval.fires_per_day > 0 else _DAY
+        return now - plant.lastTimeWatered < interval * self.level
+
+    def split(self, plants: [], now: datetime.datetime = None) -> ([], []):
+        """Splits due plants into plants to water and plants to defer"""
+        if self.mode == 'merge' and self.saturated:
+            if now is None:
+                now = clock.now()
+            merged = {plant for plant in plants if self._merged(plant, now)}
+        else:
+            merged = self._deferred
+        if not merged:
+            return plants, []
+        return [plant for plant in plants if plant not in merged], [plant for plant in plants if plant in merged]
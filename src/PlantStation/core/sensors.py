@@ -0,0 +1,325 @@
+import datetime
+import logging
+import threading
+
+import numpy as np
+
+from .ext import clock
+
+DEFAULT_SENSOR_PERIOD = 1.0
+DEFAULT_SENSOR_HISTORY = 1440
+DEFAULT_SENSOR_DECIMATION = 60
+DEFAULT_SENSOR_SMOOTHING = 0.1
+DEFAULT_MOISTURE_HYSTERESIS = 0.05
+DEFAULT_WATERING_SPACING = datetime.timedelta(hours=1)
+
+
+class MoistureReader(object):
+    """
+    Reads all configured ADC channels in one pass
+
+    Channels are (device, channel) pairs, where device is SPI chip select
+    """
+    channels: [(int, int)]
+
+    def __init__(self, channels: [(int, int)]):
+        self.channels = list(channels)
+
+    def read(self) -> np.ndarray:
+        """
+        Returns
+        -------
+        array of readings (0 - dry, 1 - wet) in order of channels
+        """
+        raise NotImplementedError
+
+    def watered(self, row: int) -> None:
+        """Called after plant of channel in given row was watered"""
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MCP3008Reader(MoistureReader):
+    """
+    Reads MCP3008 channels with gpiozero, one SPI transfer per channel
+    """
+
+    def __init__(self, channels: [(int, int)], pin_factory, inverted: bool = True):
+        """
+        Parameters
+        ----------
+        channels : [(int, int)]
+            (chip select, channel) pairs
+        pin_factory :
+            gpiozero pin factory
+        inverted : bool = True
+            capacitive probes give higher voltage when the soil is dry
+        """
+        from gpiozero import MCP3008
+        super().__init__(channels)
+        self._inverted = inverted
+        self._devices = [MCP3008(channel=channel, device=device, pin_factory=pin_factory)
+                         for (device, channel) in self.channels]
+
+    def read(self) -> np.ndarray:
+        values = np.fromiter((device.value for device in self._devices), dtype=float, count=len(self._devices))
+        return 1.0 - values if self._inverted else values
+
+    def close(self) -> None:
+        for device in self._devices:
+            device.close()
+
+
+class MockMoistureReader(MoistureReader):
+    """
+    Synthetic readings for dry runs - every channel dries linearly until it's set again
+    """
+
+    def __init__(self, channels: [(int, int)], drying_rate: float = 1e-5, initial: float = 0.6, wet: float = 0.9):
+        """
+        Parameters
+        ----------
+        drying_rate : float
+            moisture lost per second
+        initial : float
+            initial moisture of every channel
+        wet : float
+            moisture right after watering
+        """
+        super().__init__(channels)
+        self._drying_rate = drying_rate
+        self._wet = wet
+        self._values = np.full(len(self.channels), initial)
+        self._time = clock.monotonic()
+
+    def set(self, row: int, value: float) -> None:
+        """Sets moisture of channel in given row (e.g. after watering)"""
+        self._values[row] = value
+
+    def watered(self, row: int) -> None:
+        self.set(row, self._wet)
+
+    def read(self) -> np.ndarray:
+        now = clock.monotonic()
+        self._values = np.clip(self._values - self._drying_rate * (now - self._time), 0.0, 1.0)
+        self._time = now
+        return self._values.copy()
+
+
+class SensorBank(object):
+    """
+    Moisture samples of all plants with sensors
+
+    Every tick all channels are read at once, smoothed with exponential moving average
+    and accumulated. Every `decimation` ticks the mean of accumulated samples is stored
+    in per-plant ring buffers (rows of one 2D array). All per-sample work is vectorised.
+
+    Latest smoothed readings are published by swapping an immutable array, so they
+    can be read without locks.
+    """
+    _rows: {}
+    _reader: MoistureReader
+    _latest: np.ndarray or None
+    _history: np.ndarray
+    _history_time: np.ndarray
+
+    def __init__(self, plants: [str], reader: MoistureReader, history: int = DEFAULT_SENSOR_HISTORY,
+                 decimation: int = DEFAULT_SENSOR_DECIMATION, smoothing: float = DEFAULT_SENSOR_SMOOTHING,
+                 logger: logging.Logger = None):
+        """
+        Parameters
+        ----------
+        plants : [str]
+            plant names in order of reader's channels
+        reader : MoistureReader
+            reader of all channels
+        history : int
+            number of stored (downsampled) samples per plant
+        decimation : int
+            number of ticks averaged into one stored sample
+        smoothing : float
+            weight of the new sample in moving average (0, 1]
+        """
+        if len(plants) != len(reader.channels):
+            raise ValueError('Every plant needs exactly one channel')
+        if not 0 < smoothing <= 1:
+            raise ValueError('Smoothing has to be in (0, 1]')
+        self._rows = {name: row for (row, name) in enumerate(plants)}
+        self._plants = list(plants)
+        self._reader = reader
+        self._decimation = max(1, decimation)
+        self._smoothing = smoothing
+        self._logger = logger or logging.getLogger('PlantStation').getChild('Sensors')
+
+        self._latest = None
+        self._accumulated = np.zeros(len(plants))
+        self._accumulated_count = 0
+        self._history = np.full((len(plants), history), np.nan, dtype=np.float32)
+        self._history_time = np.zeros(history, dtype='datetime64[s]')
+        self._head = 0
+        self._size = 0
+        self._sample_lock = threading.Lock()
+
+    @property
+    def plants(self) -> [str]:
+        return self._plants
+
+    @property
+    def reader(self) -> MoistureReader:
+        return self._reader
+
+    def __contains__(self, plant_name: str):
+        return plant_name in self._rows
+
+    def row(self, plant_name: str) -> int:
+        return self._rows[plant_name]
+
+    def sample(self, now: datetime.datetime = None) -> bool:
+        """
+        Reads all channels and updates smoothed values and history
+
+        Returns
+        -------
+        False if the previous sample is still being taken (tick skipped)
+        """
+        if not self._sample_lock.acquire(blocking=False):
+            self._logger.warning('Sampling overrun, skipping tick')
+            return False
+        try:
+            values = self._reader.read()
+            latest = self._latest
+            if latest is None:
+                smoothed = values.copy()
+            else:
+                smoothed = latest + self._smoothing * (values - latest)
+            smoothed.setflags(write=False)
+            self._latest = smoothed
+
+            self._accumulated += values
+            self._accumulated_count += 1
+            if self._accumulated_count >= self._decimation:
+                self._history[:, self._head] = self._accumulated / self._accumulated_count
+                self._history_time[self._head] = np.datetime64(now or clock.now(), 's')
+                self._head = (self._head + 1) % self._history.shape[1]
+                self._size = min(self._size + 1, self._history.shape[1])
+                self._accumulated[:] = 0
+                self._accumulated_count = 0
+            return True
+        finally:
+            self._sample_lock.release()
+
+    @property
+    def latest(self) -> np.ndarray or None:
+        """Latest smoothed readings of all plants (read-only array, rows as in plants)"""
+        return self._latest
+
+    def latest_of(self, plant_name: str) -> float or None:
+        """Latest smoothed reading of the plant"""
+        latest = self._latest
+        return None if latest is None else float(latest[self._rows[plant_name]])
+
+    def history(self, plant_name: str = None) -> (np.ndarray, np.ndarray):
+        """
+        Stored samples, oldest first
+
+        Parameters
+        ----------
+        plant_name : str
+            plant, all plants (2D array) if None
+
+        Returns
+        -------
+        (timestamps, values)
+        """
+        with self._sample_lock:
+            order = (np.arange(self._size) + self._head - self._size) % self._history.shape[1]
+            times = self._history_time[order]
+            if plant_name is None:
+                return times, self._history[:, order]
+            return times, self._history[self._rows[plant_name], order]
+
+    def watered(self, plant_name: str) -> None:
+        """Passes information about watering to the reader"""
+        self._reader.watered(self._rows[plant_name])
+
+    def close(self) -> None:
+        self._reader.close()
+
+
+class MoisturePolicy(object):
+    """
+    Moisture-threshold watering rule evaluated for all plants with sensors at once
+
+    Plant is due when its smoothed moisture is below threshold, it's armed and the minimal
+    spacing since the last watering elapsed. Triggered plant is disarmed until its moisture
+    rises above threshold + hysteresis. Plants without threshold are never due.
+    Rows are the same as in :class: SensorBank
+    """
+
+    def __init__(self, size: int):
+        self._threshold = np.full(size, np.nan)
+        self._hysteresis = np.zeros(size)
+        self._spacing = np.zeros(size, dtype='timedelta64[us]')
+        self._last_watered = np.full(size, np.datetime64(datetime.datetime.min, 'us'))
+        self._armed = np.ones(size, dtype=bool)
+        self._lock = threading.Lock()
+
+    def configure(self, row: int, threshold: float, hysteresis: float, spacing: datetime.timedelta) -> None:
+        """Enables threshold mode for the plant in given row"""
+        with self._lock:
+            self._threshold[row] = threshold
+            self._hysteresis[row] = hysteresis
+            self._spacing[row] = np.timedelta64(spacing, 'us')
+
+    @property
+    def thresholds(self) -> np.ndarray:
+        """Thresholds of all rows, NaN where threshold mode is disabled"""
+        with self._lock:
+            return self._threshold.copy()
+
+    def enabled(self, row: int) -> bool:
+        return not np.isnan(self._threshold[row])
+
+    def set_last_watered(self, row: int, last_watered: datetime.datetime) -> bool:
+        """
+        Updates time of the last watering
+
+        Returns
+        -------
+        True if the time changed
+        """
+        value = np.datetime64(last_watered, 'us')
+        with self._lock:
+            changed = self._last_watered[row] != value
+            self._last_watered[row] = value
+            return bool(changed)
+
+    def evaluate(self, moisture: np.ndarray, now: datetime.datetime) -> np.ndarray:
+        """
+        Evaluates all plants, disarms triggered ones
+
+        Parameters
+        ----------
+        moisture : np.ndarray
+            smoothed readings (see :attr: SensorBank.latest)
+        now : datetime.datetime
+            time of evaluation
+
+        Returns
+        -------
+        rows of due plants
+        """
+        with self._lock:
+            enabled = ~np.isnan(self._threshold)
+            self._armed |= enabled & (moisture >= self._threshold + self._hysteresis)
+            spaced = np.datetime64(now, 'us') - self._last_watered >= self._spacing
+            due = enabled & self._armed & (moisture < self._threshold) & spaced
+            self._armed &= ~due
+            return np.flatnonzero(due)
+
+    def rearm(self, row: int) -> None:
+        """Arms the plant again (e.g. triggered watering didn't happen)"""
+        with self._lock:
+            self._armed[row] = True
@@ -0,0 +1,178 @@
+import datetime
+import logging
+
+import numpy as np
+
+DEFAULT_DRY_LEVEL = 0.3
+DEFAULT_WET_LEVEL = 0.8
+DEFAULT_MAX_CHANGE = 2.0
+DEFAULT_MIN_SAMPLES = 10
+DEFAULT_MIN_WATERINGS = 3
+# pump time limit of closed loop watering, relative to the time the measured flow needs
+FLOW_DURATION_MARGIN = 2.0
+
+
+def fit_drying_curves(sample_times: np.ndarray, moisture: np.ndarray, watering_times: np.ndarray,
+                      min_samples: int = DEFAULT_MIN_SAMPLES) -> (np.ndarray, np.ndarray, np.ndarray):
+    """Fits linear drying curve moisture = intercept + slope * (time since watering) for every plant
+
+    All plants are fitted at once with closed-form least squares over masked history arrays.
+
+    Args:
+        sample_times (np.ndarray): (T,) datetime64 times of moisture samples
+        moisture (np.ndarray): (n, T) moisture samples, NaN where missing
+        watering_times (np.ndarray): (n, K) datetime64 waterings of every plant, NaT where missing
+        min_samples (int): plants with less usable samples get NaN
+
+    Returns:
+        (slope per second, intercept, number of used samples) arrays of shape (n,)
+    """
+    t = sample_times.astype('datetime64[s]').astype(np.float64)
+    waterings = watering_times.astype('datetime64[s]')
+    w = np.where(np.isnat(waterings), np.nan, waterings.astype(np.float64))
+
+    # time of the last watering before every sample
+    last = np.full(moisture.shape, -np.inf)
+    for k in range(w.shape[1]):
+        before = w[:, k, None] <= t[None, :]
+        last = np.where(before, np.maximum(last, w[:, k, None]), last)
+    since = t[None, :] - last
+
+    valid = np.isfinite(since) & ~np.isnan(moisture)
+    x = np.where(valid, since, 0.0)
+    y = np.where(valid, moisture, 0.0)
+    count = valid.sum(axis=1)
+    sx, sy = x.sum(axis=1), y.sum(axis=1)
+    sxx, sxy = (x * x).sum(axis=1), (x * y).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = count * sxx - sx * sx
+        slope = (count * sxy - sx * sy) / denominator
+        intercept = (sy - slope * sx) / count
+    unusable = (count < min_samples) | (denominator <= 0)
+    slope[unusable] = np.nan
+    intercept[unusable] = np.nan
+    return slope, intercept, count
+
+
+class TuningProposal(object):
+    """
+    New watering interval and duration proposed for a plant (drying rate is NaN if it's based on flow only)
+    """
+    __slots__ = ('plantName', 'wateringInterval', 'wateringDuration', 'dryingRate', 'samples')
+
+    def __init__(self, plantName: str, wateringInterval: datetime.timedelta, wateringDuration: datetime.timedelta,
+                 dryingRate: float, samples: int):
+        self.plantName = plantName
+        self.wateringInterval = wateringInterval
+        self.wateringDuration = wateringDuration
+        self.dryingRate = dryingRate
+        self.samples = samples
+
+    def __repr__(self):
+        return f'TuningProposal({self.plantName}: interval {self.wateringInterval}, ' \
+               f'duration {self.wateringDuration}, drying {self.dryingRate:.3g}/h, {self.samples} samples)'
+
+
+class TuningEngine(object):
+    """
+    Tunes watering intervals and durations of plants with sensors from their history
+
+    Drying curve fitted from moisture samples and watering journal gives moisture right
+    after watering and drying rate. Proposed interval is the time to dry down to the dry
+    level (plant's moisture threshold if set), proposed duration scales the current one so
+    watering reaches the wet level. Changes are limited by max_change factor per refit.
+
+    Plants with a flow meter and watering volume but no sensor keep their interval, their
+    duration (the pump time limit of closed loop watering) follows the flow measured by the
+    meter: FLOW_DURATION_MARGIN times the median time the volume takes.
+    """
+
+    def __init__(self, environment, dry_level: float = DEFAULT_DRY_LEVEL, wet_level: float = DEFAULT_WET_LEVEL,
+                 max_change: float = DEFAULT_MAX_CHANGE, min_samples: int = DEFAULT_MIN_SAMPLES,
+                 min_waterings: int = DEFAULT_MIN_WATERINGS, logger: logging.Logger = None):
+        if not 0 <= dry_level < wet_level <= 1:
+            raise ValueError('Dry level has to be lower than wet level')
+        if max_change < 1:
+            raise ValueError('Max change factor has to be at least 1')
+        self.environment = environment
+        self.dry_level = dry_level
+        self.wet_level = wet_level
+        self.max_change = max_change
+        self.min_samples = min_samples
+        self.min_waterings = min_waterings
+        self._logger = logger or logging.getLogger('PlantStation').getChild('Tuning')
+
+    @staticmethod
+    def can_tune(environment) -> bool:
+        """Whether any plant of the environment gives tuning input (sensor or flow meter)"""
+        return environment.sensors is not None or any(plant.flowMeter is not None for plant in environment.plants)
+
+    def propose(self) -> [TuningProposal]:
+        """Fits all plants with sensors or flow meters and returns proposals for plants with enough history"""
+        proposals = self._propose_from_sensors()
+        tuned = {proposal.plantName for proposal in proposals}
+        return proposals + self._propose_from_flow([plant for plant in self.environment.plants
+                                                    if plant.plantName not in tuned])
+
+    def _propose_from_sensors(self) -> [TuningProposal]:
+        sensors = self.environment.sensors
+        if sensors is None:
+            return []
+        names = sensors.plants
+        plants = [self.environment.plant(name) for name in names]
+        sample_times, moisture = sensors.history()
+        watering_times, _, _ = self.environment.journal.history(names)
+        slope, intercept, count = fit_drying_curves(sample_times, moisture, watering_times, self.min_samples)
+
+        dry = self.environment.moisture_policy.thresholds
+        dry = np.where(np.isnan(dry), self.dry_level, dry)
+        # plants watered by calendar rules have no interval to tune
+        interval = np.array([plant.wateringInterval.total_seconds()
+                             if isinstance(plant.wateringInterval, datetime.timedelta) else np.nan
+                             for plant in plants])
+        duration = np.array([plant.wateringDuration.total_seconds() for plant in plants])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            usable = (slope < 0) & (intercept > dry) & ~np.isnan(interval)
+            new_interval = np.clip((intercept - dry) / -slope, interval / self.max_change, interval * self.max_change)
+            scale = np.clip((self.wet_level - dry) / (intercept - dry), 1 / self.max_change, self.max_change)
+            new_duration = duration * scale
+
+        proposals = []
+        for row in np.flatnonzero(usable):
+            proposals.append(TuningProposal(names[row], datetime.timedelta(seconds=round(new_interval[row])),
+                                            datetime.timedelta(seconds=max(1, int(round(new_duration[row])))),
+                                            -slope[row] * 3600, int(count[row])))
+        self._logger.info('Fitted %d plants, %d proposals', len(names), len(proposals))
+        return proposals
+
+    def _propose_from_flow(self, plants) -> [TuningProposal]:
+        plants = [plant for plant in plants if plant.flowMeter is not None and plant.wateringVolume is not None]
+        if not plants:
+            return []
+        names = [plant.plantName for plant in plants]
+        _, durations, volumes = self.environment.journal.history(names)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.where((durations > 0) & (volumes > 0), volumes / durations, np.nan)
+        count = (~np.isnan(rates)).sum(axis=1)
+        volume = np.array([plant.wateringVolume for plant in plants])
+        duration = np.array([plant.wateringDuration.total_seconds() for plant in plants])
+
+        proposals = []
+        for row in np.flatnonzero(count >= self.min_waterings):
+            needed = FLOW_DURATION_MARGIN * volume[row] / np.nanmedian(rates[row])
+            new_duration = np.clip(needed, duration[row] / self.max_change, duration[row] * self.max_change)
+            proposals.append(TuningProposal(names[row], plants[row].wateringInterval,
+                                            datetime.timedelta(seconds=max(1, int(round(new_duration)))),
+                                            np.nan, int(count[row])))
+        self._logger.info('Checked flow of %d plants, %d proposals', len(names), len(proposals))
+        return proposals
+
+    def apply(self, proposals: [TuningProposal]) -> None:
+        """Sets proposed values through plant setters"""
+        for proposal in proposals:
+            plant = self.environment.plant(proposal.plantName)
+            plant.wateringInterval = proposal.wateringInterval
+            plant.wateringDuration = proposal.wateringDuration
+            self._logger.info('Applied %s', proposal)
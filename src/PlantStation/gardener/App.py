@@ -1,24 +1,167 @@
 import logging
+import threading
 from pathlib import Path
 
+from .control import ControlServer
 from .gardener import Gardener
 from PlantStation.core import EnvironmentConfig
+from PlantStation.core.ext import PinManager, PinTraceRecorder, MultithreadSched
+from PlantStation.core.ext import recording, tracing
+from PlantStation.core.ext.metrics import Counter, Gauge, MetricsServer
+
+SATURATION = Gauge('plantstation_saturation', 'Watering demand relative to pump capacity', ('environment',))
+BACKLOG = Gauge('plantstation_backlog', 'Waterings queued at the last load assessment', ('environment',))
+BUDGET_HITS = Counter('plantstation_budget_hits_total', 'Waterings rejected by water budgets', ('environment',))
+
+
+def find_configs(paths: [Path]) -> [Path]:
+    """
+        Expands directories to .cfg files they contain (sorted by name)
+    """
+    configs = []
+    for path in paths:
+        if path.is_dir():
+            configs.extend(sorted(path.glob('*.cfg')))
+        else:
+            configs.append(path)
+    return configs
 
 
 class App(object):
-    env_config: EnvironmentConfig
-    gardener: Gardener
+    """
+        Daemon hosting one or more environments in one process
+
+        Environments share the scheduler and the pin manager, each of them keeps its own
+        plants, task pool and pump limit (limit group of the pin manager)
+    """
+    env_configs: [EnvironmentConfig]
+    gardeners: [Gardener]
+    pin_manager: PinManager
+    scheduler: MultithreadSched
     debug: bool
     logger = logging.getLogger(__package__)
 
-    def __init__(self, config_path: Path, dry_run: bool = False, debug: bool = False):
-        # get config
+    pin_trace: Path = None
+    trace: Path = None
+    record: Path = None
+    control: ControlServer = None
+    metrics: MetricsServer = None
+
+    def __init__(self, config_path: Path or [Path], dry_run: bool = False, debug: bool = False,
+                 pin_trace: Path = None, allowed_pins: [str] = None, control_socket: Path = None,
+                 metrics: str = None, trace: Path = None, record: Path = None):
         self.debug = debug
-        self.env_config = EnvironmentConfig.create_from_file(config_path, debug=self.debug, dry_run=dry_run)
-        self.gardener = Gardener(env_config=self.env_config)
+        paths = find_configs(config_path if isinstance(config_path, list) else [config_path])
+        if not paths:
+            raise FileNotFoundError('No environment config found')
+        self.scheduler = MultithreadSched()
+        self.pin_manager = PinManager(dry_run=dry_run)
+        if pin_trace:
+            self.pin_trace = pin_trace
+            self.pin_manager.trace = PinTraceRecorder()
+        if trace:
+            self.trace = trace
+            tracing.enable()
+        if record:
+            self.record = record
+            recording.enable(record)
+
+        # read all configs first, so pin manager is set up before any pin is used
+        self.env_configs = [EnvironmentConfig.create_from_file(path, debug=self.debug, dry_run=dry_run,
+                                                               pin_manager=self.pin_manager) for path in paths]
+        self.pin_manager.active_limit = sum(env_config.active_limit for env_config in self.env_configs)
+        # configs as read are the starting point of a replay
+        for env_config in self.env_configs:
+            recording.record(recording.SNAPSHOT, env_config.env_name, Path(env_config.path).read_text())
+        if allowed_pins is not None:
+            self.pin_manager.allowed_pins = allowed_pins
+        self.gardeners = [Gardener(env_config=env_config, scheduler=self.scheduler)
+                          for env_config in self.env_configs]
+
+        for gardener in self.gardeners:
+            gardener.schedule_monitoring()
+            self._export_environment(gardener.environment)
+        self.control = ControlServer(self, control_socket) if control_socket else None
+        self.metrics = MetricsServer(metrics) if metrics else None
+
+    @property
+    def env_config(self) -> EnvironmentConfig:
+        """Config of the first environment"""
+        return self.env_configs[0]
+
+    @property
+    def gardener(self) -> Gardener:
+        """Gardener of the first environment"""
+        return self.gardeners[0]
+
+    @staticmethod
+    def _budget_hits(environment) -> int:
+        budgets = [environment.budgets.environment_budget] + list(environment.budgets.plant_budgets.values())
+        return sum(sum(budget.hits.values()) for budget in budgets)
+
+    def _export_environment(self, environment) -> None:
+        SATURATION.labels(environment.name).set_function(lambda: environment.saturation.level)
+        BACKLOG.labels(environment.name).set_function(lambda: environment.saturation.backlog)
+        BUDGET_HITS.labels(environment.name).set_function(lambda: self._budget_hits(environment))
+
+    def status(self) -> dict:
+        """
+            Snapshot of environments' state: plants, saturation, queued waterings and budget hits
+        """
+        environments = []
+        for gardener in self.gardeners:
+            environment = gardener.environment
+            environments.append({
+                'name': environment.name,
+                'plants': len(environment.plants),
+                'saturation': environment.saturation.level,
+                'backlog': environment.saturation.backlog,
+                'budget_hits': self._budget_hits(environment),
+            })
+        return {'environments': environments, 'working_pumps': self.pin_manager.working_pumps}
 
-        self.gardener.schedule_monitoring()
+    def stop(self):
+        """
+            Stops the shared scheduler (run() returns)
+        """
+        self.scheduler.stop()
 
     def run(self):
-        self.gardener.start()
+        try:
+            if self.control is not None:
+                self.control.start()
+            if self.metrics is not None:
+                self.metrics.start()
+                self.logger.info('Serving metrics on %s', self.metrics.address)
+            if self.trace and threading.current_thread() is threading.main_thread():
+                tracing.dump_on_signal(self.trace)
+            self.logger.info('Starting scheduler of %s environment(s)', len(self.gardeners))
+            self.gardener.start()
+        finally:
+            if self.control is not None:
+                self.control.stop()
+            if self.metrics is not None:
+                self.metrics.stop()
+            if self.pin_trace:
+                self.dump_pin_trace()
+            if self.trace:
+                tracing.tracer().dump_chrome_trace(self.trace)
+                self.logger.info('Trace saved to %s', self.trace)
+            if self.record:
+                recording.disable()
+                self.logger.info('Scheduling record saved to %s', self.record)
+            for gardener in self.gardeners:
+                gardener.environment.budgets.close()
+                gardener.environment.journal.save()
+            self.pin_manager.close()
 
+    def dump_pin_trace(self):
+        """
+            Saves recorded pin transitions - as Chrome trace if path ends with .json, CSV otherwise
+        """
+        trace = self.pin_manager.trace
+        if self.pin_trace.suffix == '.json':
+            trace.dump_chrome_trace(self.pin_trace)
+        else:
+            trace.to_csv(self.pin_trace)
+        self.logger.info('Pin trace saved to %s', self.pin_trace)
@@ -1,53 +1,91 @@
 import argparse
+import json
 import logging
 import sys
 from pathlib import Path
 
 from PlantStation.configurer import USER_CFG_PATH, GLOBAL_CFG_PATH
+from PlantStation.core.config import setup_logging
+from PlantStation.core.ext.pin_backends import benchmark_backends
 from .App import App
+from .supervisor import Supervisor
 
 
 def run():
+    if len(sys.argv) > 1 and sys.argv[1] == 'simulate':
+        from PlantStation.simulation.simulator import main
+        main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'replay':
+        from PlantStation.simulation.replay import main
+        main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(description='Plantstation daemon')
-    parser.add_argument('-p', '--config-path', action='store', nargs=1, help='Path to config file')
+    parser.add_argument('-p', '--config-path', action='store', nargs='+', default=None,
+                        help='Path(s) to config files or directories with them (all environments run in one process)')
     parser.add_argument('-d', '--debug', default=False, action='store_true', help='Print extra debug information')
     parser.add_argument('--dry-run', default=False, action='store_true', help='Do not work on pins, dry run only')
+    parser.add_argument('--pin-trace', action='store', default=None,
+                        help='Record pin transitions and save them on exit (.json - Chrome trace, otherwise CSV)')
+    parser.add_argument('--trace', action='store', default=None, metavar='PATH',
+                        help='Record spans (scheduling, pump locks, waterings) and save Chrome trace JSON on exit '
+                             'or on SIGUSR1')
+    parser.add_argument('--record', action='store', default=None, metavar='PATH',
+                        help='Record scheduling inputs and decisions into binary log (see PlantStation replay)')
+    parser.add_argument('--control-socket', action='store', default=None, metavar='PATH',
+                        help='Serve runtime commands (status, water, pause, ...) on Unix socket')
+    parser.add_argument('--metrics', action='store', default=None, metavar='ADDRESS',
+                        help='Serve Prometheus metrics over HTTP on [host]:port or unix:PATH')
+    parser.add_argument('--workers', action='store', nargs='?', type=int, default=None, const=0, metavar='N',
+                        help='Supervisor mode - spread environments across N worker processes (default: one per core)')
 
+    parser.add_argument('--benchmark-pins', action='store', nargs='*', default=None, metavar='BACKEND',
+                        help='Measure pin toggle latency of given (default: all) pin factory backends and quit')
     args = parser.parse_args()
 
-    logger = logging.getLogger(__package__)
+    if args.benchmark_pins is not None:
+        for result in benchmark_backends(args.benchmark_pins):
+            print(json.dumps(result))
+        return
 
-    Formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    channel = logging.StreamHandler()
-    channel.setFormatter(Formatter)
-    logger.addHandler(channel)
+    setup_logging()
+    logger = logging.getLogger(__package__)
 
     if args.debug:
         logger.setLevel(logging.DEBUG)
     else:
         logger.setLevel(logging.INFO)
 
-    logger.debug(f'Path: {args.config_path[0]}')
+    logger.debug('Path: %s', args.config_path)
 
-    if args.config_path[0] is not None:
-        if Path(args.config_path[0]).is_file():
-            config_path = Path(args.config_path[0])
-        else:
-            logger.error(f'Given _path is invalid!')
+    if args.config_path is not None:
+        config_path = [Path(path) for path in args.config_path]
+        if not all(path.is_file() or path.is_dir() for path in config_path):
+            logger.error('Given _path is invalid!')
             sys.exit(1)
     elif USER_CFG_PATH.joinpath('environment.cfg'):
-        config_path = USER_CFG_PATH.joinpath('environment.cfg')
+        config_path = [USER_CFG_PATH.joinpath('environment.cfg')]
     elif GLOBAL_CFG_PATH.joinpath('environment.cfg'):
-        config_path = GLOBAL_CFG_PATH.joinpath('environment.cfg')
+        config_path = [GLOBAL_CFG_PATH.joinpath('environment.cfg')]
     else:
-        logger.error(f'Config not found. Quitting')
+        logger.error('Config not found. Quitting')
         sys.exit(1)
-    logger.info(f'Found config: {config_path}')
+    logger.info('Found config: %s', ', '.join(map(str, config_path)))
 
     try:
-        app = App(config_path=config_path, dry_run=args.dry_run, debug=args.debug)
+        if args.workers is not None:
+            supervisor = Supervisor(config_path, workers=args.workers or None, dry_run=args.dry_run, debug=args.debug)
+            supervisor.run()
+            return
+        app = App(config_path=config_path, dry_run=args.dry_run, debug=args.debug,
+                  pin_trace=Path(args.pin_trace) if args.pin_trace else None,
+                  trace=Path(args.trace) if args.trace else None,
+                  record=Path(args.record) if args.record else None,
+                  control_socket=Path(args.control_socket) if args.control_socket else None,
+                  metrics=args.metrics)
 
         app.run()
     except Exception as err:
-        logger.error(f'Received exception: {err}')
+        logger.error('Received exception: %s', err)
         sys.exit(1)
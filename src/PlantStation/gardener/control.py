@@ -0,0 +1,211 @@
+"""
+Local control socket.
+
+Unix domain socket served by an asyncio loop in its own thread. Every request is one line of JSON
+with 'cmd' and its arguments, every response is one line of JSON: {"ok": true, "result": ...} or
+{"ok": false, "error": "..."}. Commands:
+
+    status                                  environments' state (see :meth: App.status)
+    water     plant [env]                   waters the plant now
+    pause     plant | zone [env]            deactivates the plant or all plants of the zone
+    resume    plant | zone [env]            activates them again
+    interval  plant interval [env]          sets watering interval ('DD HH:MM:SS' or 'cron: ...')
+    schedule  [zone] [limit] [env]          upcoming waterings, earliest first
+
+'env' may be omitted when the daemon hosts one environment only. Schedule and status are answered
+from the environments' indexes, no plant is locked. Pause, resume and interval are saved to the
+environment's config file, so they survive a restart.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from PlantStation.core import parse_time
+from PlantStation.core.ext import recording
+from PlantStation.core.ext.unix_socket import remove_stale_socket
+from .tasks import WaterTask
+
+DEFAULT_SCHEDULE_LIMIT = 10
+MAX_REQUEST_SIZE = 64 * 1024
+# commands not changing the daemon's state, left out of records
+QUERIES = ('status', 'schedule')
+
+
+class CommandError(Exception):
+    """Wrong command or arguments, reported to the client"""
+
+
+class ControlServer(object):
+    """
+        Control socket of the daemon (see module description for the protocol)
+    """
+    path: Path
+    logger = logging.getLogger(__package__).getChild('Control')
+
+    def __init__(self, app, path: Path):
+        """
+        Args:
+            app (App): served daemon
+            path (Path): socket path, stale socket file is replaced
+        """
+        self.app = app
+        self.path = Path(path)
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+        self._commands = {
+            'status': self._status,
+            'water': self._water,
+            'pause': lambda request: self._set_active(request, False),
+            'resume': lambda request: self._set_active(request, True),
+            'interval': self._interval,
+            'schedule': self._schedule,
+        }
+
+    def start(self) -> None:
+        """Starts serving in a background thread"""
+        remove_stale_socket(self.path)
+        self._thread = threading.Thread(target=self._serve, name='PlantStation-Control', daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._loop is None:
+            self._thread.join()
+            raise OSError(f'Couldn\'t open control socket {self.path}')
+
+    def stop(self) -> None:
+        """Closes the socket and stops the loop"""
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    def _serve(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            self._server = loop.run_until_complete(
+                asyncio.start_unix_server(self._handle_client, path=str(self.path), limit=MAX_REQUEST_SIZE))
+            os.chmod(self.path, 0o660)
+        except OSError as err:
+            self.logger.error('Couldn\'t open control socket %s: %s', self.path, err)
+            loop.close()
+            self._started.set()
+            return
+        self._loop = loop
+        self.logger.info('Control socket listening on %s', self.path)
+        self._started.set()
+        try:
+            loop.run_forever()
+        finally:
+            self._server.close()
+            # drop connected clients before the loop is closed
+            clients = asyncio.all_tasks(loop)
+            for client in clients:
+                client.cancel()
+            loop.run_until_complete(asyncio.gather(*clients, return_exceptions=True))
+            loop.run_until_complete(self._server.wait_closed())
+            loop.close()
+            if self.path.exists():
+                self.path.unlink()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(json.dumps(self.execute(line)).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as err:
+            self.logger.warning('Control client dropped: %s', err)
+        except asyncio.CancelledError:
+            # server is stopping
+            pass
+        finally:
+            writer.close()
+
+    def execute(self, line: bytes or str) -> dict:
+        """Executes one request line, returns the response"""
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict) or request.get('cmd') not in self._commands:
+                raise CommandError(f'Unknown command, expected one of: {", ".join(self._commands)}')
+            if request['cmd'] not in QUERIES:
+                recording.record(recording.COMMAND, subject=json.dumps(request))
+            return {'ok': True, 'result': self._commands[request['cmd']](request)}
+        except json.JSONDecodeError as err:
+            return {'ok': False, 'error': f'Malformed request: {err}'}
+        except (CommandError, ValueError) as err:
+            return {'ok': False, 'error': str(err)}
+        except Exception as err:
+            self.logger.exception('Control command failed')
+            return {'ok': False, 'error': f'Internal error: {err}'}
+
+    def _gardener(self, request: dict):
+        gardeners = self.app.gardeners
+        name = request.get('env')
+        if name is None:
+            if len(gardeners) != 1:
+                raise CommandError('Environment has to be given (env)')
+            return gardeners[0]
+        for gardener in gardeners:
+            if gardener.environment.name == name:
+                return gardener
+        raise CommandError(f'Unknown environment: {name}')
+
+    @staticmethod
+    def _plant(environment, request: dict):
+        if 'plant' not in request:
+            raise CommandError('Plant has to be given (plant)')
+        try:
+            return environment.plant(request['plant'])
+        except KeyError:
+            raise CommandError(f'Unknown plant: {request["plant"]}')
+
+    def _status(self, request: dict) -> dict:
+        return self.app.status()
+
+    def _water(self, request: dict) -> str:
+        gardener = self._gardener(request)
+        plant = self._plant(gardener.environment, request)
+        if not gardener.environment.claim(plant):
+            raise CommandError(f'{plant.plantName} is already being watered')
+        gardener.pool.add_task(WaterTask(plant, environment=gardener.environment))
+        return f'{plant.plantName} queued'
+
+    def _set_active(self, request: dict, active: bool) -> [str]:
+        environment = self._gardener(request).environment
+        if 'zone' in request:
+            plants = [plant for plant in environment.plants if plant.zone == request['zone']]
+            if not plants:
+                raise CommandError(f'Unknown zone: {request["zone"]}')
+        else:
+            plants = [self._plant(environment, request)]
+        for plant in plants:
+            plant.isActive = active
+        environment.config.write()
+        return [plant.plantName for plant in plants]
+
+    def _interval(self, request: dict) -> str:
+        environment = self._gardener(request).environment
+        plant = self._plant(environment, request)
+        if 'interval' not in request:
+            raise CommandError('Interval has to be given (interval)')
+        interval = parse_time(str(request['interval']))
+        if isinstance(interval, datetime.timedelta) and interval <= datetime.timedelta(0):
+            raise CommandError('Interval has to be positive')
+        plant.wateringInterval = interval
+        environment.config.write()
+        return str(plant.wateringInterval)
+
+    def _schedule(self, request: dict) -> [dict]:
+        environment = self._gardener(request).environment
+        limit = int(request.get('limit', DEFAULT_SCHEDULE_LIMIT))
+        return [{'plant': plant.plantName, 'time': time.isoformat()}
+                for (time, plant) in environment.next_waterings(limit, request.get('zone'))]
@@ -1,7 +1,10 @@
+import datetime
 import logging
 
 from PlantStation.core import Environment, EnvironmentConfig
-from .tasks import TaskPool, ShouldWaterTask
+from PlantStation.core.ext import MultithreadSched
+from PlantStation.core.tuning import TuningEngine
+from .tasks import TaskPool, MonitorTask, SampleSensorsTask, TuneTask
 
 
 class Gardener(object):
@@ -24,23 +27,31 @@ class Gardener(object):
     pool: TaskPool
     _logger: logging.Logger
 
-    def __init__(self, env_config: EnvironmentConfig):
+    def __init__(self, env_config: EnvironmentConfig, scheduler: MultithreadSched = None):
         self._logger = env_config.logger
         self._logger.setLevel(logging.DEBUG if env_config.debug else logging.INFO)
-        self._logger.debug(f'Creating environment')
+        self._logger.debug('Creating environment')
         self.environment = Environment(env_config)
-        self._logger.debug(f'Creating task pool')
-        self.pool = TaskPool(env_config)
+        self._logger.debug('Creating task pool')
+        self.pool = TaskPool(env_config, scheduler)
 
     def schedule_monitoring(self) -> None:
         """Sets up event scheduler - Obligatory before starting event scheduler
 
-        Schedules to check all plants
+        Schedules one monitoring task checking all plants
         """
         self._logger.debug('Scheduling monitoring')
-        for plant in self.environment.plants:
-            self.pool.add_task(ShouldWaterTask(plant=plant, env_config=self.environment.config))
-        self._logger.debug(f'Scheduled monitoring - OK')
+        self.pool.add_task(MonitorTask(environment=self.environment))
+        if self.environment.sensors is not None:
+            period = datetime.timedelta(seconds=self.environment.config.sensor_settings['period'])
+            self.pool.add_task(SampleSensorsTask(environment=self.environment, period=period))
+        tuning = self.environment.config.tuning_settings
+        if tuning['mode'] in ('propose', 'apply') and TuningEngine.can_tune(self.environment):
+            engine = TuningEngine(self.environment, dry_level=tuning['dry_level'], wet_level=tuning['wet_level'],
+                                  max_change=tuning['max_change'], logger=self._logger.getChild('Tuning'))
+            self.pool.add_task(TuneTask(self.environment, engine, at=tuning['time'],
+                                        apply=tuning['mode'] == 'apply'))
+        self._logger.debug('Scheduled monitoring - OK')
 
     def start(self) -> None:
         """Starts to look after plants
@@ -0,0 +1,233 @@
+"""
+Supervisor mode - environments spread across worker processes.
+
+Every worker process runs :class: App with its share of environment configs. Configs using
+the same pin are always placed in the same worker and each worker's pin manager is restricted
+to pins of its configs, so two workers can never drive the same GPIO. Crashed workers are
+restarted with exponential backoff; workers report their status over a pipe.
+
+Metrics are not collected from workers - their registries live in separate processes and
+only App.status() is sent to the supervisor.
+"""
+import configparser
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing.connection import wait
+from pathlib import Path
+
+from PlantStation.core.ext import PinManager
+from .App import App, find_configs
+
+STATUS_PERIOD = 5.0
+BACKOFF_INITIAL = 1.0
+BACKOFF_MAX = 60.0
+# worker running this long is considered healthy, its backoff is reset
+STABLE_UPTIME = 60.0
+STOP_TIMEOUT = 10.0
+
+def config_pins(path: Path) -> [str]:
+    """
+        Pins used by plants of the config (pumps and flow meters)
+    """
+    parser = configparser.RawConfigParser()
+    parser.optionxform = str
+    parser.read(path)
+    pins = []
+    for section in parser.sections():
+        if section == 'GLOBAL':
+            continue
+        for option in ('gpioPinNumber', 'flowMeterPin'):
+            if parser[section].get(option, ''):
+                pins.append(parser[section][option])
+    return pins
+
+
+def partition_configs(paths: [Path], workers: int, pin_manager: PinManager = None) -> [([Path], [str])]:
+    """
+        Splits configs into at most `workers` shards
+
+        Configs sharing a pin are merged into one group first (union-find over pins normalized
+        by `pin_manager`, a dry-run manager by default), groups are then assigned to the least
+        loaded shard, the biggest first (load = number of pins).
+
+    Returns:
+        [([Path], [str])]: configs and pins of every non-empty shard
+    """
+    pin_key = (pin_manager or PinManager(dry_run=True)).normalize_pin
+    pins = {path: config_pins(path) for path in paths}
+    parent = {path: path for path in paths}
+
+    def find(path):
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    owners = {}
+    for path in paths:
+        for key in map(pin_key, pins[path]):
+            if key in owners:
+                parent[find(path)] = find(owners[key])
+            else:
+                owners[key] = path
+
+    groups = {}
+    for path in paths:
+        groups.setdefault(find(path), []).append(path)
+    shards = [([], []) for _ in range(max(1, workers))]
+    for group in sorted(groups.values(), key=lambda group: -sum(len(pins[path]) for path in group)):
+        (configs, shard_pins) = min(shards, key=lambda shard: len(shard[1]))
+        configs.extend(group)
+        for path in group:
+            shard_pins.extend(pins[path])
+    return [shard for shard in shards if shard[0]]
+
+
+def _worker_main(index: int, paths: [str], pins: [str], dry_run: bool, debug: bool, connection,
+                 status_period: float) -> None:
+    app = App([Path(path) for path in paths], dry_run=dry_run, debug=debug, allowed_pins=pins)
+    runner = threading.Thread(target=app.run, name='PlantStation-Scheduler', daemon=True)
+    runner.start()
+    try:
+        while runner.is_alive():
+            if connection.poll(status_period):
+                if connection.recv() == 'stop':
+                    break
+            connection.send({'worker': index, 'pid': os.getpid(), 'time': time.time(), **app.status()})
+    except (EOFError, BrokenPipeError):
+        # supervisor is gone
+        pass
+    finally:
+        app.stop()
+        runner.join(STOP_TIMEOUT)
+
+
+class _Worker(object):
+    __slots__ = ('index', 'paths', 'pins', 'process', 'connection', 'started', 'backoff', 'restart_at')
+
+    def __init__(self, index: int, paths: [Path], pins: [str]):
+        self.index = index
+        self.paths = paths
+        self.pins = pins
+        self.process = None
+        self.connection = None
+        self.started = 0.0
+        self.backoff = BACKOFF_INITIAL
+        self.restart_at = 0.0
+
+
+class Supervisor(object):
+    """
+        Runs environment configs in a pool of worker processes (one per core by default)
+
+        Every worker runs target(index, paths, pins, dry_run, debug, connection, status_period)
+    """
+    status: {int: dict}
+    logger = logging.getLogger(__package__).getChild('Supervisor')
+
+    def __init__(self, config_paths: [Path], workers: int = None, dry_run: bool = False, debug: bool = False,
+                 status_period: float = STATUS_PERIOD, target=_worker_main):
+        paths = find_configs(config_paths)
+        if not paths:
+            raise FileNotFoundError('No environment config found')
+        self.dry_run = dry_run
+        self.debug = debug
+        self.status_period = status_period
+        self.target = target
+        self.status = {}
+        self._context = multiprocessing.get_context('spawn')
+        self._running = False
+        pin_manager = PinManager(dry_run=dry_run)
+        try:
+            shards = partition_configs(paths, workers or os.cpu_count() or 1, pin_manager)
+        finally:
+            pin_manager.close()
+        self._workers = [_Worker(index, configs, pins) for (index, (configs, pins)) in enumerate(shards)]
+
+    @property
+    def shards(self) -> [[Path]]:
+        """Configs of every worker"""
+        return [worker.paths for worker in self._workers]
+
+    def _start_worker(self, worker: _Worker) -> None:
+        (parent_end, child_end) = self._context.Pipe()
+        worker.process = self._context.Process(
+            target=self.target, name=f'PlantStation-Worker-{worker.index}',
+            args=(worker.index, [str(path) for path in worker.paths], worker.pins, self.dry_run, self.debug,
+                  child_end, self.status_period))
+        worker.process.start()
+        child_end.close()
+        worker.connection = parent_end
+        worker.started = time.monotonic()
+        self.logger.info('Started worker %d (pid %d): %s', worker.index, worker.process.pid,
+                         ', '.join(path.name for path in worker.paths))
+
+    def _on_exit(self, worker: _Worker) -> None:
+        worker.process.join()
+        worker.connection.close()
+        now = time.monotonic()
+        if now - worker.started > STABLE_UPTIME:
+            worker.backoff = BACKOFF_INITIAL
+        worker.restart_at = now + worker.backoff
+        self.logger.warning('Worker %d exited with code %s, restarting in %.0f s', worker.index,
+                            worker.process.exitcode, worker.backoff)
+        worker.backoff = min(2 * worker.backoff, BACKOFF_MAX)
+        worker.process = None
+        self.status.pop(worker.index, None)
+
+    def run(self) -> None:
+        """
+            Starts workers and supervises them until stop() is called
+        """
+        self._running = True
+        for worker in self._workers:
+            self._start_worker(worker)
+        try:
+            while self._running:
+                now = time.monotonic()
+                for worker in self._workers:
+                    if worker.process is None and now >= worker.restart_at:
+                        self._start_worker(worker)
+                alive = [worker for worker in self._workers if worker.process is not None]
+                waitables = {worker.connection: worker for worker in alive}
+                waitables.update({worker.process.sentinel: worker for worker in alive})
+                restarts = [worker.restart_at - now for worker in self._workers if worker.process is None]
+                timeout = max(0.0, min(restarts + [self.status_period]))
+                for ready in wait(list(waitables), timeout):
+                    worker = waitables[ready]
+                    if worker.process is None:
+                        continue
+                    if ready is worker.connection:
+                        try:
+                            self.status[worker.index] = worker.connection.recv()
+                        except EOFError:
+                            pass
+                    elif not worker.process.is_alive():
+                        self._on_exit(worker)
+        finally:
+            self._shutdown()
+
+    def stop(self) -> None:
+        """
+            Stops supervising, run() stops all workers and returns
+        """
+        self._running = False
+
+    def _shutdown(self) -> None:
+        for worker in self._workers:
+            if worker.process is not None:
+                try:
+                    worker.connection.send('stop')
+                except (BrokenPipeError, OSError):
+                    pass
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(STOP_TIMEOUT)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+                    worker.process.join()
+                worker.connection.close()
+                worker.process = None
@@ -4,31 +4,51 @@ import threading
 from threading import Lock
 from typing import Callable
 
-from PlantStation.core.ext import MultithreadSched
-from PlantStation.core import plant, EnvironmentConfig
+from PlantStation.core.ext import MultithreadSched, clock, recording
+from PlantStation.core.ext.metrics import Gauge, Histogram
+from PlantStation.core.ext.tracing import traced
+from PlantStation.core import plant, EnvironmentConfig, Environment
+from PlantStation.core.tuning import TuningEngine
+
+MONITOR_MAX_DELAY = datetime.timedelta(minutes=1)
+
+TASK_DURATION = Histogram('plantstation_task_duration_seconds', 'Run time of pool tasks', ('environment', 'task'))
+ACTIVE_TASKS = Gauge('plantstation_active_tasks', 'Tasks scheduled or running in the pool', ('environment',))
 
 
 class TaskPool(object):
     """
         Pool of scheduled tasks
+
+        Every environment has its own pool, pools of environments hosted in one process
+        may share the scheduler
     """
     logger: logging.Logger
     env_config: EnvironmentConfig
-    _scheduler = MultithreadSched()
-    _active_tasks = []
-    lock = Lock()
+    _scheduler: MultithreadSched
+    _active_tasks: []
+    lock: Lock
 
-    def __init__(self, env_config: EnvironmentConfig):
+    def __init__(self, env_config: EnvironmentConfig, scheduler: MultithreadSched = None):
         self.logger = env_config.logger.getChild('TaskPool')
         self.env_config = env_config
+        self._scheduler = scheduler if scheduler is not None else MultithreadSched()
+        self._active_tasks = []
+        self.lock = Lock()
+        ACTIVE_TASKS.labels(env_config.env_name).set_function(lambda: len(self._active_tasks))
+
+    @property
+    def scheduler(self) -> MultithreadSched:
+        return self._scheduler
 
     def add_task(self, task) -> None:
         """
             Adds task to taskpool
         """
         with self.lock:
-            self.logger.debug(f'Adding new task to pool: {task}. Delay: {task.delay.total_seconds()}')
+            self.logger.debug('Adding new task to pool: %s. Delay: %s', task, task.delay)
             self._active_tasks.append(task)
+            recording.record(recording.TASK, self.env_config.env_name, task.label, recording.microseconds(task.delay))
             self._scheduler.enter(delay=task.delay, action=self._run_task, args=[task])
 
     def start(self) -> None:
@@ -36,14 +56,14 @@ class TaskPool(object):
             Starts scheduler
         """
         try:
-            self.logger.debug(f'Starting pool')
+            self.logger.debug('Starting pool')
             self._scheduler.run()
         except KeyboardInterrupt as exc:
-            self.logger.info(f'Received SIGING. Turning off scheduler')
+            self.logger.info('Received SIGING. Turning off scheduler')
             self._scheduler.stop()
 
         except Exception as exc:
-            self.logger.warning(f'Received exception {exc}')
+            self.logger.warning('Received exception %s', exc)
             self.stop()
 
     def stop(self) -> None:
@@ -51,7 +71,7 @@ class TaskPool(object):
 
         Stops environment's event scheduler
         """
-        self.logger.debug(f'Stopping scheduler.')
+        self.logger.debug('Stopping scheduler.')
         # temporary
         for event in self._active_tasks:
             # self._scheduler.cancel(event)
@@ -70,11 +90,19 @@ class TaskPool(object):
             return self._active_tasks
 
     def _run_task(self, task):
-        self.logger.debug(f'Running taskthread {task}')
-        new_task = task.run()
-        self.active_tasks.remove(task)
-        self.logger.debug(f'Adding new task {new_task}')
-        self.add_task(new_task)
+        self.logger.debug('Running taskthread %s', task)
+        recording.record(recording.DISPATCH, self.env_config.env_name, task.label)
+        with TASK_DURATION.labels(self.env_config.env_name, type(task).__name__).time():
+            new_tasks = task.run()
+        with self.lock:
+            self._active_tasks.remove(task)
+        if new_tasks is None:
+            return
+        if isinstance(new_tasks, Task):
+            new_tasks = [new_tasks]
+        for new_task in new_tasks:
+            self.logger.debug('Adding new task %s', new_task)
+            self.add_task(new_task)
 
 
 class Task(object):
@@ -99,36 +127,127 @@ class Task(object):
         self.env_config = env_config
         self.logger = self.env_config.logger.getChild('Task')
 
-    def run(self):
+    @property
+    def label(self) -> str:
+        """Task kind (and subject) used in records of scheduling decisions"""
+        return type(self).__name__
+
+    def run(self) -> 'Task' or [Task] or None:
+        """
+            Executes task, returns new task(s) to be scheduled
+        """
         pass
 
 
-class ShouldWaterTask(Task):
+class MonitorTask(Task):
     """
-    Task for checking if plant needs to be watered
+    Task checking which plants of the environment need to be watered
+
+    All plants are evaluated at once (see :meth: Environment.due_plants), due ones
+    are marked as pending and get their watering task (plants overdue since start are staggered
+    by environment's catch-up policy, low priority ones may be deferred when pumps are saturated).
+    Creating new monitoring task
+    without generation supersedes the previous one, which stops at its next run
     """
-    plant: plant
+    environment: Environment
+    generation: int
 
-    def __init__(self, plant: plant, env_config: EnvironmentConfig, delay=datetime.timedelta(0)):
-        self.plant = plant
-        super().__init__(delay=delay, action=self.run, env_config=env_config)
+    def __init__(self, environment: Environment, delay=datetime.timedelta(0), generation: int = None):
+        self.environment = environment
+        self.generation = generation if generation is not None else environment.new_monitor_generation()
+        super().__init__(delay=delay, action=self.run, env_config=environment.config)
 
-    def run(self) -> Task:
-        """Check if plants need to be watered
+    @traced('MonitorTask.run', 'task')
+    def run(self) -> [Task]:
+        """Schedules watering of due plants and next check
+
+        :return: new tasks
+        """
+        if self.generation != self.environment.monitor_generation:
+            return None
+        now = clock.now()
+        tasks = []
+        self.environment.assess_load()
+        (due, deferred) = self.environment.saturation.split(self.environment.due_plants(now), now)
+        for deferred_plant in deferred:
+            self.environment.defer(deferred_plant, now)
+        for (due_plant, delay) in self.environment.catch_up.schedule(due, now):
+            self.environment.set_pending(due_plant, True)
+            tasks.append(WaterTask(due_plant, environment=self.environment, delay=delay))
+        self.logger.debug('MonitorTask: %d plants to water', len(tasks))
+
+        next_due = self.environment.next_due()
+        delay = MONITOR_MAX_DELAY
+        if next_due is not None:
+            delay = max(datetime.timedelta(0), min(delay, next_due - now))
+        tasks.append(MonitorTask(self.environment, delay=delay, generation=self.generation))
+        return tasks
 
-            if so -> create watering task
-            else calculate time to next watering
 
-        :return: new task
+class SampleSensorsTask(Task):
+    """
+    Task sampling all moisture sensors of the environment at fixed rate
+    """
+    environment: Environment
+    period: datetime.timedelta
+
+    def __init__(self, environment: Environment, period: datetime.timedelta, delay=datetime.timedelta(0),
+                 planned: datetime.datetime = None):
+        self.environment = environment
+        self.period = period
+        self.planned = planned or clock.now() + delay
+        super().__init__(delay=delay, action=self.run, env_config=environment.config)
+
+    def run(self) -> [Task]:
+        """Samples sensors, schedules watering of plants below moisture threshold and next tick
+        (keeping the rate regardless of sampling time)
+
+        :return: watering tasks and next sampling task
         """
+        self.environment.sensors.sample()
+        now = clock.now()
+        tasks = []
+        for due_plant in self.environment.moisture_due_plants(now):
+            self.environment.set_pending(due_plant, True)
+            tasks.append(WaterTask(due_plant, environment=self.environment))
+
+        planned = self.planned + self.period
+        if planned < now:
+            planned = now
+        tasks.append(SampleSensorsTask(self.environment, self.period, delay=planned - now, planned=planned))
+        return tasks
+
+
+class TuneTask(Task):
+    """
+    Daily refit of watering intervals and durations (see :class: TuningEngine)
+    """
+    environment: Environment
+    engine: TuningEngine
 
-        if self.plant.should_water():
-            self.logger.debug(f'ShouldWaterTask: Scheduling waterOnTask')
-            return WaterTask(self.plant, env_config=self.env_config)
-        else:
-            self.logger.debug(f'ShouldWaterTask: Postponing shouldWaterTask')
-            delay = self.plant.calc_next_watering() - datetime.datetime.now()
-            return ShouldWaterTask(self.plant, env_config=self.env_config, delay=delay)
+    def __init__(self, environment: Environment, engine: TuningEngine, at: datetime.time, apply: bool):
+        self.environment = environment
+        self.engine = engine
+        self.at = at
+        self.apply = apply
+        now = clock.now()
+        planned = datetime.datetime.combine(now.date(), at)
+        if planned <= now:
+            planned += datetime.timedelta(days=1)
+        super().__init__(delay=planned - now, action=self.run, env_config=environment.config)
+
+    def run(self) -> Task:
+        """Proposes (and applies) new intervals, schedules the next refit
+
+        :return: next tuning task
+        """
+        proposals = self.engine.propose()
+        for proposal in proposals:
+            self.logger.info('Tuning: %s', proposal)
+        if self.apply and proposals:
+            self.engine.apply(proposals)
+            self.env_config.write()
+        return TuneTask(self.environment, self.engine, self.at, self.apply)
 
 
 class WaterTask(Task):
@@ -136,40 +255,83 @@ class WaterTask(Task):
     Task for turning on watering
     """
     plant: plant
+    environment: Environment
 
-    def __init__(self, plant: plant, env_config: EnvironmentConfig, delay=datetime.timedelta(0)):
+    def __init__(self, plant: plant, environment: Environment, delay=datetime.timedelta(0)):
         self.plant = plant
-        super().__init__(delay=delay, action=self.run, env_config=env_config)
+        self.environment = environment
+        super().__init__(delay=delay, action=self.run, env_config=environment.config)
+
+    @property
+    def label(self) -> str:
+        return f'WaterTask:{self.plant.plantName}'
+
+    def _save_watering(self) -> None:
+        self.env_config[self.plant.plantName]['lastTimeWatered'] = clock.now().strftime('%Y-%m-%d %X')
+        self.env_config.write()
+        self.environment.journal.save()
+
+    def _water(self) -> None:
+        self.logger.debug('WaterOn: watering plant')
+        try:
+            if self.plant.water(self.environment.saturation.scale):
+                self._save_watering()
+        finally:
+            self.environment.set_pending(self.plant, False)
+
+    def postponed(self, now: datetime.datetime) -> 'WaterTask' or None:
+        """
+            Task postponed right to the end of plant's blackout window, None if the plant may be watered now
+        """
+        allowed = self.environment.next_allowed(self.plant, now)
+        if allowed > now:
+            self.logger.debug('WaterOn: Postponing %s till %s', self.plant.plantName, allowed)
+            recording.record(recording.POSTPONE, self.environment.name, self.plant.plantName,
+                             recording.microseconds(allowed - now))
+            return WaterTask(self.plant, environment=self.environment, delay=allowed - now)
+        return None
+
+    def start(self) -> float or None:
+        """
+            Turns the pump on without waiting (see :meth: Plant.start_watering), for callers
+            keeping the pumping time themselves. Has to be followed by :meth: finish
 
+        Returns:
+            float: pumping time in seconds, None if watering didn't start
+        """
+        self.logger.info('Starting to water plant %s', self.plant.plantName)
+        try:
+            duration = self.plant.start_watering(self.environment.saturation.scale)
+        except Exception:
+            self.environment.set_pending(self.plant, False)
+            raise
+        if duration is None:
+            self.environment.set_pending(self.plant, False)
+        return duration
+
+    def finish(self) -> Task:
+        """
+            Turns the pump off, saves the watering
+
+        :return: new monitoring task
+        """
+        try:
+            self.plant.finish_watering()
+            self._save_watering()
+        finally:
+            self.environment.set_pending(self.plant, False)
+        return MonitorTask(self.environment)
+
+    @traced('WaterTask.run', 'task')
     def run(self) -> Task:
         """
-            Waters plants if there are working hours
-            otherwise postpones it
-        :return: ShouldWaterTask or postponed waterOn task
-        """
-        self.logger.info(f'Starting to water plant {self.plant.plantName}')
-        if self.env_config.silent_hours:
-            if self.env_config['workingHoursBegin'] <= datetime.datetime.now().time() < self.env_config[
-                'workingHoursEnd']:
-                self.logger.debug(f'WaterOn: watering plant')
-                self.plant.water()
-                self.env_config[self.plant.plantName]['lastTimeWatered'] = datetime.datetime.now().strftime(
-                    '%Y-%m-%d %X')
-                self.env_config.write()
-                return ShouldWaterTask(self.plant, env_config=self.env_config)
-            else:
-                # postpone
-                self.logger.debug(f'WaterOn: Postponing waterOn')
-                next_working_window = datetime.datetime.combine(datetime.datetime.now().date(),
-                                                                self.env_config['workingHoursBegin'])
-                if next_working_window < datetime.datetime.now():
-                    next_working_window += datetime.timedelta(days=1)
-                diff = next_working_window - datetime.datetime.now()
-                return WaterTask(self.plant, env_config=self.env_config, delay=diff)
-        else:
-            self.logger.debug(f'WaterOn: watering plant')
-            self.plant.water()
-            self.env_config[self.plant.plantName]['lastTimeWatered'] = datetime.datetime.now().strftime(
-                '%Y-%m-%d %X')
-            self.env_config.write()
-            return ShouldWaterTask(self.plant, env_config=self.env_config)
+            Waters plant unless it's in blackout window,
+            otherwise postpones it right to the next allowed instant
+        :return: postponed WaterTask or new monitoring task
+        """
+        postponed = self.postponed(clock.now())
+        if postponed is not None:
+            return postponed
+        self.logger.info('Starting to water plant %s', self.plant.plantName)
+        self._water()
+        return MonitorTask(self.environment)
@@ -0,0 +1 @@
+"""Simulation tools - synthetic fleets for load tests (see fleet.py)"""
@@ -0,0 +1,233 @@
+"""
+Synthetic fleet generator for load tests.
+
+Writes environment configs (<name>.cfg) and their watering histories (<name>.history.csv)
+straight to disk, plant by plant - memory use doesn't depend on the fleet size. Output is
+deterministic: the same seed, spec and `now` give identical files. Every environment has its
+own random stream derived from the seed, so its content doesn't depend on other environments.
+
+Plants of an environment get distinct pins of the pin pool, so generated configs load in dry run
+mode. Environments can't have more plants than the pool has pins unless pins may be reused -
+such fleets are meant for the simulator only, which doesn't check pin conflicts.
+
+History CSV columns: time (YYYY-MM-DD HH:MM:SS, end of watering), plant, duration (s), volume (ml,
+empty if unknown). Rows are grouped by plant, chronological within a plant.
+"""
+import argparse
+import csv
+import datetime
+import random
+from pathlib import Path
+
+from PlantStation.core.ext.cron import CronRule
+from PlantStation.core.helpers.format_validators import parse_time
+
+TIME_FORMAT = '%Y-%m-%d %X'
+HISTORY_SUFFIX = '.history.csv'
+HISTORY_COLUMNS = ('time', 'plant', 'duration', 'volume')
+
+# every GPIO number the mock pin factory (dry run) accepts, except the ID EEPROM pins
+DEFAULT_PINS = tuple(f'GPIO{pin}' for pin in range(2, 54))
+# (config value, weight)
+DEFAULT_INTERVALS = (
+    ('0D 12:00:00', 10),
+    ('1D 00:00:00', 40),
+    ('2D 00:00:00', 20),
+    ('3D 00:00:00', 15),
+    ('7D 00:00:00', 10),
+    ('cron: 0 7 * * *', 3),
+    ('cron: 30 18 * * mon,thu', 2),
+)
+DEFAULT_BLACKOUTS = ('12:00-14:00', 'mon-fri 08:00-10:00', 'sat 00:00-sun 23:59')
+
+
+class FleetSpec(object):
+    """
+    Size and distribution of the generated fleet
+
+    Ranges are inclusive (min, max) pairs, values are drawn uniformly. Probabilities are in [0, 1]
+    """
+
+    def __init__(self, environments: int = 1, plants: (int, int) = (10, 10),
+                 intervals: ((str, float),) = DEFAULT_INTERVALS, durations: (float, float) = (5.0, 60.0),
+                 zones: int = 4, pins: (str,) = DEFAULT_PINS, active_limit: (int, int) = (1, 3),
+                 working_hours: float = 0.5, blackout: float = 0.1, blackouts: (str,) = DEFAULT_BLACKOUTS,
+                 inactive: float = 0.05, history_days: int = 30, jitter: float = 0.1, reuse_pins: bool = False):
+        """
+        Args:
+            environments (int): number of environments (config files)
+            plants ((int, int)): plants per environment
+            intervals (((str, float),)): watering intervals (config format) with weights
+            durations ((float, float)): watering duration in seconds
+            zones (int): zones per environment, 0 for none
+            pins ((str,)): pin pool
+            active_limit ((int, int)): pumps working at once per environment
+            working_hours (float): probability an environment has working hours (silent hours outside)
+            blackout (float): probability a plant has its own blackout window
+            blackouts ((str,)): blackout windows to choose from
+            inactive (float): probability a plant is inactive
+            history_days (int): days of watering history, 0 for none
+            jitter (float): relative deviation of history waterings from the plan
+            reuse_pins (bool): plants beyond the pool size get pins of the pool again (simulator only)
+        """
+        if environments < 1 or plants[0] < 1 or plants[0] > plants[1]:
+            raise ValueError('Fleet needs at least one environment and one plant per environment')
+        if not intervals or not pins:
+            raise ValueError('Intervals and pins can\'t be empty')
+        if durations[0] <= 0 or durations[0] > durations[1]:
+            raise ValueError('Watering durations have to be positive')
+        if not reuse_pins and plants[1] > len(pins):
+            raise ValueError(f'Environment can\'t have more plants than pins ({len(pins)}), '
+                             f'spread plants across more environments or allow reusing pins')
+        self.environments = environments
+        self.plants = plants
+        self.intervals = tuple(value for (value, _) in intervals)
+        self.weights = tuple(weight for (_, weight) in intervals)
+        self.durations = durations
+        self.zones = zones
+        self.pins = tuple(pins)
+        self.active_limit = active_limit
+        self.working_hours = working_hours
+        self.blackout = blackout
+        self.blackouts = tuple(blackouts)
+        self.inactive = inactive
+        self.history_days = history_days
+        self.jitter = jitter
+        self.reuse_pins = reuse_pins
+        # intervals are parsed once, cron rules cache their tables
+        self._parsed = {value: parse_time(value) for value in self.intervals}
+
+    def parsed_interval(self, value: str) -> datetime.timedelta or CronRule:
+        return self._parsed[value]
+
+
+def _write_section(file, name: str, options: [(str, str)]) -> None:
+    # same layout as RawConfigParser.write()
+    file.write(f'[{name}]\n')
+    for (key, value) in options:
+        file.write(f'{key} = {value}\n')
+    file.write('\n')
+
+
+def _history(rng: random.Random, spec: FleetSpec, interval, duration: float, now: datetime.datetime):
+    """Yields (end of watering, duration) of one plant, oldest first"""
+    if spec.history_days <= 0:
+        return
+    start = now - datetime.timedelta(days=spec.history_days)
+    if isinstance(interval, CronRule):
+        time = interval.next_fire(start)
+        while time < now:
+            yield time, duration * rng.uniform(1 - spec.jitter, 1 + spec.jitter)
+            time = interval.next_fire(time)
+        return
+    step = interval.total_seconds()
+    time = start + datetime.timedelta(seconds=rng.uniform(0, step))
+    while time < now:
+        yield time, duration * rng.uniform(1 - spec.jitter, 1 + spec.jitter)
+        time += datetime.timedelta(seconds=step * rng.uniform(1 - spec.jitter, 1 + spec.jitter))
+
+
+def generate_environment(directory: Path, index: int, spec: FleetSpec, seed: int = 0,
+                         now: datetime.datetime = None) -> Path:
+    """
+    Writes config and history of the index-th environment of the fleet
+
+    Returns:
+        Path: path of the config
+    """
+    now = (now or datetime.datetime.now()).replace(microsecond=0)
+    rng = random.Random(f'{seed}:{index}')
+    name = f'env{index:04d}'
+    path = Path(directory) / f'{name}.cfg'
+    history_path = Path(directory) / f'{name}{HISTORY_SUFFIX}'
+
+    with open(path, 'w') as cfg_file, open(history_path, 'w', newline='') as history_file:
+        history = csv.writer(history_file)
+        history.writerow(HISTORY_COLUMNS)
+
+        options = [('env_name', name), ('ActiveLimit', str(rng.randint(*spec.active_limit)))]
+        if rng.random() < spec.working_hours:
+            begin = datetime.time(rng.randint(6, 9), rng.choice((0, 30)))
+            end = datetime.time(rng.randint(19, 22), rng.choice((0, 30)))
+            options += [('workingHours', 'True'), ('workingHoursBegin', begin.isoformat()),
+                        ('workingHoursEnd', end.isoformat())]
+        else:
+            options.append(('workingHours', 'False'))
+        _write_section(cfg_file, 'GLOBAL', options)
+
+        for number in range(rng.randint(*spec.plants)):
+            plant_name = f'{name}_plant{number:05d}'
+            interval = rng.choices(spec.intervals, spec.weights)[0]
+            duration = round(rng.uniform(*spec.durations), 1)
+            last_watered = None
+            for (time, real_duration) in _history(rng, spec, spec.parsed_interval(interval), duration, now):
+                history.writerow((time.strftime(TIME_FORMAT), plant_name, f'{real_duration:.1f}', ''))
+                last_watered = time
+            options = [
+                ('plantName', plant_name),
+                ('wateringDuration', str(duration)),
+                ('wateringInterval', interval),
+                ('lastTimeWatered', last_watered.strftime(TIME_FORMAT) if last_watered else ''),
+                ('gpioPinNumber', spec.pins[number % len(spec.pins)]),
+                ('isActive', str(rng.random() >= spec.inactive)),
+                ('zone', f'zone{rng.randrange(spec.zones)}' if spec.zones else ''),
+            ]
+            if rng.random() < spec.blackout:
+                options.append(('blackout', rng.choice(spec.blackouts)))
+            _write_section(cfg_file, plant_name, options)
+    return path
+
+
+def generate_fleet(directory: Path, spec: FleetSpec, seed: int = 0, now: datetime.datetime = None):
+    """
+    Writes the whole fleet, environment by environment
+
+    Yields:
+        Path: config of every written environment
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    now = (now or datetime.datetime.now()).replace(microsecond=0)
+    for index in range(spec.environments):
+        yield generate_environment(directory, index, spec, seed, now)
+
+
+def read_history(path: Path):
+    """
+    Reads history CSV written by the generator
+
+    Yields:
+        (datetime, str, float, float or None): end of watering, plant, duration, volume
+    """
+    with open(path, newline='') as history_file:
+        reader = csv.reader(history_file)
+        next(reader, None)
+        for (time, plant, duration, volume) in reader:
+            yield (datetime.datetime.strptime(time, TIME_FORMAT), plant, float(duration),
+                   float(volume) if volume else None)
+
+
+def main(args=None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m PlantStation.simulation.fleet',
+                                     description='Generates synthetic environment configs and watering histories')
+    parser.add_argument('directory', help='Output directory')
+    parser.add_argument('-e', '--environments', type=int, default=1, help='Number of environments')
+    parser.add_argument('-p', '--plants', type=int, nargs='+', default=[10], metavar='N',
+                        help='Plants per environment (N or MIN MAX)')
+    parser.add_argument('--history-days', type=int, default=30, help='Days of watering history')
+    parser.add_argument('--reuse-pins', action='store_true',
+                        help='Allow more plants per environment than pins (configs for the simulator only)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--now', default=None, help='End of history (YYYY-MM-DD HH:MM:SS), defaults to now')
+    args = parser.parse_args(args)
+
+    plants = (args.plants[0], args.plants[-1])
+    now = datetime.datetime.strptime(args.now, TIME_FORMAT) if args.now else None
+    spec = FleetSpec(environments=args.environments, plants=plants, history_days=args.history_days,
+                     reuse_pins=args.reuse_pins)
+    for path in generate_fleet(Path(args.directory), spec, args.seed, now):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,355 @@
+"""
+Deterministic replay of a scheduling record (see :mod: PlantStation.core.ext.recording,
+`PlantStation --record`).
+
+Environments are rebuilt from the config snapshots of the record and driven through the real
+:class: Gardener, :class: TaskPool and :class: MultithreadSched code on virtual time - scheduler events
+run inline, one after another in order of their time, control commands are re-executed at their
+recorded time. Dispatch latency of the daemon is an input too: an event runs at the recorded dispatch
+of the same task if there is one within tolerance of the planned time. The replay records its own
+decisions and compares them with the recorded ones, the earliest mismatch is reported. The same
+record always replays the same way, so an incident can be bisected across code versions (exit
+status 1 on divergence):
+
+    git bisect run PlantStation replay incident.rec
+
+Every task runs to its end once dispatched, sleeping moves only its own time (pumps of earlier tasks
+free their slots at their recorded release time, waiting for a pump moves the task to the first
+release). State changes of a task are thus visible to tasks dispatched during its run, which the
+daemon doesn't do. Sensors and tuning are not replayed.
+"""
+import argparse
+import bisect
+import collections
+import datetime
+import json
+import logging
+import sys
+import tempfile
+from pathlib import Path
+
+from PlantStation.core import EnvironmentConfig
+from PlantStation.core.config import setup_logging
+from PlantStation.core.ext import MultithreadSched, clock, recording
+from PlantStation.core.ext.clock import VirtualClock
+from PlantStation.core.ext.recording import read_log, Record
+from PlantStation.gardener.control import ControlServer
+from PlantStation.gardener.gardener import Gardener
+from .simulator import _SimulatedPinManager
+
+TIME_FORMAT = '%Y-%m-%d %X'
+DEFAULT_TOLERANCE = 1.0
+# decisions compared with the record, the rest are inputs
+DECISIONS = (recording.TASK, recording.DISPATCH, recording.LOCK_ACQUIRE, recording.LOCK_RELEASE,
+             recording.POSTPONE, recording.CONFIG_WRITE)
+# decisions whose value (delay) has to match as well
+TIMED_DECISIONS = (recording.TASK, recording.POSTPONE)
+
+
+def _from_us(time: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(time / 1e6)
+
+
+def _to_us(moment: datetime.datetime) -> int:
+    return round(moment.timestamp() * 1e6)
+
+
+class _TaskClock(VirtualClock):
+    """
+    Time of the running task - every task starts at its dispatch time (dispatch times never go back),
+    sleeping moves only the task's time
+    """
+
+    def __init__(self, start: datetime.datetime):
+        super().__init__(start)
+        self.dispatched = start
+
+    def dispatch(self, moment: datetime.datetime) -> None:
+        with self._lock:
+            self.dispatched = max(self.dispatched, moment)
+            self._now = self.dispatched
+
+
+class ReplayScheduler(MultithreadSched):
+    """
+    Scheduler running events inline on virtual time, in order of time (same order for the same inputs)
+
+    Events of pool tasks are moved to the recorded dispatch of the same task (environment and label)
+    if it's within tolerance of the planned time, every recorded dispatch is used once
+    """
+
+    def __init__(self, task_clock: _TaskClock, recorded: [Record] = (), tolerance: float = DEFAULT_TOLERANCE):
+        super().__init__()
+        self.clock = task_clock
+        self._tolerance = datetime.timedelta(seconds=tolerance)
+        self._dispatches = collections.defaultdict(list)
+        for record in recorded:
+            if record.kind == recording.DISPATCH:
+                self._dispatches[(record.environment, record.subject)].append(_from_us(record.time))
+        for times in self._dispatches.values():
+            times.sort()
+
+    def _recorded_dispatch(self, time: datetime.datetime, task) -> datetime.datetime:
+        times = self._dispatches.get((task.env_config.env_name, task.label))
+        if not times:
+            return time
+        index = bisect.bisect_left(times, time - self._tolerance)
+        if index < len(times) and times[index] <= time + self._tolerance:
+            return times.pop(index)
+        return time
+
+    def enterabs(self, time: datetime.datetime, action, args=[], kwargs={}):
+        if args and hasattr(args[0], 'label'):
+            time = self._recorded_dispatch(time, args[0])
+        super().enterabs(time, action, args, kwargs)
+
+    def run_until(self, until: datetime.datetime) -> int:
+        """
+            Dispatches events due until the given time
+
+        Returns:
+            int: number of dispatched events
+        """
+        dispatched = 0
+        while not self._queue.empty() and self._queue.queue[0].time <= until:
+            event = self._queue.get()
+            self.clock.dispatch(event.time)
+            event.run()
+            dispatched += 1
+        self.clock.dispatch(until)
+        return dispatched
+
+    def run(self):
+        raise RuntimeError('Replay scheduler is driven by run_until()')
+
+
+class _ReplayPinManager(_SimulatedPinManager):
+    """
+    Pump limits on task time - a slot is held from acquire till release, slots of tasks which ran ahead
+    are taken until their release time. A task waiting for a pump moves to the first release freeing one
+    """
+
+    def __init__(self, task_clock: _TaskClock):
+        super().__init__(dry_run=True)
+        self._clock = task_clock
+        # [release time or None while held by the running task, limit group]
+        self._slots = []
+
+    def _blocking(self, group, now: datetime.datetime) -> [list]:
+        taken = [slot for slot in self._slots if slot[0] is None or slot[0] > now]
+        if len(taken) >= self._active_limit:
+            return taken
+        limit = self._group_limits.get(group)
+        in_group = [slot for slot in taken if slot[1] == group]
+        if limit is not None and len(in_group) >= limit:
+            return in_group
+        return []
+
+    def acquire_lock(self, group=None):
+        requested = self._clock.now()
+        # slots released before the current dispatch can't block anybody anymore
+        self._slots = [slot for slot in self._slots if slot[0] is None or slot[0] > self._clock.dispatched]
+        blocking = self._blocking(group, requested)
+        while blocking:
+            releases = [slot[0] for slot in blocking if slot[0] is not None]
+            if not releases:
+                raise RuntimeError('Pump lock would never be released')
+            self._clock.advance_to(min(releases))
+            blocking = self._blocking(group, self._clock.now())
+        self._slots.append([None, group])
+        waited = self._clock.now() - requested
+        recording.record(recording.LOCK_ACQUIRE, group, value=recording.microseconds(waited))
+
+    def release_lock(self, group=None):
+        for slot in self._slots:
+            if slot[0] is None and slot[1] == group:
+                slot[0] = self._clock.now()
+                break
+        recording.record(recording.LOCK_RELEASE, group)
+
+
+class Divergence(object):
+    """
+    First decision of the replay differing from the record (None on the side it's missing)
+    """
+    __slots__ = ('time', 'recorded', 'replayed')
+
+    def __init__(self, time: int, recorded: Record or None, replayed: Record or None):
+        self.time = time
+        self.recorded = recorded
+        self.replayed = replayed
+
+    def __str__(self):
+        return (f'Divergence at {_from_us(self.time).strftime(TIME_FORMAT)}:\n'
+                f'  recorded: {self.recorded}\n  replayed: {self.replayed}')
+
+
+def _streams(records: [Record], until: int) -> {tuple: [Record]}:
+    streams = collections.defaultdict(list)
+    for record in records:
+        if record.kind in DECISIONS and record.time <= until:
+            streams[(record.kind, record.environment, record.subject)].append(record)
+    for stream in streams.values():
+        stream.sort(key=lambda record: record.time)
+    return streams
+
+
+def compare(recorded: [Record], replayed: [Record], until: int, tolerance: float = DEFAULT_TOLERANCE) \
+        -> Divergence or None:
+    """
+    Compares decisions up to the given time (us). Decisions are matched in order of time per kind,
+    environment and subject (threads of the daemon record concurrent decisions in any order), times
+    and delays may differ by tolerance (s)
+
+    Returns:
+        Divergence: earliest mismatch, None if the replay matches the record
+    """
+    slack = recording.microseconds(tolerance)
+    recorded_streams = _streams(recorded, until)
+    replayed_streams = _streams(replayed, until)
+    first = None
+    for key in sorted(recorded_streams.keys() | replayed_streams.keys()):
+        (expected, actual) = (recorded_streams.get(key, []), replayed_streams.get(key, []))
+        for index in range(max(len(expected), len(actual))):
+            record = expected[index] if index < len(expected) else None
+            replay = actual[index] if index < len(actual) else None
+            if record is not None and replay is not None and abs(record.time - replay.time) <= slack \
+                    and (record.kind not in TIMED_DECISIONS or abs(record.value - replay.value) <= slack):
+                continue
+            time = min(entry.time for entry in (record, replay) if entry is not None)
+            if first is None or time < first.time:
+                first = Divergence(time, record, replay)
+            break
+    return first
+
+
+class Replay(object):
+    """
+        Rebuilds environments of a record and replays them
+
+        Use as a context manager - the virtual clock is installed process wide until the replay is closed
+    """
+    gardeners: [Gardener]
+
+    def __init__(self, log_path: Path, output: Path = None, tolerance: float = DEFAULT_TOLERANCE,
+                 debug: bool = False):
+        """
+        Args:
+            log_path (Path): record to replay
+            output (Path): where to save the replayed record, temporary file by default
+            tolerance (float): max shift (s) of an event to its recorded dispatch
+            debug (bool): log replayed operation
+        """
+        self.recorded = list(read_log(log_path))
+        starts = [record for record in self.recorded if record.kind == recording.START]
+        snapshots = [record for record in self.recorded if record.kind == recording.SNAPSHOT]
+        if not starts or not snapshots:
+            raise ValueError(f'{log_path} has no start or no config snapshot')
+        self.start = _from_us(starts[0].time)
+        # record of a crashed daemon has no end
+        ends = [record for record in self.recorded if record.kind == recording.END]
+        self.end = _from_us((ends or self.recorded)[-1].time)
+        self.commands = [record for record in self.recorded if record.kind == recording.COMMAND]
+
+        self.clock = _TaskClock(self.start)
+        self._previous_clock = clock.use(self.clock)
+        self._directory = tempfile.TemporaryDirectory(prefix='plantstation-replay-')
+        self.output = Path(output) if output else Path(self._directory.name) / 'replay.rec'
+        self.gardeners = []
+        try:
+            recording.enable(self.output)
+            self.scheduler = ReplayScheduler(self.clock, self.recorded, tolerance)
+            self.pin_manager = _ReplayPinManager(self.clock)
+            env_configs = []
+            for snapshot in snapshots:
+                path = Path(self._directory.name) / f'{snapshot.environment}.cfg'
+                path.write_text(snapshot.subject)
+                # dry run - moisture sensors are mocked, no pin factory touches the hardware
+                env_configs.append(EnvironmentConfig.create_from_file(path, debug=debug, dry_run=True,
+                                                                      pin_manager=self.pin_manager))
+                recording.record(recording.SNAPSHOT, snapshot.environment, snapshot.subject)
+            self.pin_manager.active_limit = sum(env_config.active_limit for env_config in env_configs)
+            self.gardeners = [Gardener(env_config, self.scheduler) for env_config in env_configs]
+            for gardener in self.gardeners:
+                gardener.schedule_monitoring()
+            self.control = ControlServer(self, Path(self._directory.name) / 'control.sock')
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        """Stops recording, releases plants and restores the previous clock"""
+        recording.disable()
+        for gardener in self.gardeners:
+            for plant in gardener.environment.plants:
+                plant.close()
+            gardener.environment.budgets.close()
+            gardener.environment.journal.save()
+        self.gardeners = []
+        if self._previous_clock is not None:
+            clock.use(self._previous_clock)
+            self._previous_clock = None
+        self._directory.cleanup()
+
+    def status(self) -> dict:
+        return {'environments': [{'name': gardener.environment.name} for gardener in self.gardeners]}
+
+    def run(self, until: datetime.datetime = None) -> [Record]:
+        """
+            Replays the record till the given time (its end by default)
+
+        Returns:
+            [Record]: replayed records
+        """
+        until = min(until or self.end, self.end)
+        for command in self.commands:
+            moment = _from_us(command.time)
+            if moment > until:
+                break
+            self.scheduler.run_until(moment)
+            self.control.execute(command.subject)
+        self.scheduler.run_until(until)
+        recording.recorder().flush()
+        return list(read_log(self.output))
+
+
+def main(args=None) -> None:
+    parser = argparse.ArgumentParser(prog='PlantStation replay',
+                                     description='Replays scheduling record on virtual time and compares decisions')
+    parser.add_argument('record', help='Record saved by PlantStation --record')
+    parser.add_argument('--until', default=None, help='Replay till (YYYY-MM-DD HH:MM:SS), defaults to end of record')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed difference of decision times and delays (s)')
+    parser.add_argument('--output', default=None, help='Save replayed record')
+    parser.add_argument('--dump', default=False, action='store_true', help='Print replayed decisions as JSON lines')
+    parser.add_argument('-d', '--debug', default=False, action='store_true', help='Log replayed operation')
+    args = parser.parse_args(args)
+
+    setup_logging()
+    if not args.debug:
+        logging.disable(logging.INFO)
+    until = datetime.datetime.strptime(args.until, TIME_FORMAT) if args.until else None
+    with Replay(Path(args.record), output=Path(args.output) if args.output else None, tolerance=args.tolerance,
+                debug=args.debug) as replay:
+        replayed = replay.run(until)
+        end = _to_us(min(until or replay.end, replay.end))
+        divergence = compare(replay.recorded, replayed, end, args.tolerance)
+    if args.dump:
+        for record in replayed:
+            if record.kind in DECISIONS:
+                print(json.dumps({'kind': record.kind_name, 'environment': record.environment,
+                                  'subject': record.subject, 'time': record.time, 'value': record.value}))
+    counts = collections.Counter(record.kind_name for record in replayed if record.kind in DECISIONS)
+    summary = ', '.join(f'{kind}: {count}' for (kind, count) in sorted(counts.items()))
+    print(f'Replayed {sum(counts.values())} decisions ({summary})')
+    if divergence is None:
+        print('No divergence')
+        return
+    print(divergence)
+    sys.exit(1)
@@ -0,0 +1,331 @@
+"""
+Discrete-event "what-if" simulator of an environment config.
+
+Runs the real :class: Environment, monitoring and watering tasks and :class: PinManager (mock pins)
+on a virtual clock: instead of sleeping, the simulator jumps to the next event. Watering is split
+into start and finish events (see :meth: WaterTask.start), a watering waiting for a free pump is
+queued until another one finishes. The config is copied to a temporary directory first, so the
+original file is never modified.
+
+Every plant gets its own virtual pump, so plants sharing a pin (e.g. synthetic fleets generated
+with reused pins, see :mod: PlantStation.simulation.fleet) don't collide. Moisture sensors and
+tuning are not simulated - plants in moisture-threshold mode are never watered.
+"""
+import argparse
+import collections
+import datetime
+import heapq
+import itertools
+import json
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+
+from PlantStation.core import Environment, EnvironmentConfig
+from PlantStation.core.config import setup_logging
+from PlantStation.core.ext import clock
+from PlantStation.core.ext.clock import VirtualClock
+from PlantStation.core.ext.pins import PinManager
+from PlantStation.gardener.tasks import MonitorTask, WaterTask
+
+TIME_FORMAT = '%Y-%m-%d %X'
+DEFAULT_DAYS = 14
+
+
+class _VirtualPump(object):
+    """
+    Pump without a pin, sticks to the limits of its :class: PinManager like LimitedDigitalOutputDevice
+    """
+    __slots__ = ('_manager', '_group', 'value', 'closed')
+
+    def __init__(self, manager: PinManager, group=None):
+        self._manager = manager
+        self._group = group
+        self.value = 0
+        self.closed = False
+
+    def on(self) -> None:
+        if not self.value:
+            self._manager.acquire_lock(self._group)
+            self.value = 1
+
+    def off(self) -> None:
+        if self.value:
+            self.value = 0
+            self._manager.release_lock(self._group)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class _VirtualFlowMeter(object):
+    """
+    Flow meter without a pin - never counts a pulse
+    """
+    __slots__ = ('closed',)
+    pulses = 0
+    volume = 0.0
+
+    def __init__(self):
+        self.closed = False
+
+    def reset(self, target_volume: float = None) -> None:
+        pass
+
+    def wait(self, timeout: float = None) -> bool:
+        return False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class _SimulatedPinManager(PinManager):
+    """
+    Pin manager creating a virtual pump (and flow meter) per owner - pins are never driven nor checked
+    for conflicts
+    """
+
+    def create_pump(self, pin_number: str, owner=None, group=None) -> _VirtualPump:
+        return super().create_pump((pin_number, owner), owner=owner, group=group)
+
+    def create_flow_meter(self, pin_number: str, pulses_per_litre: float, owner=None) -> _VirtualFlowMeter:
+        return super().create_flow_meter((pin_number, owner), pulses_per_litre, owner=owner)
+
+    def _pin_key(self, pin_number):
+        return pin_number
+
+    def _new_device(self, pin_number, group=None) -> _VirtualPump:
+        return _VirtualPump(self, group)
+
+    def _new_flow_meter(self, pin_number, pulses_per_litre: float) -> _VirtualFlowMeter:
+        return _VirtualFlowMeter()
+
+
+class _PlantStats(object):
+    __slots__ = ('waterings', 'on_time', 'litres', 'lateness')
+
+    def __init__(self):
+        self.waterings = 0
+        self.on_time = 0.0
+        self.litres = None
+        self.lateness = []
+
+    def report(self) -> dict:
+        lateness = self.lateness
+        return {
+            'waterings': self.waterings,
+            'on_time_s': round(self.on_time, 1),
+            'litres': round(self.litres, 3) if self.litres is not None else None,
+            'mean_lateness_s': round(sum(lateness) / len(lateness), 1) if lateness else None,
+            'max_lateness_s': round(max(lateness), 1) if lateness else None,
+        }
+
+
+class Simulator(object):
+    """
+        Simulates one environment config from `start` on
+
+        Use as a context manager - the virtual clock is installed process wide until the simulator is closed
+    """
+    environment: Environment
+    clock: VirtualClock
+    logger = logging.getLogger(__package__).getChild('Simulator')
+
+    def __init__(self, config_path: Path, start: datetime.datetime = None, debug: bool = False):
+        start = (start or datetime.datetime.now()).replace(microsecond=0)
+        self.clock = VirtualClock(start)
+        self._previous_clock = clock.use(self.clock)
+        self._directory = tempfile.TemporaryDirectory(prefix='plantstation-simulation-')
+        try:
+            path = Path(self._directory.name) / Path(config_path).name
+            shutil.copyfile(config_path, path)
+            # dry run - moisture sensors are mocked, no pin factory touches the hardware
+            env_config = EnvironmentConfig.create_from_file(path, debug=debug, dry_run=True,
+                                                          pin_manager=_SimulatedPinManager(dry_run=True))
+            env_config.pin_manager.active_limit = env_config.active_limit
+            if not debug:
+                env_config.logger.setLevel(logging.WARNING)
+            self.environment = Environment(env_config)
+            if not debug:
+                self.environment.config.logger.getChild('Environment').setLevel(logging.WARNING)
+        except Exception:
+            self.close()
+            raise
+        self.pin_manager = env_config.pin_manager
+        self._events = []
+        self._sequence = itertools.count()
+        self._waiting = collections.deque()
+        self._plants = {plant.plantName: _PlantStats() for plant in self.environment.plants}
+        # pumps working -> seconds spent at that level
+        self._concurrency = collections.Counter()
+        self._working = 0
+        self._last_change = start
+        # day -> (first start, last finish)
+        self._windows = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        """Releases plants and restores the previous clock"""
+        if getattr(self, 'environment', None) is not None:
+            for plant in self.environment.plants:
+                plant.close()
+            self.environment.budgets.close()
+            self.environment.journal.save()
+            self.pin_manager.close()
+            self.environment = None
+        if self._previous_clock is not None:
+            clock.use(self._previous_clock)
+            self._previous_clock = None
+        self._directory.cleanup()
+
+    def _schedule(self, tasks, now: datetime.datetime) -> None:
+        if tasks is None:
+            return
+        if not isinstance(tasks, list):
+            tasks = [tasks]
+        for task in tasks:
+            heapq.heappush(self._events, (now + task.delay, next(self._sequence), task, None))
+
+    def _pumps_changed(self, now: datetime.datetime, change: int) -> None:
+        self._concurrency[self._working] += (now - self._last_change).total_seconds()
+        self._last_change = now
+        self._working += change
+
+    def _run_task(self, task, now: datetime.datetime) -> None:
+        if not isinstance(task, WaterTask):
+            self._schedule(task.run(), now)
+            return
+        postponed = task.postponed(now)
+        if postponed is not None:
+            self._schedule(postponed, now)
+            return
+        if not self.pin_manager.has_free_pump(self.environment.name):
+            self._waiting.append(task)
+            return
+        due = task.plant.calc_next_watering()
+        duration = task.start()
+        if duration is None:
+            return
+        stats = self._plants[task.plant.plantName]
+        if due >= self.clock.start:
+            stats.lateness.append((now - due).total_seconds())
+        self._pumps_changed(now, 1)
+        heapq.heappush(self._events, (now + datetime.timedelta(seconds=duration), next(self._sequence), task, now))
+
+    def _finish(self, task: WaterTask, started: datetime.datetime, now: datetime.datetime) -> None:
+        self._schedule(task.finish(), now)
+        self._pumps_changed(now, -1)
+        plant = task.plant
+        stats = self._plants[plant.plantName]
+        stats.waterings += 1
+        stats.on_time += plant.lastWateringDuration
+        litres = self._litres(plant, plant.lastWateringDuration)
+        if litres is not None:
+            stats.litres = (stats.litres or 0.0) + litres
+        (first, last) = self._windows.get(started.date(), (started, now))
+        self._windows[started.date()] = (min(first, started), max(last, now))
+        # freed pump - waiting waterings are retried in order of arrival
+        waiting = self._waiting
+        self._waiting = collections.deque()
+        while waiting:
+            self._run_task(waiting.popleft(), now)
+
+    @staticmethod
+    def _litres(plant, duration: float) -> float or None:
+        calibration = plant._flowCalibration
+        if calibration is not None:
+            return calibration.volume_for(duration) / 1000
+        return None
+
+    def run(self, until: datetime.datetime) -> dict:
+        """
+            Simulates the environment until the given time
+
+        Returns:
+            dict: report (see :meth: report)
+        """
+        self._schedule(MonitorTask(self.environment), self.clock.now())
+        while self._events and self._events[0][0] <= until:
+            (time, _, task, started) = heapq.heappop(self._events)
+            self.clock.advance_to(time)
+            if started is None:
+                self._run_task(task, time)
+            else:
+                self._finish(task, started, time)
+        self.clock.advance_to(until)
+        self._pumps_changed(until, 0)
+        return self.report()
+
+    def report(self) -> dict:
+        """
+            Per-plant waterings, pumping time, water use and lateness (start of watering after its due time,
+            plants overdue at start are left out), pump concurrency (share of time with N pumps working)
+            and daily watering window (first start to last finish)
+        """
+        elapsed = sum(self._concurrency.values()) or 1.0
+        windows = [(last - first).total_seconds() for (first, last) in self._windows.values()]
+        plants = {name: stats.report() for (name, stats) in self._plants.items()}
+        return {
+            'environment': self.environment.name,
+            'start': self.clock.start.strftime(TIME_FORMAT),
+            'end': self.clock.now().strftime(TIME_FORMAT),
+            'active_limit': self.pin_manager.active_limit,
+            'waterings': sum(stats.waterings for stats in self._plants.values()),
+            'on_time_s': round(sum(stats.on_time for stats in self._plants.values()), 1),
+            'peak_concurrency': max((level for (level, seconds) in self._concurrency.items() if seconds > 0),
+                                    default=0),
+            'concurrency': {level: round(seconds / elapsed, 4)
+                            for (level, seconds) in sorted(self._concurrency.items())},
+            'waiting': len(self._waiting),
+            'daily_window_s': {
+                'mean': round(sum(windows) / len(windows), 1) if windows else None,
+                'max': round(max(windows), 1) if windows else None,
+            },
+            'plants': plants,
+        }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f'Environment {report["environment"]}: {report["start"]} - {report["end"]}, '
+        f'active limit {report["active_limit"]}',
+        f'Waterings: {report["waterings"]}, pumps on for {report["on_time_s"]:.0f} s, '
+        f'peak concurrency {report["peak_concurrency"]}',
+        'Concurrency (share of time): ' + ', '.join(f'{level}: {share:.1%}'
+                                                    for (level, share) in report['concurrency'].items()),
+        f'Daily watering window: mean {report["daily_window_s"]["mean"]} s, max {report["daily_window_s"]["max"]} s',
+        '',
+        f'{"plant":30} {"waterings":>9} {"on time s":>10} {"litres":>8} {"mean late s":>12} {"max late s":>11}',
+    ]
+    for (name, plant) in sorted(report['plants'].items()):
+        cells = [plant['litres'], plant['mean_lateness_s'], plant['max_lateness_s']]
+        (litres, mean, worst) = ('-' if cell is None else cell for cell in cells)
+        lines.append(f'{name:30} {plant["waterings"]:>9} {plant["on_time_s"]:>10} {litres:>8} {mean:>12} '
+                     f'{worst:>11}')
+    return '\n'.join(lines)
+
+
+def main(args=None) -> None:
+    parser = argparse.ArgumentParser(prog='PlantStation simulate',
+                                     description='Simulates an environment config on virtual time')
+    parser.add_argument('config', help='Environment config (.cfg)')
+    parser.add_argument('--days', type=float, default=DEFAULT_DAYS, help='Simulated days')
+    parser.add_argument('--start', default=None, help='Start of simulation (YYYY-MM-DD HH:MM:SS), defaults to now')
+    parser.add_argument('--json', default=False, action='store_true', help='Print report as JSON')
+    parser.add_argument('-d', '--debug', default=False, action='store_true', help='Log simulated operation')
+    args = parser.parse_args(args)
+
+    setup_logging()
+    if not args.debug:
+        # loading the config logs on INFO before the simulator can quiet it
+        logging.disable(logging.INFO)
+    start = datetime.datetime.strptime(args.start, TIME_FORMAT) if args.start else None
+    with Simulator(Path(args.config), start=start, debug=args.debug) as simulator:
+        report = simulator.run(simulator.clock.now() + datetime.timedelta(days=args.days))
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
@@ -29,7 +29,7 @@ def cleanup(request):
 
     def clean_plants():
         for plant in plants:
-            del plant
+            plant.close()
         plants.clear()
 
     request.addfinalizer(clean_plants)
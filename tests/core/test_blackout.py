@@ -0,0 +1,76 @@
+import datetime
+
+import pytest
+
+from core.ext.blackout import BlackoutCalendar
+from .context import create_plant_simple, simple_env_config, cleanup, MORNING, EVENING
+from PlantStation.core import Environment
+
+MONDAY = datetime.datetime(2020, 6, 1)
+
+
+def at(day: int, hour: int, minute: int = 0) -> datetime.datetime:
+    return MONDAY + datetime.timedelta(days=day, hours=hour, minutes=minute)
+
+
+def test_daily_window():
+    calendar = BlackoutCalendar('22:00-07:00')
+    assert calendar.next_allowed(at(0, 12)) == at(0, 12)
+    assert calendar.next_allowed(at(0, 23)) == at(1, 7)
+    assert calendar.next_allowed(at(6, 23, 30)) == at(7, 7)
+    assert calendar.is_blackout(at(2, 3))
+    assert not calendar.is_blackout(at(2, 7))
+
+
+def test_overlapping_windows():
+    calendar = BlackoutCalendar('22:00-07:00, sat 00:00-sun 12:00, mon-fri 12:00-13:00')
+    assert calendar.next_allowed(at(4, 23, 30)) == at(6, 12)
+    assert calendar.next_allowed(at(2, 12, 30)) == at(2, 13)
+    assert calendar.next_allowed(at(6, 12, 30)) == at(6, 12, 30)
+
+
+def test_date_ranges():
+    calendar = BlackoutCalendar('2020-06-03..2020-06-04, 2020-06-05 06:00..2020-06-05 08:00, 20:00-06:00')
+    assert calendar.next_allowed(at(2, 10)) == at(4, 6) + datetime.timedelta(hours=2)
+    assert calendar.next_allowed(at(1, 21)) == at(4, 8)
+    assert calendar.next_allowed(at(0, 10)) == at(0, 10)
+
+
+def test_union_and_wrong_windows():
+    calendar = BlackoutCalendar() | BlackoutCalendar.from_working_hours(MORNING, EVENING)
+    assert calendar
+    assert not BlackoutCalendar()
+    assert calendar.next_allowed(at(0, 22)) == at(1, 7)
+    for window in ['25:00-07:00', 'xyz 10:00-12:00', '10:00-10:00', '2020-06-02..2020-06-01', 'whenever']:
+        with pytest.raises(ValueError):
+            BlackoutCalendar(window)
+    with pytest.raises(ValueError):
+        BlackoutCalendar('mon 00:00-sun 24:00')
+
+
+def test_environment_blackouts(simple_env_config):
+    simple_env_config.silent_hours = (EVENING, MORNING)
+    simple_env_config.cfg_parser['GLOBAL']['blackout.balcony'] = 'sat 00:00-sun 12:00'
+    env = Environment(simple_env_config)
+    first = create_plant_simple(simple_env_config, 5)
+    second = create_plant_simple(simple_env_config, 6, zone='balcony')
+    env.add_plant(first)
+    env.add_plant(second)
+    assert env.next_allowed(first, at(5, 10)) == at(5, 10)
+    assert env.next_allowed(second, at(5, 10)) == at(6, 12)
+    assert env.next_allowed(second, at(4, 23)) == at(6, 12)
+    assert env.next_allowed(first, at(4, 23)) == at(5, 7)
+
+
+def test_environment_blackouts_follow_config(simple_env_config):
+    env = Environment(simple_env_config)
+    plant = create_plant_simple(simple_env_config, 5)
+    env.add_plant(plant)
+    assert env.next_allowed(plant, at(0, 23)) == at(0, 23)
+    simple_env_config.silent_hours = (EVENING, MORNING)
+    assert env.next_allowed(plant, at(0, 23)) == at(1, 7)
+    simple_env_config.set_option('GLOBAL', 'blackout.balcony', 'mon-fri 07:00-12:00')
+    plant.zone = 'balcony'
+    assert env.next_allowed(plant, at(0, 23)) == at(1, 12)
+    simple_env_config.disable_silent_hours()
+    assert env.next_allowed(plant, at(0, 23)) == at(0, 23)
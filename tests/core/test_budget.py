@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from core.ext.sliding_window import SlidingWindowCounter
+from PlantStation.core import Environment
+from PlantStation.core import budget
+from PlantStation.core.budget import WaterBudget, BudgetGuard
+from .context import create_plant_simple, simple_env_config, cleanup
+
+HOUR = 3600.0
+
+
+def test_sliding_window_counter():
+    counter = SlidingWindowCounter(window=24 * HOUR, buckets=24)
+    counter.add(1, now=0)
+    counter.add(2, now=5 * HOUR)
+    assert counter.total(now=10 * HOUR) == 3
+    assert counter.total(now=24 * HOUR) == 2
+    counter.add(4, now=25 * HOUR)
+    assert counter.total(now=29 * HOUR) == 4
+    assert counter.total(now=100 * HOUR) == 0
+    with pytest.raises(ValueError):
+        SlidingWindowCounter(window=0)
+
+
+def test_water_budget():
+    budget = WaterBudget(runs=2, litres=1)
+    assert budget
+    assert not WaterBudget()
+    assert budget.exceeded(10, 400, now=0) is None
+    budget.charge(10, 400, now=0)
+    assert budget.exceeded(10, 700, now=HOUR) == 'litres'
+    budget.charge(10, None, now=HOUR)
+    assert budget.exceeded(10, None, now=2 * HOUR) == 'runs'
+    assert budget.hits == {'runs': 1, 'litres': 1}
+    assert budget.exceeded(10, None, now=25 * HOUR) is None
+    with pytest.raises(ValueError):
+        WaterBudget(seconds=0)
+
+
+def test_budget_guard():
+    guard = BudgetGuard(WaterBudget(seconds=30), {'a': WaterBudget(runs=1)})
+    assert guard.allow('a', 10, None, now=0) is None
+    assert guard.allow('a', 10, None, now=1) == 'plant runs'
+    assert guard.allow('b', 15, None, now=2) is None
+    assert guard.allow('b', 15, None, now=3) == 'environment seconds'
+    # rejected watering is charged to none of budgets
+    assert guard.environment_budget.used(now=4) == {'seconds': 25}
+
+
+def test_environment_budget(simple_env_config):
+    env = Environment(simple_env_config)
+    first = create_plant_simple(simple_env_config, 5)
+    simple_env_config.set_option('test_plant_5', 'maxRunsPerDay', '1')
+    env.add_plant(first)
+    assert first.water()
+    last_watered = first.lastTimeWatered
+    assert not first.water()
+    assert first.lastTimeWatered == last_watered
+    assert env.budgets.plant_budgets['test_plant_5'].hits == {'runs': 1}
+
+
+def test_budget_state_survives_restart(tmp_path):
+    path = tmp_path / 'env.budget.json'
+    guard = BudgetGuard(WaterBudget(runs=2), {'a': WaterBudget(seconds=20)}, path=path)
+    assert guard.allow('a', 15, None, now=0) is None
+    guard.close()
+    restarted = BudgetGuard(WaterBudget(runs=2), {'a': WaterBudget(seconds=20)}, path=path)
+    assert restarted.allow('a', 15, None, now=HOUR) == 'plant seconds'
+    assert restarted.allow('b', 15, None, now=HOUR) is None
+    assert restarted.allow('b', 15, None, now=HOUR) == 'environment runs'
+    assert restarted.allow('b', 15, None, now=25 * HOUR) is None
+
+
+def test_budget_reconfigure_keeps_usage():
+    guard = BudgetGuard(WaterBudget(runs=2))
+    assert guard.allow('a', 10, None, now=0) is None
+    guard.configure(WaterBudget(runs=1, seconds=100), {})
+    assert guard.allow('a', 10, None, now=1) == 'environment runs'
+    assert guard.environment_budget.used(now=2) == {'runs': 1, 'seconds': 0}
+
+
+def test_budget_state_saved_in_background(tmp_path, monkeypatch):
+    monkeypatch.setattr(budget, 'BUDGET_SAVE_INTERVAL', 0.01)
+    path = tmp_path / 'env.budget.json'
+    guard = BudgetGuard(WaterBudget(runs=2), path=path)
+    # allow() doesn't write, the background writer saves the charge soon after
+    assert guard.allow('a', 15, None, now=0) is None
+    deadline = time.monotonic() + 10
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    restarted = BudgetGuard(WaterBudget(runs=2), path=path)
+    assert restarted.environment_budget.used(now=1)['runs'] == 1
+    guard.close()
+    restarted.close()
@@ -0,0 +1,26 @@
+import datetime
+
+from PlantStation.core.ext import clock
+from PlantStation.core.ext.clock import VirtualClock
+
+START = datetime.datetime(2024, 1, 1, 12, 0)
+
+
+def test_virtual_clock():
+    virtual = VirtualClock(START)
+    previous = clock.use(virtual)
+    try:
+        assert clock.now() == START
+        assert clock.monotonic() == 0.0
+        clock.sleep(1.5)
+        assert clock.now() == START + datetime.timedelta(seconds=1.5)
+        assert clock.monotonic_ns() == 1_500_000_000
+        virtual.advance_to(START + datetime.timedelta(hours=1))
+        assert clock.time() == (START + datetime.timedelta(hours=1)).timestamp()
+        # never moves back
+        virtual.advance_to(START)
+        assert clock.monotonic() == 3600.0
+    finally:
+        clock.use(previous)
+    assert clock.current() is previous
+    assert abs((clock.now() - datetime.datetime.now()).total_seconds()) < 1
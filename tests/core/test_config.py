@@ -8,6 +8,7 @@ import pytest
 
 import PlantStation
 from core.config import Config, EnvironmentConfig
+from core.ext import PinManager
 # noinspection PyUnresolvedReferences
 from .context import create_plant_simple, simple_env_config, add_plants_to_config, cleanup
 
@@ -105,4 +106,46 @@ class TestEnvironmentConfig(ConfigSchema):
             plant = create_plant_simple(config, 5)
 
     def test_config_with_plants(self, simple_env_config, add_plants_to_config):
-        pass #fixtures tests everything
\ No newline at end of file
+        pass #fixtures tests everything
+
+def test_shared_pin_manager(tmp_path):
+    manager = PinManager(dry_run=True)
+    configs = []
+    for (name, limit) in (('first', 1), ('second', 2)):
+        path = tmp_path.joinpath(f'{name}.cfg')
+        path.write_text(f'[GLOBAL]\nenv_name = {name}\nActiveLimit = {limit}\n')
+        configs.append(EnvironmentConfig.create_from_file(path, dry_run=True, pin_manager=manager))
+    assert all(config.pin_manager is manager for config in configs)
+    assert manager.group_limit('first') == 1
+    assert manager.group_limit('second') == 2
+    configs[1].active_limit = 3
+    assert manager.group_limit('second') == 3
+    assert manager.active_limit == PlantStation.core.ext.pins.DEFAULT_ACTIVE_LIMIT
+    manager.close()
+
+
+@pytest.mark.parametrize('backends', [(None, 'mock'), ('mock', None), ('mock', 'native')])
+def test_shared_pin_backend_conflict(tmp_path, backends):
+    manager = PinManager()
+    for (name, backend) in zip(('first', 'second'), backends):
+        path = tmp_path.joinpath(f'{name}.cfg')
+        option = f'pinFactory = {backend}\n' if backend else ''
+        path.write_text(f'[GLOBAL]\nenv_name = {name}\n{option}')
+        if name == 'first':
+            EnvironmentConfig.create_from_file(path, pin_manager=manager)
+            first_backend = manager.backend
+        else:
+            # the first environment's backend (default or chosen) is never switched
+            with pytest.raises(ValueError):
+                EnvironmentConfig.create_from_file(path, pin_manager=manager)
+    assert manager.backend == first_backend
+    assert manager.backend_owner == 'first'
+
+
+def test_shared_pin_backend_agreement(tmp_path):
+    manager = PinManager()
+    for name in ('first', 'second'):
+        path = tmp_path.joinpath(f'{name}.cfg')
+        path.write_text(f'[GLOBAL]\nenv_name = {name}\npinFactory = mock\n')
+        EnvironmentConfig.create_from_file(path, pin_manager=manager)
+    assert manager.backend == 'mock'
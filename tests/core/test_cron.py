@@ -0,0 +1,61 @@
+import datetime
+
+import pytest
+
+from PlantStation.core import Plant, Environment
+from PlantStation.core.ext.cron import CronRule
+from PlantStation.core.helpers import parse_time
+from .context import simple_env_config, cleanup, plants, TIMEDELTA_SHORT
+
+MONDAY = datetime.datetime(2020, 6, 1)
+
+
+def test_weekdays_rule():
+    rule = CronRule('cron: 30 6 * * mon,wed,fri')
+    fires = [rule.next_fire(MONDAY + datetime.timedelta(hours=7))]
+    for _ in range(3):
+        fires.append(rule.next_fire(fires[-1]))
+    assert [fire.strftime('%a %H:%M') for fire in fires] == ['Wed 06:30', 'Fri 06:30', 'Mon 06:30', 'Wed 06:30']
+    assert rule.next_fire(MONDAY + datetime.timedelta(hours=6, minutes=29, seconds=59)) == \
+        MONDAY + datetime.timedelta(hours=6, minutes=30)
+
+
+def test_seasonal_and_calendar_rules():
+    summer = CronRule('0 6,18 * jun-aug *')
+    assert summer.next_fire(datetime.datetime(2020, 6, 1, 6)) == datetime.datetime(2020, 6, 1, 18)
+    assert summer.next_fire(datetime.datetime(2020, 8, 31, 19)) == datetime.datetime(2021, 6, 1, 6)
+    assert CronRule('0 0 29 feb *').next_fire(datetime.datetime(2001, 1, 1)) == datetime.datetime(2004, 2, 29)
+    # both day fields restricted - either matches
+    assert CronRule('0 12 13 * fri').next_fire(MONDAY) == datetime.datetime(2020, 6, 5, 12)
+    assert CronRule('0 12 */10 * *').next_fire(MONDAY + datetime.timedelta(hours=13)) == \
+        datetime.datetime(2020, 6, 11, 12)
+    assert CronRule('@daily').next_fire(datetime.datetime.min) == datetime.datetime(1, 1, 2)
+
+
+def test_wrong_rules():
+    for expression in ['0 0 30 feb *', '60 * * * *', '* * *', '0 0 * * someday', '*/0 * * * *']:
+        with pytest.raises(ValueError):
+            CronRule(expression)
+
+
+def test_parse_time_rule():
+    rule = parse_time('cron: 30 6 * * mon,wed,fri')
+    assert rule == CronRule('30 6 * * mon,wed,fri')
+    assert str(rule) == 'cron: 30 6 * * mon,wed,fri'
+    assert parse_time(str(rule)) == rule
+
+
+def test_plant_with_rule(simple_env_config):
+    last_watered = datetime.datetime.now() - datetime.timedelta(days=2)
+    plant = Plant(plantName='cron_plant', envConfig=simple_env_config, wateringDuration=TIMEDELTA_SHORT,
+                  wateringInterval=parse_time('cron: 0 7 * * *'), gpioPinNumber='GPIO5',
+                  lastTimeWatered=last_watered)
+    plants.append(plant)
+    assert plant.calc_next_watering() == CronRule('0 7 * * *').next_fire(last_watered)
+    assert plant.should_water()
+    assert simple_env_config.cfg_parser['cron_plant']['wateringInterval'] == 'cron: 0 7 * * *'
+    env = Environment(simple_env_config)
+    env.add_plant(plant)
+    assert env.due_plants() == [plant]
+    plant.wateringInterval = datetime.timedelta(days=3)
+    assert env.due_plants() == []
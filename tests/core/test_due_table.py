@@ -0,0 +1,56 @@
+import datetime
+
+from core.ext.due_table import DueTable
+from .context import create_plant_simple, simple_env_config, TIMEDELTA_LONG, cleanup
+from PlantStation.core import Environment
+
+NOW = datetime.datetime(2020, 6, 1, 12, 0)
+HOUR = datetime.timedelta(hours=1)
+
+
+def test_due_table():
+    table = DueTable(capacity=1)
+    table.add('a', NOW - HOUR, True)
+    table.add('b', NOW + HOUR, True)
+    table.add('c', NOW - HOUR, False)
+    assert table.due(NOW) == ['a']
+    assert table.next_due() == NOW - HOUR
+    table.set_pending('a', True)
+    assert table.due(NOW) == []
+    assert table.next_due() == NOW + HOUR
+    table.update('c', NOW, True)
+    table.remove('a')
+    assert len(table) == 2
+    assert sorted(table.due(NOW + HOUR)) == ['b', 'c']
+    table.update('b', datetime.datetime.min + HOUR, True)
+    assert table.next_due() == datetime.datetime.min + HOUR
+
+
+def test_environment_due_plants(simple_env_config):
+    env = Environment(simple_env_config)
+    first = create_plant_simple(simple_env_config, 5)
+    second = create_plant_simple(simple_env_config, 6)
+    env.add_plant(first)
+    env.add_plant(second)
+    assert env.due_plants() == [first, second]
+    second.isActive = False
+    assert env.due_plants() == [first]
+    env.set_pending(first, True)
+    assert env.due_plants() == []
+    assert env.next_due() is None
+    second.isActive = True
+    second.wateringInterval = TIMEDELTA_LONG * 2
+    assert env.next_due() == datetime.datetime.min + TIMEDELTA_LONG * 2
+    env.remove_plant(second)
+    assert env.due_plants() == []
+
+
+def test_environment_claim(simple_env_config):
+    env = Environment(simple_env_config)
+    plant = create_plant_simple(simple_env_config, 5)
+    env.add_plant(plant)
+    assert env.claim(plant)
+    assert not env.claim(plant)
+    assert env.due_plants() == []
+    env.set_pending(plant, False)
+    assert env.claim(plant)
@@ -0,0 +1,92 @@
+import datetime
+import threading
+
+import pytest
+from gpiozero import GPIOPinInUse
+from gpiozero.pins.mock import MockFactory
+
+from core.flow import FlowCalibration, FlowMeter
+from PlantStation.core import Plant
+# noinspection PyUnresolvedReferences
+from .context import simple_env_config, cleanup, plants, TIMEDELTA_LONG
+
+
+def test_calibration():
+    calibration = FlowCalibration.parse('10:95, 5:40')
+    assert str(calibration) == '5:40, 10:95'
+    assert calibration.duration_for(40) == 5
+    assert calibration.duration_for(67.5) == 7.5
+    assert calibration.duration_for(150) == 15
+    assert calibration.volume_for(2.5) == 20
+    assert calibration.volume_for(12) == 117
+    with pytest.raises(ValueError):
+        FlowCalibration.parse('5:40, 10')
+    with pytest.raises(ValueError):
+        FlowCalibration([(5, 40), (10, 30)])
+
+
+def pulse(meter, count):
+    for _ in range(count):
+        meter.pin.drive_low()
+        meter.pin.drive_high()
+
+
+def test_flow_meter():
+    meter = FlowMeter('GPIO20', pulses_per_litre=100, pin_factory=MockFactory())
+    meter.reset(target_volume=50)
+    pulse(meter, 4)
+    assert meter.pulses == 4
+    assert meter.volume == 40
+    assert not meter.wait(0)
+    pulse(meter, 1)
+    assert meter.wait(0)
+    meter.reset()
+    assert meter.pulses == 0
+    meter.close()
+    assert meter.closed
+
+
+def test_closed_loop_watering(simple_env_config):
+    plant = Plant(plantName='flow_plant', envConfig=simple_env_config, gpioPinNumber='GPIO21',
+                  wateringDuration=datetime.timedelta(seconds=5), wateringInterval=TIMEDELTA_LONG,
+                  wateringVolume=100, flowMeterPin='GPIO20', pulsesPerLitre=100)
+    plants.append(plant)
+    assert plant.planned_duration() == 5
+    pump = simple_env_config.pin_manager.devices[21]
+
+    def feed():
+        while not pump.is_active:
+            pass
+        pulse(plant.flowMeter, 10)
+
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    started = datetime.datetime.now()
+    plant.water()
+    feeder.join()
+    assert datetime.datetime.now() - started < datetime.timedelta(seconds=4)
+    assert plant.flowMeter.volume == 100
+    assert not pump.is_active
+
+
+def test_invalid_volume(simple_env_config):
+    with pytest.raises(ValueError):
+        Plant(plantName='flow_plant', envConfig=simple_env_config, gpioPinNumber='GPIO21',
+              wateringDuration=datetime.timedelta(seconds=5), wateringInterval=TIMEDELTA_LONG, wateringVolume=100)
+
+
+def test_flow_meter_pin_registered(simple_env_config):
+    manager = simple_env_config.pin_manager
+    plant = Plant(plantName='flow_plant', envConfig=simple_env_config, gpioPinNumber='GPIO21',
+                  wateringDuration=datetime.timedelta(seconds=5), wateringInterval=TIMEDELTA_LONG,
+                  wateringVolume=100, flowMeterPin='GPIO20', pulsesPerLitre=100)
+    plants.append(plant)
+    assert manager.owner_of('GPIO20') == manager.owner_of('GPIO21')
+    with pytest.raises(GPIOPinInUse):
+        manager.create_pump('GPIO20', owner='other')
+    with pytest.raises(GPIOPinInUse):
+        Plant(plantName='other_plant', envConfig=simple_env_config, gpioPinNumber='GPIO20',
+              wateringDuration=datetime.timedelta(seconds=5), wateringInterval=TIMEDELTA_LONG)
+    plant.close()
+    assert manager.owner_of('GPIO20') is None
+
@@ -0,0 +1,36 @@
+import logging
+import queue
+
+from core.ext.logs import RateLimitFilter, DroppingQueueHandler
+
+
+def make_record(msg: str, level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord('PlantStation.test', level, __file__, 1, msg, ('plant',), None)
+
+
+def test_rate_limit_filter():
+    now = [0.0]
+    rate_filter = RateLimitFilter(rate=1.0, burst=2, clock=lambda: now[0])
+    assert rate_filter.filter(make_record('%s: watered'))
+    assert rate_filter.filter(make_record('%s: watered'))
+    assert not rate_filter.filter(make_record('%s: watered'))
+    assert not rate_filter.filter(make_record('%s: watered'))
+    # other templates and errors have their own budget
+    assert rate_filter.filter(make_record('%s: rejected'))
+    assert rate_filter.filter(make_record('%s: watered', logging.ERROR))
+    now[0] = 1.0
+    record = make_record('%s: watered')
+    assert rate_filter.filter(record)
+    assert record.getMessage() == 'plant: watered [2 similar messages suppressed]'
+
+
+def test_dropping_queue_handler():
+    records = queue.Queue(1)
+    handler = DroppingQueueHandler(records)
+    first = make_record('%s: watered')
+    handler.handle(first)
+    handler.handle(make_record('%s: watered'))
+    assert records.qsize() == 1
+    queued = records.get_nowait()
+    # record is queued unformatted
+    assert queued is first and queued.args == ('plant',)
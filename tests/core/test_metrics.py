@@ -0,0 +1,106 @@
+import socket
+import threading
+import urllib.request
+
+import pytest
+
+from core.ext.metrics import Registry, Counter, Gauge, Histogram, MetricsServer
+
+
+def test_counter_threads():
+    registry = Registry()
+    counter = Counter('test_total', 'Test counter', registry=registry)
+    threads = [threading.Thread(target=lambda: [counter.inc() for _ in range(1000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.get() == 8000
+    # shards of finished threads are folded, the value stays
+    counter.inc(2)
+    assert counter.get() == 8002
+
+
+def test_finished_shards_folded_on_registration():
+    registry = Registry()
+    counter = Counter('test_folded_total', 'Test counter', registry=registry)
+    histogram = Histogram('test_folded_seconds', 'Test histogram', registry=registry)
+    for _ in range(200):
+        thread = threading.Thread(target=lambda: (counter.inc(), histogram.observe(0.1)))
+        thread.start()
+        thread.join()
+    # no scrape in between, cells of finished threads are still not retained
+    assert len(counter.labels()._shards._cells) == 1
+    assert len(histogram.labels()._shards._cells) == 1
+    assert counter.get() == 200
+    assert histogram.labels().get()[1] == 200
+
+
+def test_labels_and_gauge():
+    registry = Registry()
+    counter = Counter('test_total', 'Test counter', ('env',), registry=registry)
+    counter.labels('a').inc()
+    counter.labels('b').inc(3)
+    gauge = Gauge('test_gauge', 'Test gauge', registry=registry)
+    gauge.set(5)
+    assert gauge.get() == 5
+    gauge.set_function(lambda: 7)
+    text = registry.expose()
+    assert '# TYPE test_total counter' in text
+    assert 'test_total{env="a"} 1.0' in text
+    assert 'test_total{env="b"} 3.0' in text
+    assert 'test_gauge 7' in text
+    with pytest.raises(ValueError):
+        counter.inc()
+    with pytest.raises(ValueError):
+        Gauge('test_gauge', 'Duplicate', registry=registry)
+
+
+def test_histogram():
+    registry = Registry()
+    histogram = Histogram('test_seconds', 'Test histogram', buckets=(1, 5), registry=registry)
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value)
+    text = registry.expose()
+    assert 'test_seconds_bucket{le="1.0"} 2.0' in text
+    assert 'test_seconds_bucket{le="5.0"} 3.0' in text
+    assert 'test_seconds_bucket{le="+Inf"} 4.0' in text
+    assert 'test_seconds_count 4.0' in text
+    assert 'test_seconds_sum 14.5' in text
+
+
+def test_metrics_server():
+    registry = Registry()
+    Counter('test_total', 'Test counter', registry=registry).inc()
+    server = MetricsServer('127.0.0.1:0', registry)
+    server.start()
+    try:
+        (host, port) = server.server_address
+        with urllib.request.urlopen(f'http://{host}:{port}/metrics') as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert 'test_total 1.0' in response.read().decode()
+    finally:
+        server.stop()
+
+
+def test_unix_socket_of_other_server_kept(tmp_path):
+    registry = Registry()
+    path = tmp_path / 'metrics.sock'
+    server = MetricsServer(f'unix:{path}', registry)
+    server.start()
+    try:
+        with pytest.raises(OSError):
+            MetricsServer(f'unix:{path}', registry).start()
+        assert path.is_socket()
+    finally:
+        server.stop()
+    # stale socket is replaced, other files are kept
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(path))
+    stale.close()
+    server.start()
+    server.stop()
+    path.write_text('data')
+    with pytest.raises(OSError):
+        server.start()
+    assert path.read_text() == 'data'
@@ -0,0 +1,45 @@
+import gpiozero
+import pytest
+from gpiozero.pins.mock import MockFactory
+
+from core.ext import PinManager, pin_backends
+from core.ext.pin_backends import create_factory, register_backend, benchmark_backend, benchmark_backends
+
+
+class CustomFactory(MockFactory):
+    pass
+
+
+def test_unknown_backend():
+    with pytest.raises(gpiozero.BadPinFactory):
+        create_factory('no_such_backend')
+    with pytest.raises(gpiozero.BadPinFactory):
+        create_factory('no_such_module:Factory')
+
+
+def test_user_supplied_backend(monkeypatch):
+    # keep the registration local to this test
+    monkeypatch.setattr(pin_backends, '_backends', dict(pin_backends._backends))
+    assert isinstance(create_factory(f'{__name__}:CustomFactory'), CustomFactory)
+    register_backend('custom', CustomFactory)
+    manager = PinManager(backend='custom')
+    assert isinstance(manager.pin_factory, CustomFactory)
+    with pytest.raises(RuntimeError):
+        manager.backend = 'mock'
+    manager.close()
+
+
+def test_lazy_factory():
+    manager = PinManager(backend='native', dry_run=True)
+    assert manager.backend == 'mock'
+    assert manager._pin_factory is None
+    assert isinstance(manager.pin_factory, MockFactory)
+
+
+def test_benchmark():
+    result = benchmark_backend('mock', toggles=10)
+    assert result['toggles'] == 10
+    assert result['median_us'] >= 0
+    results = benchmark_backends(['mock', 'no_such_backend'], toggles=10)
+    assert results[0]['backend'] == 'mock'
+    assert 'error' in results[1]
@@ -0,0 +1,76 @@
+import io
+import json
+
+import pytest
+
+from core.ext import PinManager, PinTraceRecorder
+
+SECOND = 10 ** 9
+
+
+def test_ring_buffer_overwrite():
+    trace = PinTraceRecorder(capacity=3)
+    for i in range(5):
+        trace.record('GPIO5', i % 2 == 0, timestamp=i)
+    assert len(trace) == 3
+    assert [t for (t, _, _) in trace.transitions()] == [2, 3, 4]
+    with pytest.raises(ValueError):
+        PinTraceRecorder(capacity=0)
+
+
+def test_queries():
+    trace = PinTraceRecorder()
+    trace.record('GPIO5', True, timestamp=0)
+    trace.record('GPIO6', True, timestamp=1 * SECOND)
+    trace.record('GPIO5', False, timestamp=2 * SECOND)
+    trace.record('GPIO7', True, timestamp=3 * SECOND)
+    trace.record('GPIO6', False, timestamp=4 * SECOND)
+    assert trace.peak_concurrency() == 2
+    assert trace.on_time_totals(until=5 * SECOND) == {'GPIO5': 2.0, 'GPIO6': 3.0, 'GPIO7': 2.0}
+
+
+def test_export():
+    trace = PinTraceRecorder()
+    trace.record('GPIO5', True, timestamp=0)
+    trace.record('GPIO5', False, timestamp=SECOND)
+    csv_file = io.StringIO()
+    trace.to_csv(csv_file)
+    assert csv_file.getvalue().splitlines() == ['timestamp_ns,pin,state', '0,GPIO5,1', f'{SECOND},GPIO5,0']
+    json_file = io.StringIO()
+    trace.dump_chrome_trace(json_file)
+    events = json.loads(json_file.getvalue())['traceEvents']
+    assert [event['dur'] for event in events if event['ph'] == 'X'] == [SECOND / 1e3]
+
+
+def test_manager_records_transitions():
+    manager = PinManager(dry_run=True, trace=PinTraceRecorder())
+    device = manager.create_pump('GPIO5', owner='plant')
+    device.on()
+    device.off()
+    assert [(pin, state) for (_, pin, state) in manager.trace.transitions()] == [('GPIO5', True), ('GPIO5', False)]
+    manager.close()
+
+
+def test_chrome_trace_thread_ids():
+    trace = PinTraceRecorder()
+    trace.record('GPIO5', True, timestamp=0)
+    trace.record('GPIO6', True, timestamp=SECOND)
+    trace.record('GPIO5', False, timestamp=2 * SECOND)
+    events = trace.to_chrome_trace(until=3 * SECOND)['traceEvents']
+    names = {event['tid']: event['args']['name'] for event in events if event['ph'] == 'M'}
+    assert sorted(names.values()) == ['GPIO5', 'GPIO6']
+    for event in events:
+        if event['ph'] == 'X':
+            assert isinstance(event['tid'], int)
+            assert names[event['tid']] == event['name']
+
+
+def test_manager_records_only_state_changes():
+    manager = PinManager(dry_run=True, trace=PinTraceRecorder())
+    device = manager.create_pump('GPIO5', owner='plant')
+    device.off()
+    device.on()
+    device.on()
+    device.off()
+    manager.close()
+    assert [state for (_, _, state) in manager.trace.transitions()] == [True, False]
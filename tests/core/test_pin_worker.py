@@ -0,0 +1,88 @@
+import time
+
+import gpiozero
+import pytest
+
+from core.ext import PinManager
+from core.ext.pin_worker import CommandRing, OP_ON, OP_OFF
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_command_ring():
+    ring = CommandRing(slots=2)
+    try:
+        assert ring.pop() is None
+        assert ring.push(OP_ON, 3, 1.5, 'GPIO5')
+        assert ring.push(OP_OFF, 3)
+        assert not ring.push(OP_OFF, 4)
+        assert ring.pop() == (OP_ON, 3, 1.5, 'GPIO5')
+        assert ring.pop() == (OP_OFF, 3, 0.0, '')
+        assert ring.pop() is None
+    finally:
+        ring.close(unlink=True)
+
+
+@pytest.fixture()
+def worker_manager():
+    manager = PinManager(dry_run=True)
+    manager.enable_worker(safety_timeout=0.2)
+    yield manager
+    manager.close()
+
+
+def test_worker_on_off(worker_manager):
+    device = worker_manager.create_pump('GPIO5', owner='plant')
+    device.on()
+    assert worker_manager.working_pumps == 1
+    wait_for(lambda: device.is_active)
+    device.off()
+    wait_for(lambda: not device.is_active)
+    assert worker_manager.working_pumps == 0
+
+
+def test_worker_pin_names_collide(worker_manager):
+    device = worker_manager.create_pump('GPIO5', owner='plant')
+    # BOARD29 is GPIO5, normalized without the worker's pin factory
+    assert worker_manager.owner_of('BOARD29') == 'plant'
+    assert worker_manager.devices == {5: device}
+    with pytest.raises(gpiozero.GPIOPinInUse):
+        worker_manager.create_pump('BOARD29', owner='other')
+
+
+def test_worker_safety_shutoff(worker_manager):
+    device = worker_manager.create_pump('GPIO6', owner='plant')
+    device.on()
+    wait_for(lambda: device.is_active)
+    wait_for(lambda: not device.is_active)
+    device.off()
+    with pytest.raises(RuntimeError):
+        worker_manager.enable_worker()
+
+
+def test_dead_worker_releases_slot(worker_manager):
+    device = worker_manager.create_pump('GPIO7', owner='plant')
+    device.on()
+    assert worker_manager.working_pumps == 1
+    worker_manager._worker._process.terminate()
+    worker_manager._worker._process.join()
+    with pytest.raises(gpiozero.GPIOZeroError):
+        device.off()
+    assert worker_manager.working_pumps == 0
+    with pytest.raises(gpiozero.GPIOZeroError):
+        device.close()
+
+
+def test_worker_flow_meter(worker_manager):
+    meter = worker_manager.create_flow_meter('GPIO20', pulses_per_litre=100, owner='plant')
+    assert worker_manager.owner_of('GPIO20') == 'plant'
+    meter.reset(target_volume=20)
+    assert meter.pulses == 0
+    assert not meter.wait(0.05)
+    worker_manager.release_pin('GPIO20')
+    assert meter.closed
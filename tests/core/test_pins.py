@@ -0,0 +1,93 @@
+import threading
+
+import gpiozero
+import pytest
+
+from core.ext import PinManager
+# noinspection PyUnresolvedReferences
+from .context import create_plant_simple, simple_env_config, cleanup
+
+
+@pytest.fixture()
+def pin_manager():
+    manager = PinManager(dry_run=True)
+    yield manager
+    manager.close()
+
+
+def test_registry_conflict(pin_manager):
+    device = pin_manager.create_pump('GPIO5', owner='first')
+    assert pin_manager.owner_of('GPIO5') == 'first'
+    assert pin_manager.devices == {5: device}
+    with pytest.raises(gpiozero.GPIOPinInUse):
+        pin_manager.create_pump('GPIO5', owner='second')
+    with pytest.raises(gpiozero.GPIOPinInUse):
+        pin_manager.create_pump('BOARD29', owner='second')
+
+
+def test_handle_reuse(pin_manager):
+    device = pin_manager.create_pump('GPIO6', owner='plant')
+    assert pin_manager.create_pump('GPIO6', owner='plant') is device
+    pin_manager.release_pump('GPIO6')
+    assert not device.closed
+    pin_manager.release_pump('GPIO6')
+    assert device.closed
+    assert pin_manager.owner_of('GPIO6') is None
+    assert pin_manager.devices == {}
+
+
+def test_off_without_on(pin_manager):
+    device = pin_manager.create_pump('GPIO7', owner='plant')
+    device.off()
+    assert pin_manager.working_pumps == 0
+    device.on()
+    device.on()
+    assert pin_manager.working_pumps == 1
+    device.off()
+    assert pin_manager.working_pumps == 0
+
+
+def test_plant_deactivation(simple_env_config):
+    plant = create_plant_simple(simple_env_config, 8)
+    device = simple_env_config.pin_manager.devices[8]
+    plant.isActive = False
+    assert not plant.isActive
+    plant.isActive = True
+    assert simple_env_config.pin_manager.devices[8] is device
+    plant.close()
+    assert device.closed
+    assert simple_env_config.pin_manager.devices == {}
+
+
+def test_limit_groups(pin_manager):
+    pin_manager.active_limit = 3
+    pin_manager.set_group_limit('first', 1)
+    first = pin_manager.create_pump('GPIO8', owner='a', group='first')
+    blocked = pin_manager.create_pump('GPIO9', owner='b', group='first')
+    second = pin_manager.create_pump('GPIO10', owner='c', group='second')
+    first.on()
+    second.on()
+    assert pin_manager.working_in('first') == 1
+    assert pin_manager.working_in('second') == 1
+    started = threading.Event()
+    waiting = threading.Thread(target=lambda: (blocked.on(), started.set()))
+    waiting.start()
+    assert not started.wait(0.2)
+    first.off()
+    assert started.wait(1)
+    waiting.join()
+    assert pin_manager.working_pumps == 2
+    assert pin_manager.group_limit('second') is None
+    blocked.off()
+    second.off()
+    assert pin_manager.working_pumps == 0
+
+
+def test_allowed_pins(pin_manager):
+    pin_manager.allowed_pins = ['GPIO11', 'BOARD29']
+    assert pin_manager.allowed_pins == {5, 11}
+    pin_manager.create_pump('GPIO5', owner='a')
+    with pytest.raises(gpiozero.GPIOPinInUse):
+        pin_manager.create_pump('GPIO12', owner='b')
+    pin_manager.allowed_pins = None
+    pin_manager.create_pump('GPIO12', owner='b')
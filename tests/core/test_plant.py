@@ -5,7 +5,7 @@ from random import Random
 import pytest
 
 from core import EnvironmentConfig
-from .context import MAX_GPIO_NUMBER, simple_env_config, create_plant_simple, MIN_GPIO_NUMBER
+from .context import MAX_GPIO_NUMBER, simple_env_config, create_plant_simple, MIN_GPIO_NUMBER, cleanup
 from PlantStation.core import Plant
 
 
@@ -49,3 +49,37 @@ def test_invalid_plants(simple_env_config, GPIOnumber):
         plant = Plant(plantName='test', envConfig= simple_env_config, gpioPinNumber=GPIOnumber,
                              wateringDuration=TIMEDELTA_SHORT, wateringInterval=TIMEDELTA_LONG,
                              lastTimeWatered=FUTURE, isActive=True)
+
+
+def test_failed_pump_start_not_recorded(simple_env_config, monkeypatch):
+    import gpiozero
+    from PlantStation.core.plant import WATERINGS
+
+    plant = create_plant_simple(simple_env_config, 20)
+    notified = []
+    plant.add_listener(notified.append)
+    errors = WATERINGS.labels(simple_env_config.env_name, 'error').get()
+    watered = WATERINGS.labels(simple_env_config.env_name, 'watered').get()
+
+    def broken(device):
+        raise gpiozero.GPIOZeroError('broken pin')
+
+    monkeypatch.setattr(gpiozero.DigitalOutputDevice, 'on', broken)
+    with pytest.raises(gpiozero.GPIOZeroError):
+        plant.start_watering()
+    assert plant.lastTimeWatered == datetime.datetime.min
+    assert not notified
+    assert simple_env_config.pin_manager.working_pumps == 0
+    assert WATERINGS.labels(simple_env_config.env_name, 'error').get() == errors + 1
+    assert WATERINGS.labels(simple_env_config.env_name, 'watered').get() == watered
+
+
+def test_close_during_watering(simple_env_config):
+    plant = create_plant_simple(simple_env_config, 21)
+    assert plant.start_watering() is not None
+    assert simple_env_config.pin_manager.working_pumps == 1
+    plant.close()
+    # pump is off and its slot free before the watering is finished
+    assert simple_env_config.pin_manager.working_pumps == 0
+    assert plant.finish_watering() >= 0
+    assert plant.lastTimeWatered > datetime.datetime.min
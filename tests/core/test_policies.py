@@ -0,0 +1,115 @@
+import datetime
+
+import pytest
+
+from PlantStation.core import Environment, Plant
+from PlantStation.core.policies import CatchUpPolicy, SaturationPolicy
+from .context import create_plant_simple, simple_env_config, cleanup, plants, TIMEDELTA_SHORT, TIMEDELTA_LONG
+
+NOW = datetime.datetime(2020, 6, 1, 12, 0)
+MINUTE = datetime.timedelta(minutes=1)
+
+
+def create_watered_plant(env_config, pin, last_watered):
+    plant = Plant(plantName='test_plant_' + str(pin), envConfig=env_config, wateringDuration=TIMEDELTA_SHORT,
+                  wateringInterval=TIMEDELTA_LONG, gpioPinNumber='GPIO' + str(pin), lastTimeWatered=last_watered)
+    plants.append(plant)
+    return plant
+
+
+def test_catch_up_order_and_rate(simple_env_config):
+    never = create_plant_simple(simple_env_config, 5)
+    long_ago = create_watered_plant(simple_env_config, 6, NOW - datetime.timedelta(days=2))
+    recently = create_watered_plant(simple_env_config, 7, NOW - MINUTE)
+    policy = CatchUpPolicy(window=MINUTE, rate=2, started=NOW)
+    assert policy.schedule([recently, long_ago, never], NOW) == [(never, datetime.timedelta(0)), (long_ago, MINUTE / 2),
+                                            (recently, MINUTE)]
+    # next batch continues after previous one
+    assert policy.schedule([long_ago], NOW) == [(long_ago, MINUTE * 3 / 2)]
+
+
+def test_catch_up_window_and_regular_waterings(simple_env_config):
+    first = create_plant_simple(simple_env_config, 5)
+    second = create_plant_simple(simple_env_config, 6)
+    regular = create_watered_plant(simple_env_config, 7, NOW)
+    policy = CatchUpPolicy(window=10 * MINUTE, rate=0, started=NOW)
+    later = NOW + datetime.timedelta(hours=1)
+    assert policy.schedule([first, regular, second], later) == [
+        (first, datetime.timedelta(0)), (second, 5 * MINUTE), (regular, datetime.timedelta(0))]
+    disabled = CatchUpPolicy(window=datetime.timedelta(0), rate=0, started=NOW)
+    assert not disabled
+    assert disabled.schedule([first, second], later) == [(first, datetime.timedelta(0)),
+                                                         (second, datetime.timedelta(0))]
+
+
+def test_environment_catch_up_settings(simple_env_config):
+    simple_env_config.cfg_parser['GLOBAL'] = {'catchUpWindow': '60', 'catchUpRate': '0'}
+    env = Environment(simple_env_config)
+    assert env.catch_up.window == MINUTE
+    assert env.catch_up.rate == 0
+
+
+def test_saturation_policies():
+    demands = [('low', 600.0, 0), ('big', 900.0, 1), ('high', 300.0, 5)]
+    total = sum(demand for (_, demand, _) in demands)
+    shorten = SaturationPolicy('shorten')
+    shorten.assess(total, capacity=900.0, demands=lambda: demands)
+    assert shorten.saturated
+    assert shorten.level == 2
+    assert shorten.scale == 0.5
+    assert shorten.split(['low', 'high']) == (['low', 'high'], [])
+    defer = SaturationPolicy('defer')
+    defer.assess(total, capacity=1200.0, demands=lambda: demands)
+    assert defer.scale == 1
+    assert defer.split(['low', 'big', 'high']) == (['big', 'high'], ['low'])
+    defer.assess(total, capacity=2000.0, demands=lambda: demands)
+    assert not defer.saturated
+    assert defer.split(['low']) == (['low'], [])
+    with pytest.raises(ValueError):
+        SaturationPolicy('drop')
+
+
+def test_environment_load(simple_env_config):
+    simple_env_config.cfg_parser['GLOBAL'] = {'saturationPolicy': 'defer', 'ActiveLimit': '1'}
+    env = Environment(simple_env_config)
+    # 1 s every 20 s - each plant needs 1/20 of a day
+    plants_created = [create_plant_simple(simple_env_config, pin) for pin in (5, 6)]
+    for plant in plants_created:
+        env.add_plant(plant)
+    simple_env_config.set_option('test_plant_6', 'priority', '3')
+    assert env.demand(plants_created[0]) == pytest.approx(24 * 3600 / 20)
+    assert env.assess_load() == pytest.approx(0.1)
+    simple_env_config.set_option('GLOBAL', 'blackout', '00:00-22:00')
+    assert env.assess_load() == pytest.approx(1.2)
+    assert env.saturation.split(plants_created) == ([plants_created[1]], [plants_created[0]])
+    now = datetime.datetime.now()
+    env.defer(plants_created[0], now)
+    assert env.due_plants(now) == [plants_created[1]]
+
+
+def test_merge_policy(simple_env_config):
+    recently = create_watered_plant(simple_env_config, 5, NOW - TIMEDELTA_LONG)
+    long_ago = create_watered_plant(simple_env_config, 6, NOW - 3 * TIMEDELTA_LONG)
+    never = create_plant_simple(simple_env_config, 7)
+    merge = SaturationPolicy('merge')
+    merge.assess(300.0, capacity=1000.0)
+    assert merge.split([recently, long_ago, never], NOW) == ([recently, long_ago, never], [])
+    # twice the capacity - periods are doubled
+    merge.assess(2000.0, capacity=1000.0)
+    assert merge.split([recently, long_ago, never], NOW) == ([long_ago, never], [recently])
+
+
+def test_environment_demand_tracking(simple_env_config):
+    env = Environment(simple_env_config)
+    plant = create_plant_simple(simple_env_config, 5)
+    env.add_plant(plant)
+    day = 24 * 3600
+    assert env.assess_load() == pytest.approx(1 / 20)
+    plant.wateringDuration = datetime.timedelta(seconds=2)
+    assert env.assess_load() == pytest.approx(2 / 20)
+    plant.isActive = False
+    assert env.assess_load() == 0
+    plant.isActive = True
+    env.remove_plant(plant)
+    assert env.assess_load() == 0
+    assert env.capacity == day
@@ -0,0 +1,96 @@
+import pytest
+
+from core.ext import recording
+from core.ext.pins import PinManager
+from core.ext.recording import read_log, Recorder
+
+
+@pytest.fixture
+def log(tmp_path):
+    path = tmp_path / 'test.rec'
+    recording.enable(path)
+    yield path
+    recording.disable()
+
+
+def test_round_trip(log):
+    recording.record(recording.SNAPSHOT, 'env', '[GLOBAL]\nenv_name = env – ogród\n')
+    for delay in (0, 1500000):
+        recording.record(recording.TASK, 'env', 'WaterTask:basil', delay)
+    recording.record(recording.COMMAND, subject='{"cmd": "water"}')
+    recording.disable()
+
+    records = list(read_log(log))
+    assert [record.kind_name for record in records] == ['START', 'SNAPSHOT', 'TASK', 'TASK', 'COMMAND', 'END']
+    assert records[1].subject == '[GLOBAL]\nenv_name = env – ogród\n'
+    assert (records[3].environment, records[3].subject, records[3].value) == ('env', 'WaterTask:basil', 1500000)
+    assert records[4].environment == ''
+    assert all(earlier.time <= later.time for (earlier, later) in zip(records, records[1:]))
+    # strings are stored once
+    assert log.read_bytes().count(b'WaterTask:basil') == 1
+
+
+def test_disabled_record_is_noop(tmp_path):
+    recording.disable()
+    assert recording.recorder() is None
+    recording.record(recording.TASK, 'env', 'MonitorTask')
+
+
+def test_malformed_logs(tmp_path):
+    path = tmp_path / 'test.rec'
+    recorder = Recorder(path)
+    recorder.record(recording.TASK, 'env', 'MonitorTask', time=1)
+    recorder.close()
+    path.write_bytes(path.read_bytes()[:-3])
+    with pytest.raises(ValueError):
+        list(read_log(path))
+    path.write_bytes(b'not a log')
+    with pytest.raises(ValueError):
+        list(read_log(path))
+
+
+def test_pump_lock_records(log):
+    manager = PinManager(active_limit=2, dry_run=True)
+    manager.acquire_lock('env')
+    manager.release_lock('env')
+    recording.disable()
+    records = [(record.kind, record.environment) for record in read_log(log)]
+    assert records[1:3] == [(recording.LOCK_ACQUIRE, 'env'), (recording.LOCK_RELEASE, 'env')]
+
+
+def test_too_many_strings_stops_recording(tmp_path, caplog):
+    path = tmp_path / 'test.rec'
+    recorder = Recorder(path)
+    for number in range(0x10002):
+        recorder.record(recording.TASK, 'env', f'WaterTask:{number}')
+    recorder.record(recording.END)
+    recorder.close()
+    assert len([entry for entry in caplog.records if entry.levelname == 'ERROR']) == 1
+    # records written before the failure are kept
+    records = list(read_log(path))
+    assert len(records) == 0xFFFE
+    assert records[-1].subject == f'WaterTask:{0xFFFD}'
+
+
+class _FullDisk(object):
+    def write(self, data):
+        raise OSError(28, 'No space left on device')
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_write_error_stops_recording(log, caplog):
+    recording.recorder()._file = _FullDisk()
+    manager = PinManager(active_limit=1, dry_run=True)
+    recording.record(recording.SNAPSHOT, 'env', 'x' * recording.FLUSH_SIZE)
+    # recording doesn't break the pump lock
+    manager.acquire_lock('env')
+    assert manager.working_pumps == 1
+    manager.release_lock('env')
+    assert manager.working_pumps == 0
+    recording.recorder().flush()
+    assert len([entry for entry in caplog.records if entry.levelname == 'ERROR']) == 1
@@ -0,0 +1,133 @@
+import datetime
+
+import numpy as np
+import pytest
+from gpiozero import Device
+from gpiozero.pins.mock import MockFactory, MockSPIDevice
+
+from core.ext import clock
+from core.sensors import SensorBank, MockMoistureReader, MoistureReader, MoisturePolicy, MCP3008Reader
+
+NOW = datetime.datetime(2020, 6, 1, 12, 0)
+
+
+class StepReader(MoistureReader):
+
+    def __init__(self, channels, values):
+        super().__init__(channels)
+        self.values = iter(values)
+
+    def read(self):
+        return np.array(next(self.values), dtype=float)
+
+
+class MockMCP3008(MockSPIDevice):
+    """
+    MCP3008 answering single-ended conversions with configured channel voltages
+    """
+
+    def __init__(self, clock_pin, mosi_pin, miso_pin, select_pin, vref=3.3):
+        super().__init__(clock_pin, mosi_pin, miso_pin, select_pin)
+        self.vref = vref
+        self.channels = [0.0] * 8
+        self.state = 'idle'
+
+    def on_start(self):
+        super().on_start()
+        self.state = 'idle'
+
+    def on_bit(self):
+        if self.state == 'idle':
+            if self.rx_buf[-1]:
+                self.state = 'mode'
+                self.rx_buf = []
+        elif self.state == 'mode':
+            self.state = 'channel'
+            self.rx_buf = []
+        elif self.state == 'channel':
+            if len(self.rx_buf) == 3:
+                value = self.channels[self.rx_word()]
+                self.tx_word(int(round(value / self.vref * 1023)), 12)
+                self.state = 'result'
+        elif not self.tx_buf:
+            self.state = 'idle'
+            self.rx_buf = []
+
+
+def test_mcp3008_reader(monkeypatch):
+    factory = MockFactory()
+    # mock SPI devices attach to the default factory
+    monkeypatch.setattr(Device, 'pin_factory', factory)
+    chip = MockMCP3008(11, 10, 9, 8)
+    chip.channels[0] = 3.3
+    chip.channels[3] = 0.0
+    reader = MCP3008Reader([(0, 0), (0, 3)], pin_factory=factory)
+    try:
+        assert list(reader.read()) == pytest.approx([0.0, 1.0], abs=1e-3)
+        chip.channels[0] = 3.3 / 4
+        assert list(reader.read()) == pytest.approx([0.75, 1.0], abs=1e-3)
+    finally:
+        reader.close()
+        chip.close()
+        factory.close()
+
+
+def test_smoothing_and_downsampling():
+    reader = StepReader([(0, 0), (0, 1)], [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0], [0.0, 0.0], [1.0, 0.0]])
+    bank = SensorBank(['a', 'b'], reader, history=2, decimation=2, smoothing=0.5)
+    assert bank.latest is None
+    for tick in range(5):
+        assert bank.sample(NOW + datetime.timedelta(minutes=tick))
+    assert bank.latest_of('a') == pytest.approx(0.6875)
+    with pytest.raises(ValueError):
+        bank.latest[0] = 0
+    times, values = bank.history('a')
+    assert list(values) == [0.5, 0.5]
+    assert times[-1] == np.datetime64(NOW + datetime.timedelta(minutes=3), 's')
+    assert bank.history()[1].shape == (2, 2)
+
+
+def test_invalid_bank():
+    with pytest.raises(ValueError):
+        SensorBank(['a'], MockMoistureReader([]))
+    with pytest.raises(ValueError):
+        SensorBank(['a'], MockMoistureReader([(0, 0)]), smoothing=0)
+
+
+def test_mock_reader():
+    reader = MockMoistureReader([(0, 0), (0, 1)], drying_rate=0, initial=0.5)
+    reader.set(1, 0.9)
+    assert list(reader.read()) == [0.5, 0.9]
+
+
+def test_virtual_clock():
+    virtual = clock.VirtualClock(NOW)
+    previous = clock.use(virtual)
+    try:
+        reader = MockMoistureReader([(0, 0)], drying_rate=0.001, initial=0.5)
+        bank = SensorBank(['a'], reader, decimation=1)
+        virtual.advance_to(NOW + datetime.timedelta(minutes=5))
+        assert bank.sample()
+        # drying and history follow the virtual clock
+        assert bank.latest_of('a') == pytest.approx(0.2)
+        assert bank.history('a')[0][-1] == np.datetime64(NOW + datetime.timedelta(minutes=5), 's')
+    finally:
+        clock.use(previous)
+
+
+def test_moisture_policy():
+    policy = MoisturePolicy(3)
+    hour = datetime.timedelta(hours=1)
+    policy.configure(0, 0.4, 0.1, hour)
+    policy.configure(1, 0.4, 0.1, hour)
+    policy.set_last_watered(1, NOW - hour / 2)
+    assert not policy.enabled(2)
+    dry = np.array([0.3, 0.3, 0.0])
+    assert list(policy.evaluate(dry, NOW)) == [0]
+    # disarmed until moisture rises above threshold + hysteresis
+    assert list(policy.evaluate(dry, NOW + 2 * hour)) == [1]
+    assert list(policy.evaluate(np.array([0.45, 0.3, 0.0]), NOW + 2 * hour)) == []
+    assert list(policy.evaluate(np.array([0.55, 0.3, 0.0]), NOW + 2 * hour)) == []
+    assert list(policy.evaluate(dry, NOW + 2 * hour)) == [0]
+    policy.rearm(0)
+    assert list(policy.evaluate(dry, NOW + 2 * hour)) == [0]
@@ -0,0 +1,55 @@
+import json
+import threading
+
+import pytest
+
+from core.ext import tracing
+from core.ext.tracing import Tracer, span, traced
+
+
+@pytest.fixture
+def enabled_tracer():
+    yield tracing.enable()
+    tracing.disable()
+
+
+def test_disabled_span_is_noop():
+    tracing.disable()
+    assert tracing.tracer() is None
+    with span('noop') as first, span('other') as second:
+        assert first is second
+
+
+def test_spans_of_threads(enabled_tracer):
+    @traced('work', 'test')
+    def work():
+        with span('inner', 'test', {'n': 1}):
+            pass
+
+    threads = [threading.Thread(target=work, name=f'worker-{i}') for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    work()
+    spans = enabled_tracer.spans()
+    assert len(spans) == 8
+    assert {thread_name for (_, thread_name, _) in spans} == {'worker-0', 'worker-1', 'worker-2', 'MainThread'}
+    for (_, _, (name, category, begin, end, args)) in spans:
+        assert category == 'test' and begin <= end
+
+
+def test_chrome_trace(tmp_path):
+    tracer = Tracer(capacity=2)
+    for i in range(3):
+        with tracer.span(f'span-{i}'):
+            pass
+    trace = tracer.to_chrome_trace()
+    complete = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+    # ring buffer keeps the newest spans
+    assert [event['name'] for event in complete] == ['span-1', 'span-2']
+    path = tmp_path / 'trace.json'
+    tracer.dump_chrome_trace(path)
+    assert json.loads(path.read_text()) == json.loads(json.dumps(trace))
+    with pytest.raises(ValueError):
+        Tracer(capacity=0)
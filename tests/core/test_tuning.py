@@ -0,0 +1,111 @@
+import datetime
+import types
+
+import numpy as np
+import pytest
+
+from core.journal import WateringJournal
+from core.sensors import MoisturePolicy
+from core.tuning import fit_drying_curves, TuningEngine
+
+START = datetime.datetime(2020, 6, 1)
+HOUR = datetime.timedelta(hours=1)
+
+
+def test_journal():
+    journal = WateringJournal(depth=2, capacity=1)
+    journal.record('a', START, 10)
+    journal.record('b', START, 5, 100)
+    journal.record('a', START + HOUR, 11)
+    journal.record('a', START + 2 * HOUR, 12)
+    times, durations, volumes = journal.history(['a', 'b', 'c'])
+    assert list(times[0]) == [np.datetime64(START + HOUR, 's'), np.datetime64(START + 2 * HOUR, 's')]
+    assert list(durations[0]) == [11, 12]
+    assert volumes[1][0] == 100
+    assert np.isnat(times[2]).all()
+
+
+def test_journal_saved(tmp_path):
+    path = tmp_path / 'env.journal.json'
+    journal = WateringJournal(depth=2, path=path)
+    journal.record('a', START, 10)
+    journal.record('a', START + HOUR, 11, 50)
+    journal.record('a', START + 2 * HOUR, 12)
+    journal.record('b', START, None)
+    journal.save()
+    restored = WateringJournal(depth=2, path=path)
+    times, durations, volumes = restored.history(['a', 'b'])
+    assert list(times[0]) == [np.datetime64(START + HOUR, 's'), np.datetime64(START + 2 * HOUR, 's')]
+    assert list(durations[0]) == [11, 12]
+    assert volumes[0][0] == 50 and np.isnan(volumes[0][1])
+    assert times[1][0] == np.datetime64(START, 's') and np.isnan(durations[1][0])
+    # nothing changed since the load, file is not rewritten
+    path.write_text('{}')
+    restored.save()
+    assert path.read_text() == '{}'
+
+
+def test_journal_file_damaged(tmp_path):
+    path = tmp_path / 'env.journal.json'
+    path.write_text('{"a": [["yesterday", 10, null]]}')
+    journal = WateringJournal(path=path)
+    assert np.isnat(journal.history(['a'])[0]).all()
+
+
+def synthetic_history(rates, waterings):
+    sample_times = np.array([np.datetime64(START + i * HOUR, 's') for i in range(48)])
+    hours = np.arange(48)
+    moisture = np.stack([0.8 - rate * (hours % 24) for rate in rates])
+    return sample_times, moisture, np.array(waterings, dtype='datetime64[s]')
+
+
+def test_fit_drying_curves():
+    day = np.datetime64(START + 24 * HOUR, 's')
+    sample_times, moisture, waterings = synthetic_history(
+        [0.01, 0.02, 0.01], [[START, day], [START, day], ['NaT', 'NaT']])
+    moisture[1, ::2] = np.nan
+    slope, intercept, count = fit_drying_curves(sample_times, moisture, waterings)
+    assert slope[:2] * 3600 == pytest.approx([-0.01, -0.02])
+    assert intercept[:2] == pytest.approx([0.8, 0.8])
+    assert list(count) == [48, 24, 0]
+    assert np.isnan(slope[2])
+
+
+def test_tuning_engine():
+    sample_times, moisture, _ = synthetic_history([0.02], [])
+    journal = WateringJournal()
+    journal.record('a', START, 10)
+    journal.record('a', START + 24 * HOUR, 10)
+    plant = types.SimpleNamespace(plantName='a', wateringInterval=24 * HOUR,
+                                  wateringDuration=datetime.timedelta(seconds=10), flowMeter=None, wateringVolume=None)
+    sensors = types.SimpleNamespace(plants=['a'], history=lambda: (sample_times, moisture))
+    environment = types.SimpleNamespace(sensors=sensors, journal=journal, moisture_policy=MoisturePolicy(1),
+                                        plant=lambda name: plant, plants=[plant])
+    proposals = TuningEngine(environment, dry_level=0.4, wet_level=0.9).propose()
+    assert len(proposals) == 1
+    assert proposals[0].wateringInterval == 20 * HOUR
+    assert proposals[0].wateringDuration == datetime.timedelta(seconds=13)
+    TuningEngine(environment).apply(proposals)
+    assert plant.wateringInterval == 20 * HOUR
+
+
+def test_tuning_from_flow():
+    journal = WateringJournal()
+    for (day, (duration, volume)) in enumerate([(20, 100), (25, 100), (20, 110), (10, 50)]):
+        journal.record('metered', START + day * 24 * HOUR, duration, volume)
+    journal.record('timed', START, 10, 50)
+    meter = object()
+    plants = [types.SimpleNamespace(plantName='metered', wateringInterval=24 * HOUR, flowMeter=meter,
+                                    wateringVolume=100, wateringDuration=datetime.timedelta(seconds=60)),
+              types.SimpleNamespace(plantName='timed', wateringInterval=24 * HOUR, flowMeter=meter,
+                                    wateringVolume=None, wateringDuration=datetime.timedelta(seconds=10))]
+    environment = types.SimpleNamespace(sensors=None, journal=journal, plants=plants)
+    assert TuningEngine.can_tune(environment)
+    proposals = TuningEngine(environment).propose()
+    assert len(proposals) == 1
+    # median flow 5 ml/s, limit is twice the time of 100 ml
+    assert proposals[0].plantName == 'metered'
+    assert proposals[0].wateringInterval == 24 * HOUR
+    assert proposals[0].wateringDuration == datetime.timedelta(seconds=40)
+    assert proposals[0].samples == 4
+    assert not TuningEngine.can_tune(types.SimpleNamespace(sensors=None, plants=plants[:0]))
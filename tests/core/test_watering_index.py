@@ -0,0 +1,44 @@
+import datetime
+
+from core.ext.watering_index import WateringIndex
+from .context import create_plant_simple, simple_env_config, TIMEDELTA_LONG, cleanup
+from PlantStation.core import Environment
+
+NOW = datetime.datetime(2020, 6, 1, 12, 0)
+HOUR = datetime.timedelta(hours=1)
+
+
+def test_watering_index():
+    index = WateringIndex()
+    index.update('a', NOW + 2 * HOUR, 'north')
+    index.update('b', NOW, 'south')
+    index.update('c', NOW + HOUR, 'north')
+    index.update('d', NOW, 'north')
+    assert [item for (_, item) in index.next_k(3)] == ['b', 'd', 'c']
+    assert index.next_watering('north') == (NOW, 'd')
+    assert [item for (_, item) in index.between(NOW, NOW + HOUR)] == ['b', 'd']
+    assert [item for (_, item) in index.between(NOW + HOUR, NOW + 3 * HOUR, 'north')] == ['c', 'a']
+    index.update('d', None, 'north')
+    index.update('b', NOW + 3 * HOUR, 'south')
+    assert [item for (_, item) in index.next_k(10)] == ['c', 'a', 'b']
+    index.remove('b')
+    assert index.zones == ['north']
+    assert index.next_watering('south') is None
+    assert len(index) == 2
+
+
+def test_environment_index(simple_env_config):
+    env = Environment(simple_env_config)
+    first = create_plant_simple(simple_env_config, 5, zone='north')
+    second = create_plant_simple(simple_env_config, 6)
+    env.add_plant(first)
+    env.add_plant(second)
+    start = datetime.datetime.min
+    assert env.next_waterings(2) == [(start + TIMEDELTA_LONG, first), (start + TIMEDELTA_LONG, second)]
+    second.wateringInterval = TIMEDELTA_LONG / 2
+    assert env.next_waterings(1) == [(start + TIMEDELTA_LONG / 2, second)]
+    assert env.waterings_between(start, start + TIMEDELTA_LONG, zone='north') == []
+    first.isActive = False
+    assert env.next_waterings(5) == [(start + TIMEDELTA_LONG / 2, second)]
+    second.zone = 'south'
+    assert env.zones == ['south']
@@ -0,0 +1,163 @@
+import configparser
+import datetime
+import json
+import socket
+
+import pytest
+
+from PlantStation.core import parse_time
+from PlantStation.gardener import App
+from PlantStation.gardener.control import ControlServer
+
+PLANTS = (('basil', 'GPIO5', 'kitchen'), ('mint', 'GPIO6', 'kitchen'), ('fern', 'GPIO7', 'hall'))
+
+
+@pytest.fixture()
+def app(tmp_path):
+    lines = ['[GLOBAL]', 'ENV_NAME = home']
+    for (name, pin, zone) in PLANTS:
+        lines += [f'[{name}]', f'plantName = {name}', 'wateringDuration = 10', 'wateringInterval = 01D 00:00:00',
+                  'lastTimeWatered =', f'gpioPinNumber = {pin}', 'isActive = True', f'zone = {zone}']
+    path = tmp_path / 'home.cfg'
+    path.write_text('\n'.join(lines) + '\n')
+    app = App(path, dry_run=True)
+    yield app
+    app.pin_manager.close()
+
+
+@pytest.fixture()
+def server(app, tmp_path):
+    return ControlServer(app, tmp_path / 'control.sock')
+
+
+def plant(app, name):
+    return app.gardener.environment.plant(name)
+
+
+def test_status(server, app):
+    response = server.execute('{"cmd": "status"}')
+    assert response == {'ok': True, 'result': app.status()}
+    assert response['result']['environments'][0]['name'] == 'home'
+
+
+def test_water(server, app):
+    assert server.execute(json.dumps({'cmd': 'water', 'plant': 'basil'})) == {'ok': True, 'result': 'basil queued'}
+    # plant is claimed until the queued watering runs
+    response = server.execute(json.dumps({'cmd': 'water', 'plant': 'basil', 'env': 'home'}))
+    assert response == {'ok': False, 'error': 'basil is already being watered'}
+    assert server.execute(json.dumps({'cmd': 'water', 'plant': 'mint'}))['ok']
+
+
+def test_water_errors(server):
+    assert server.execute('{"cmd": "water"}') == {'ok': False, 'error': 'Plant has to be given (plant)'}
+    assert server.execute('{"cmd": "water", "plant": "cactus"}') == {'ok': False, 'error': 'Unknown plant: cactus'}
+    response = server.execute('{"cmd": "water", "plant": "basil", "env": "office"}')
+    assert response == {'ok': False, 'error': 'Unknown environment: office'}
+
+
+def test_pause_resume_plant(server, app):
+    assert server.execute('{"cmd": "pause", "plant": "fern"}') == {'ok': True, 'result': ['fern']}
+    assert not plant(app, 'fern').isActive
+    assert plant(app, 'basil').isActive
+    assert server.execute('{"cmd": "resume", "plant": "fern"}') == {'ok': True, 'result': ['fern']}
+    assert plant(app, 'fern').isActive
+
+
+def test_pause_resume_zone(server, app):
+    assert server.execute('{"cmd": "pause", "zone": "kitchen"}') == {'ok': True, 'result': ['basil', 'mint']}
+    assert [plant(app, name).isActive for (name, _, _) in PLANTS] == [False, False, True]
+    # paused plants are left out of the schedule
+    schedule = server.execute('{"cmd": "schedule"}')['result']
+    assert [entry['plant'] for entry in schedule] == ['fern']
+    server.execute('{"cmd": "resume", "zone": "kitchen"}')
+    assert all(plant(app, name).isActive for (name, _, _) in PLANTS)
+    assert server.execute('{"cmd": "pause", "zone": "garage"}') == {'ok': False, 'error': 'Unknown zone: garage'}
+
+
+def test_interval(server, app):
+    response = server.execute('{"cmd": "interval", "plant": "mint", "interval": "02D 12:00:00"}')
+    assert response == {'ok': True, 'result': '2D 12:00:00'}
+    assert plant(app, 'mint').wateringInterval.total_seconds() == 60 * 60 * 60
+    response = server.execute('{"cmd": "interval", "plant": "mint", "interval": "cron: 30 6 * * *"}')
+    assert response['ok']
+    rule = plant(app, 'mint').wateringInterval
+    assert str(rule) == response['result']
+    assert rule.next_fire(datetime.datetime(2021, 5, 1, 12)) == datetime.datetime(2021, 5, 2, 6, 30)
+
+
+def test_changes_saved(server, app, tmp_path):
+    server.execute('{"cmd": "pause", "zone": "kitchen"}')
+    server.execute('{"cmd": "interval", "plant": "fern", "interval": "02D 00:00:00"}')
+    saved = configparser.ConfigParser()
+    saved.read(tmp_path / 'home.cfg')
+    assert [saved.getboolean(name, 'isActive') for (name, _, _) in PLANTS] == [False, False, True]
+    assert parse_time(saved['fern']['wateringInterval']) == datetime.timedelta(days=2)
+
+
+def test_interval_errors(server):
+    assert not server.execute('{"cmd": "interval", "plant": "mint"}')['ok']
+    response = server.execute('{"cmd": "interval", "plant": "mint", "interval": "00D 00:00:00"}')
+    assert response == {'ok': False, 'error': 'Interval has to be positive'}
+    assert not server.execute('{"cmd": "interval", "plant": "mint", "interval": "tomorrow"}')['ok']
+
+
+def test_schedule(server):
+    schedule = server.execute('{"cmd": "schedule"}')['result']
+    assert sorted(entry['plant'] for entry in schedule) == ['basil', 'fern', 'mint']
+    assert [entry['time'] for entry in schedule] == sorted(entry['time'] for entry in schedule)
+    assert len(server.execute('{"cmd": "schedule", "limit": 2}')['result']) == 2
+    schedule = server.execute('{"cmd": "schedule", "zone": "hall"}')['result']
+    assert [entry['plant'] for entry in schedule] == ['fern']
+
+
+def test_malformed_and_unknown(server):
+    response = server.execute('{"cmd": ')
+    assert not response['ok'] and response['error'].startswith('Malformed request')
+    for line in ('{"cmd": "dig"}', '["status"]', '{}'):
+        response = server.execute(line)
+        assert not response['ok'] and response['error'].startswith('Unknown command')
+
+
+def test_socket_round_trip(server):
+    server.start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(server.path))
+            stream = client.makefile('rwb')
+            stream.write(b'{"cmd": "pause", "plant": "basil"}\n{"cmd": "status"}\n')
+            stream.flush()
+            assert json.loads(stream.readline()) == {'ok': True, 'result': ['basil']}
+            assert json.loads(stream.readline())['result']['environments'][0]['plants'] == 3
+    finally:
+        server.stop()
+    assert not server.path.exists()
+
+
+def test_live_socket_kept(server, app):
+    server.start()
+    try:
+        with pytest.raises(OSError):
+            ControlServer(app, server.path).start()
+        # first server still answers
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(server.path))
+            client.sendall(b'{"cmd": "status"}\n')
+            assert json.loads(client.makefile('rb').readline())['ok']
+    finally:
+        server.stop()
+
+
+def test_stale_socket_replaced(server):
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(server.path))
+    stale.close()
+    assert server.path.is_socket()
+    server.start()
+    server.stop()
+
+
+def test_other_file_kept(server):
+    server.path.write_text('data')
+    with pytest.raises(OSError):
+        server.start()
+    assert server.path.read_text() == 'data'
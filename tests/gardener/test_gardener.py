@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from PlantStation.gardener import App
+from PlantStation.gardener.tasks import TuneTask
+
+
+def write_config(path, tuning, **options):
+    lines = ['[GLOBAL]', 'ENV_NAME = home', f'tuning = {tuning}',
+             '[basil]', 'plantName = basil', 'wateringDuration = 10', 'wateringInterval = 01D 00:00:00',
+             'lastTimeWatered =', 'gpioPinNumber = GPIO5', 'isActive = True']
+    lines += [f'{key} = {value}' for (key, value) in options.items()]
+    path.write_text('\n'.join(lines) + '\n')
+    return path
+
+
+@pytest.mark.parametrize('tuning, options, scheduled', [
+    ('propose', {'wateringVolume': 100, 'flowMeterPin': 'GPIO6', 'pulsesPerLitre': 450}, True),
+    ('off', {'wateringVolume': 100, 'flowMeterPin': 'GPIO6', 'pulsesPerLitre': 450}, False),
+    ('apply', {}, False),
+])
+def test_tuning_scheduled(tmp_path, tuning, options, scheduled):
+    app = App(write_config(tmp_path / 'home.cfg', tuning, **options), dry_run=True)
+    try:
+        tasks = app.gardener.pool._active_tasks
+        assert any(isinstance(task, TuneTask) for task in tasks) == scheduled
+    finally:
+        app.pin_manager.close()
+
+
+def test_journal_kept_across_restart(tmp_path):
+    path = write_config(tmp_path / 'home.cfg', 'off')
+    app = App(path, dry_run=True)
+    try:
+        environment = app.gardener.environment
+        plant = environment.plant('basil')
+        plant.start_watering()
+        plant.finish_watering()
+        environment.journal.save()
+    finally:
+        app.pin_manager.close()
+    assert (tmp_path / 'home.journal.json').exists()
+    restarted = App(path, dry_run=True)
+    try:
+        times, _, _ = restarted.gardener.environment.journal.history(['basil'])
+        assert (~np.isnat(times)).sum() == 1
+    finally:
+        restarted.pin_manager.close()
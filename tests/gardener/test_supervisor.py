@@ -0,0 +1,135 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from PlantStation.gardener import supervisor
+from PlantStation.gardener.supervisor import Supervisor, config_pins, partition_configs
+
+
+def write_config(directory, name, *plants):
+    """Config with one plant per (pump pin, flow meter pin or None)"""
+    lines = ['[GLOBAL]', f'env_name = {name}']
+    for (index, (pin, meter)) in enumerate(plants):
+        lines += [f'[plant{index}]', f'gpioPinNumber = {pin}']
+        if meter:
+            lines.append(f'flowMeterPin = {meter}')
+    path = directory / f'{name}.cfg'
+    path.write_text('\n'.join(lines) + '\n')
+    return path
+
+
+def crashing_worker(index, paths, pins, dry_run, debug, connection, status_period):
+    connection.send({'worker': index})
+    sys.exit(3)
+
+
+def idle_worker(index, paths, pins, dry_run, debug, connection, status_period):
+    while True:
+        if connection.poll(status_period) and connection.recv() == 'stop':
+            return
+        connection.send({'worker': index, 'pins': pins})
+
+
+def test_config_pins(tmp_path):
+    path = write_config(tmp_path, 'env', ('GPIO5', 'GPIO6'), ('GPIO7', None))
+    assert config_pins(path) == ['GPIO5', 'GPIO6', 'GPIO7']
+
+
+def test_partition_shared_pins(tmp_path):
+    first = write_config(tmp_path, 'first', ('GPIO5', None), ('GPIO6', None))
+    second = write_config(tmp_path, 'second', ('GPIO7', 'GPIO6'))
+    third = write_config(tmp_path, 'third', ('GPIO8', None), ('GPIO7', None))
+    # BOARD29 is GPIO5
+    fourth = write_config(tmp_path, 'fourth', ('BOARD29', None))
+    other = write_config(tmp_path, 'other', ('GPIO9', None))
+    shards = partition_configs([first, second, third, fourth, other], 4)
+    assert len(shards) == 2
+    (configs, pins) = shards[0]
+    assert configs == [first, second, third, fourth]
+    assert sorted(pins) == ['BOARD29', 'GPIO5', 'GPIO6', 'GPIO6', 'GPIO7', 'GPIO7', 'GPIO8']
+    assert shards[1] == ([other], ['GPIO9'])
+
+
+def test_partition_balance(tmp_path):
+    paths = [write_config(tmp_path, f'env{index}', *((f'GPIO{pin}', None) for pin in pins))
+             for (index, pins) in enumerate([(2,), (3, 4), (5, 6, 7), (8, 9)])]
+    shards = partition_configs(paths, 2)
+    # biggest group first, every group goes to the least loaded shard
+    assert [configs for (configs, _) in shards] == [[paths[2], paths[0]], [paths[1], paths[3]]]
+    assert [len(pins) for (_, pins) in shards] == [4, 4]
+    assert len(partition_configs(paths, 1)) == 1
+    assert len(partition_configs(paths, 10)) == 4
+
+
+def run_supervisor(supervisor_):
+    thread = threading.Thread(target=supervisor_.run)
+    thread.start()
+    return thread
+
+
+@pytest.fixture()
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(supervisor, 'BACKOFF_INITIAL', 0.05)
+    monkeypatch.setattr(supervisor, 'BACKOFF_MAX', 0.15)
+
+
+class RecordingSupervisor(Supervisor):
+    """Stops after given number of worker exits, keeps exit codes and backoffs"""
+
+    def __init__(self, *args, exits: int = 3, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.expected = exits
+        self.exits = []
+
+    def _on_exit(self, worker):
+        worker.process.join()
+        code = worker.process.exitcode
+        super()._on_exit(worker)
+        self.exits.append((code, worker.backoff))
+        if len(self.exits) >= self.expected:
+            self.stop()
+
+
+def test_crashed_worker_restarted_with_backoff(tmp_path, fast_backoff):
+    path = write_config(tmp_path, 'env', ('GPIO5', None))
+    supervisor_ = RecordingSupervisor([path], workers=1, dry_run=True, status_period=0.05, target=crashing_worker)
+    thread = run_supervisor(supervisor_)
+    thread.join(60)
+    assert not thread.is_alive()
+    assert supervisor_.exits == [(3, 0.1), (3, 0.15), (3, 0.15)]
+    assert supervisor_.status == {}
+
+
+def test_stable_worker_resets_backoff(tmp_path, fast_backoff, monkeypatch):
+    monkeypatch.setattr(supervisor, 'STABLE_UPTIME', 0.0)
+    path = write_config(tmp_path, 'env', ('GPIO5', None))
+    supervisor_ = RecordingSupervisor([path], workers=1, dry_run=True, status_period=0.05, target=crashing_worker,
+                                      exits=2)
+    thread = run_supervisor(supervisor_)
+    thread.join(60)
+    assert not thread.is_alive()
+    assert supervisor_.exits == [(3, 0.1), (3, 0.1)]
+
+
+def test_status_and_stop(tmp_path):
+    paths = [write_config(tmp_path, 'first', ('GPIO5', None)), write_config(tmp_path, 'second', ('GPIO6', None))]
+    supervisor_ = Supervisor(paths, workers=2, dry_run=True, status_period=0.05, target=idle_worker)
+    assert supervisor_.shards == [[paths[0]], [paths[1]]]
+    thread = run_supervisor(supervisor_)
+    deadline = time.monotonic() + 30
+    while len(supervisor_.status) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert supervisor_.status[0] == {'worker': 0, 'pins': ['GPIO5']}
+    assert supervisor_.status[1] == {'worker': 1, 'pins': ['GPIO6']}
+    processes = [worker.process for worker in supervisor_._workers]
+    supervisor_.stop()
+    thread.join(30)
+    assert not thread.is_alive()
+    assert [process.exitcode for process in processes] == [0, 0]
+
+
+def test_no_configs(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        Supervisor([tmp_path])
@@ -0,0 +1,71 @@
+import datetime
+import filecmp
+
+import pytest
+
+from PlantStation.core import EnvironmentConfig
+from PlantStation.gardener import App
+from PlantStation.simulation.fleet import FleetSpec, generate_fleet, read_history
+
+NOW = datetime.datetime(2026, 3, 1, 12, 0)
+
+
+def test_fleet_is_deterministic(tmp_path):
+    spec = FleetSpec(environments=2, plants=(5, 50), history_days=10)
+    first = list(generate_fleet(tmp_path / 'first', spec, seed=3, now=NOW))
+    second = list(generate_fleet(tmp_path / 'second', spec, seed=3, now=NOW))
+    assert [path.name for path in first] == ['env0000.cfg', 'env0001.cfg']
+    (_, mismatch, errors) = filecmp.cmpfiles(tmp_path / 'first', tmp_path / 'second',
+                                             [path.name for path in (tmp_path / 'first').iterdir()])
+    assert not mismatch and not errors
+    other = next(generate_fleet(tmp_path / 'other', spec, seed=4, now=NOW))
+    assert other.read_text() != first[0].read_text()
+
+
+def test_fleet_configs_parse(tmp_path):
+    spec = FleetSpec(environments=1, plants=(40, 40), history_days=7, inactive=0.0)
+    path = next(generate_fleet(tmp_path, spec, seed=1, now=NOW))
+    env_config = EnvironmentConfig.create_from_file(path, debug=False, dry_run=True)
+    plants = env_config.parse_plants()
+    assert len(plants) == 40
+    assert all(plant['isActive'] for plant in plants)
+
+    last = {}
+    for (time, plant, duration, volume) in read_history(path.with_name('env0000.history.csv')):
+        assert NOW - datetime.timedelta(days=7) <= time < NOW
+        assert duration > 0 and volume is None
+        assert time > last.get(plant, datetime.datetime.min)
+        last[plant] = time
+    # plant's last watering is the last one of its history
+    for plant in plants:
+        assert plant['lastTimeWatered'] == last[plant['plantName']]
+
+
+def test_fleet_spec_validation():
+    with pytest.raises(ValueError):
+        FleetSpec(environments=0)
+    with pytest.raises(ValueError):
+        FleetSpec(plants=(10, 5))
+    with pytest.raises(ValueError):
+        FleetSpec(durations=(0, 10))
+    with pytest.raises(ValueError):
+        FleetSpec(plants=(10, 60))
+    with pytest.raises(ValueError):
+        FleetSpec(plants=(3, 3), pins=('GPIO5', 'GPIO6'))
+    assert FleetSpec(plants=(60, 60), reuse_pins=True).reuse_pins
+
+
+def test_fleet_pins_unique(tmp_path):
+    spec = FleetSpec(environments=2, plants=(52, 52), history_days=0)
+    paths = list(generate_fleet(tmp_path, spec, seed=2, now=NOW))
+    for path in paths:
+        pins = [plant['gpioPinNumber'] for plant in
+                EnvironmentConfig.create_from_file(path, debug=False, dry_run=True).parse_plants()]
+        assert len(set(pins)) == len(pins) == 52
+    # every plant gets its own pump on the mock pin factory
+    app = App([paths[0]], dry_run=True)
+    try:
+        assert len(app.gardener.environment.plants) == 52
+        assert len(app.pin_manager.devices) == 52
+    finally:
+        app.pin_manager.close()
@@ -0,0 +1,100 @@
+import datetime
+import json
+
+from PlantStation.core import environment
+from PlantStation.core.ext import clock, recording
+from PlantStation.core.ext.recording import read_log, Recorder
+from PlantStation.simulation.replay import Replay, compare
+
+START = datetime.datetime(2024, 1, 1, 12, 0)
+
+CONFIG = '''[GLOBAL]
+env_name = small
+ActiveLimit = 1
+workingHours = False
+
+[basil]
+plantName = basil
+wateringDuration = 30
+wateringInterval = 0D 01:00:00
+lastTimeWatered = 2024-01-01 11:00:00
+gpioPinNumber = GPIO2
+isActive = True
+
+[fern]
+plantName = fern
+wateringDuration = 60
+wateringInterval = 0D 02:00:00
+lastTimeWatered = 2024-01-01 10:00:00
+gpioPinNumber = GPIO3
+isActive = True
+'''
+
+
+def _us(moment: datetime.datetime) -> int:
+    return round(moment.timestamp() * 1e6)
+
+
+def _record(path, hours: int = 6, commands: [(datetime.datetime, dict)] = (), config: str = CONFIG):
+    recorder = Recorder(path)
+    recorder.record(recording.START, time=_us(START))
+    recorder.record(recording.SNAPSHOT, 'small', config, time=_us(START))
+    for (moment, command) in commands:
+        recorder.record(recording.COMMAND, subject=json.dumps(command), time=_us(moment))
+    recorder.record(recording.END, time=_us(START + datetime.timedelta(hours=hours)))
+    recorder.close()
+
+
+def _decisions(records):
+    return [(record.kind, record.environment, record.subject, record.time, record.value) for record in records
+            if record.kind not in (recording.START, recording.SNAPSHOT, recording.END)]
+
+
+def test_replay_is_deterministic(tmp_path):
+    _record(tmp_path / 'incident.rec')
+    real_clock = clock.current()
+    runs = []
+    for run in range(2):
+        with Replay(tmp_path / 'incident.rec', output=tmp_path / f'replay{run}.rec') as replay:
+            runs.append(replay.run())
+        assert clock.current() is real_clock
+    assert _decisions(runs[0]) == _decisions(runs[1])
+
+    kinds = [record.kind for record in runs[0]]
+    # basil and fern are due together at 12:00 and 14:00, one of them waits for the pump
+    assert kinds.count(recording.CONFIG_WRITE) == 6 + 3
+    waits = [record.value for record in runs[0] if record.kind == recording.LOCK_ACQUIRE]
+    assert sorted(waits)[-1] in (30 * 10 ** 6, 60 * 10 ** 6)
+
+
+def test_replay_of_replay_matches(tmp_path):
+    _record(tmp_path / 'incident.rec', commands=[(START + datetime.timedelta(minutes=10),
+                                                  {'cmd': 'water', 'plant': 'fern', 'env': 'small'})])
+    with Replay(tmp_path / 'incident.rec', output=tmp_path / 'first.rec') as replay:
+        first = replay.run()
+    with Replay(tmp_path / 'first.rec') as replay:
+        second = replay.run()
+    end = _us(START + datetime.timedelta(hours=6))
+    assert compare(first, second, end) is None
+    assert [record.subject for record in second if record.kind == recording.COMMAND] == \
+           ['{"cmd": "water", "plant": "fern", "env": "small"}']
+
+    # missing decision is reported at its time
+    dropped = [record for record in first if not (record.kind == recording.CONFIG_WRITE and record.time > _us(
+        START + datetime.timedelta(hours=3)))]
+    divergence = compare(dropped, second, end)
+    assert divergence is not None and divergence.recorded is None
+    assert divergence.replayed.kind == recording.CONFIG_WRITE
+    assert divergence.time > _us(START + datetime.timedelta(hours=3))
+
+
+def test_replay_mocks_sensors(tmp_path, monkeypatch):
+    def no_hardware(*args, **kwargs):
+        raise AssertionError('Replay touched the pins')
+
+    monkeypatch.setattr(environment, 'MCP3008Reader', no_hardware)
+    _record(tmp_path / 'incident.rec', config=CONFIG + 'sensorChannel = 0\n')
+    with Replay(tmp_path / 'incident.rec') as replay:
+        assert replay.gardeners[0].environment.sensors is not None
+        records = replay.run()
+    assert [record.kind for record in records].count(recording.CONFIG_WRITE) > 0
@@ -0,0 +1,77 @@
+import datetime
+
+from PlantStation.core import environment
+from PlantStation.core.ext import clock
+from PlantStation.simulation.fleet import FleetSpec, generate_fleet
+from PlantStation.simulation.simulator import Simulator
+
+START = datetime.datetime(2024, 1, 1, 12, 0)
+
+CONFIG = '''[GLOBAL]
+env_name = small
+ActiveLimit = 1
+workingHours = False
+
+[basil]
+plantName = basil
+wateringDuration = 30
+wateringInterval = 1D 00:00:00
+lastTimeWatered = 2024-01-01 06:00:00
+gpioPinNumber = GPIO2
+isActive = True
+
+[fern]
+plantName = fern
+wateringDuration = 60
+wateringInterval = 2D 00:00:00
+lastTimeWatered = 2024-01-01 06:00:00
+gpioPinNumber = GPIO3
+isActive = True
+'''
+
+
+def test_simulation(tmp_path):
+    path = tmp_path / 'small.cfg'
+    path.write_text(CONFIG)
+    real_clock = clock.current()
+    with Simulator(path, start=START) as simulator:
+        assert clock.current() is simulator.clock
+        report = simulator.run(START + datetime.timedelta(days=10))
+    assert clock.current() is real_clock
+    # the original config is never written
+    assert path.read_text() == CONFIG
+
+    assert report['end'] == '2024-01-11 12:00:00'
+    assert report['plants']['basil']['waterings'] == 10
+    assert report['plants']['basil']['on_time_s'] == 300.0
+    assert report['plants']['fern']['waterings'] == 5
+    assert report['waterings'] == 15
+    assert report['peak_concurrency'] == 1
+    # both plants are due at the same time every other day, one waits for the other
+    assert report['daily_window_s']['max'] == 90.0
+    assert max(plant['max_lateness_s'] for plant in report['plants'].values()) >= 30.0
+
+
+def test_simulation_mocks_sensors(tmp_path, monkeypatch):
+    def no_hardware(*args, **kwargs):
+        raise AssertionError('Simulation touched the pins')
+
+    monkeypatch.setattr(environment, 'MCP3008Reader', no_hardware)
+    path = tmp_path / 'small.cfg'
+    path.write_text(CONFIG + 'sensorChannel = 0\n')
+    with Simulator(path, start=START) as simulator:
+        assert simulator.environment.sensors is not None
+        report = simulator.run(START + datetime.timedelta(days=4))
+    assert report['plants']['basil']['waterings'] == 4
+
+
+def test_simulation_respects_pump_limit(tmp_path):
+    spec = FleetSpec(plants=(60, 60), intervals=(('1D 00:00:00', 1),), active_limit=(2, 2), working_hours=0.0,
+                     blackout=0.0, inactive=0.0, history_days=0, reuse_pins=True)
+    path = next(generate_fleet(tmp_path, spec, seed=5, now=START))
+    with Simulator(path, start=START) as simulator:
+        report = simulator.run(START + datetime.timedelta(days=3))
+    # never watered plants are all due at start, the queue keeps both pumps busy
+    assert report['peak_concurrency'] == 2
+    assert report['waterings'] == 180
+    assert report['waiting'] == 0